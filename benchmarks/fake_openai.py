@@ -0,0 +1,315 @@
+"""
+A local OpenAI-compatible stub server for offline benchmarks.
+
+The server implements just enough of `/v1/chat/completions` and `/v1/embeddings`
+for gpt_scientist to run against it: responses are valid JSON objects with the requested output fields,
+latency is drawn from a configurable distribution, and a configurable fraction of requests
+fails with a 500 or a 429 (rate limit) error. A configurable fraction of completions is prose instead of JSON.
+Completions are streamed (as server-sent events, one chunk per token) when the request asks for it.
+
+Run standalone with:
+    python benchmarks/fake_openai.py --port 8000 --latency lognormal:-3,0.5 --rate-limit-rate 0.05
+and point the client at it with OPENAI_BASE_URL=http://127.0.0.1:8000/v1.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Pattern of the format suffix that gpt_scientist adds to prompts when structured outputs are off
+FIELDS_PATTERN = re.compile(r'Return exactly one json object with the following fields: (?P<fields>.*)\.\s*$')
+
+# A field in the format suffix, possibly with a type description, e.g. 'score (integer)' or 'mood (one of: a, b)'
+FIELD_PATTERN = re.compile(r'(?P<name>[^,(]+?)(?: \((?P<type>[^)]*)\))?(?:, |$)')
+
+# Type descriptions in the format suffix, and the corresponding JSON schema types
+DESCRIBED_TYPES = {'integer': 'integer', 'number': 'number', 'true or false': 'boolean', 'list of strings': 'array'}
+
+EMBEDDING_DIMENSIONS = 64
+
+CHARS_PER_TOKEN = 4
+
+# Content of invalid completions (cut to the number of completion tokens)
+INVALID_CONTENT = "Sure! Let me think about this step by step before giving the answer. " * 100
+
+
+def parse_latency(spec: str):
+    """
+    Parse a latency distribution spec into a function returning a delay in seconds.
+    Supported specs: 'fixed:S', 'uniform:A,B', 'exp:MEAN', 'lognormal:MU,SIGMA'.
+    """
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',')] if params else []
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubConfig:
+    """Behavior of the stub server."""
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 completion_tokens: int = 20, seed: int = 0, invalid_rate: float = 0.0, token_latency: float = 0.0,
+                 prompt_token_latency: float = 0.0, keep_messages: bool = False):
+        self.latency = parse_latency(latency)
+        self.latency_spec = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.completion_tokens = completion_tokens
+        self.invalid_rate = invalid_rate  # Fraction of completions that are not JSON
+        self.token_latency = token_latency  # Delay (in seconds) between streamed tokens
+        self.prompt_token_latency = prompt_token_latency  # Extra delay (in seconds) per prompt token, as for long inputs
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.models: Counter = Counter()  # (API path, model) -> number of requests
+        self.keep_messages = keep_messages
+        self.messages: list[list[dict]] = []  # Messages of every chat completion request (if keep_messages is set)
+
+    def record(self, path: str, body: dict):
+        """Record which model a request to `path` asked for (and its messages, if they are kept)."""
+        with self.lock:
+            self.models[(path.rsplit('/v1', 1)[-1], body.get('model'))] += 1
+            if self.keep_messages and 'messages' in body:
+                self.messages.append(body['messages'])
+
+    def draw(self) -> tuple[float, int]:
+        """Draw the latency and the HTTP status of the next request."""
+        with self.lock:
+            self.requests += 1
+            delay = self.latency()
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                return delay, 429
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return delay, 500
+            return delay, 200
+
+
+def output_fields(body: dict) -> dict[str, dict]:
+    """Figure out which fields (and of which JSON schema types) the client expects in the response."""
+    response_format = body.get('response_format') or {}
+    if response_format.get('type') == 'json_schema':
+        return dict(response_format['json_schema']['schema'].get('properties', {}))
+    match = FIELDS_PATTERN.search(body['messages'][-1]['content'])
+    if match:
+        fields = {}
+        for field in FIELD_PATTERN.finditer(match.group('fields')):
+            description = field.group('type') or ''
+            if description.startswith('one of: '):
+                fields[field.group('name')] = {'enum': description[len('one of: '):].split(', ')}
+            else:
+                fields[field.group('name')] = {'type': DESCRIBED_TYPES.get(description, 'string')}
+        return fields
+    return {'gpt_output': {'type': 'string'}}
+
+
+def field_value(field: str, schema: dict, rng: random.Random):
+    """A random value of the given JSON schema type."""
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+    kind = schema.get('type')
+    if kind == 'integer':
+        return rng.randint(1, 5)
+    if kind == 'number':
+        return rng.random()
+    if kind == 'boolean':
+        return rng.random() < 0.5
+    if kind == 'array':
+        return [f'{field} item {k}' for k in range(rng.randint(1, 3))]
+    return f'{field} value {rng.randint(1, 5)}'
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def chat_completion(body: dict, config: StubConfig) -> dict:
+    fields = output_fields(body)
+    prompt_tokens = sum(count_tokens(str(m.get('content', ''))) for m in body['messages'])
+    n = body.get('n') or 1
+    choices = []
+    for k in range(n):
+        if config.random.random() < config.invalid_rate:
+            content = INVALID_CONTENT[:CHARS_PER_TOKEN * config.completion_tokens]
+        else:
+            content = json.dumps({field: field_value(field, schema, config.random) for field, schema in fields.items()})
+        choices.append({
+            'index': k,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content, 'refusal': None},
+        })
+    return {
+        'id': f'chatcmpl-{config.requests}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'stub'),
+        'choices': choices,
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': config.completion_tokens * n,
+            'total_tokens': prompt_tokens + config.completion_tokens * n,
+        },
+    }
+
+
+def completion_chunks(completion: dict):
+    """Split a chat completion into the chunks of a stream: one token of every choice at a time, then the usage."""
+    contents = [choice['message']['content'] for choice in completion['choices']]
+    longest = max((len(content) for content in contents), default=0)
+    base = {key: completion[key] for key in ('id', 'created', 'model')}
+    for start in range(0, longest, CHARS_PER_TOKEN):
+        choices = [{'index': k, 'delta': {'content': content[start:start + CHARS_PER_TOKEN]}, 'finish_reason': None}
+                   for k, content in enumerate(contents) if start < len(content)]
+        yield {**base, 'object': 'chat.completion.chunk', 'choices': choices}
+    yield {**base, 'object': 'chat.completion.chunk',
+           'choices': [{'index': k, 'delta': {}, 'finish_reason': 'stop'} for k in range(len(contents))]}
+    yield {**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': completion['usage']}
+
+
+def embedding(body: dict) -> dict:
+    inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+    data = []
+    for k, text in enumerate(inputs):
+        rng = random.Random(hash(text))
+        vector = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+        norm = sum(v * v for v in vector) ** 0.5
+        data.append({'object': 'embedding', 'index': k, 'embedding': [v / norm for v in vector]})
+    tokens = sum(count_tokens(str(text)) for text in inputs)
+    return {
+        'object': 'list',
+        'model': body.get('model', 'stub'),
+        'data': data,
+        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+    }
+
+
+def make_handler(config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload: dict, headers: dict = {}):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, completion: dict):
+            """Send a completion as server-sent events, with `token_latency` between chunks."""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            events = [f'data: {json.dumps(chunk)}\n\n' for chunk in completion_chunks(completion)] + ['data: [DONE]\n\n']
+            try:
+                for event in events:
+                    data = event.encode()
+                    self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                    self.wfile.flush()
+                    time.sleep(config.token_latency)
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # The client abandoned the stream
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            config.record(self.path, body)
+            delay, status = config.draw()
+            prompt_tokens = sum(count_tokens(str(m.get('content', ''))) for m in body.get('messages', []))
+            time.sleep(delay + prompt_tokens * config.prompt_token_latency)
+            if status == 429:
+                self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                           {'retry-after-ms': '10'})
+            elif status != 200:
+                self._send(status, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+            elif self.path.endswith('/chat/completions') and body.get('stream'):
+                self._stream(chat_completion(body, config))
+            elif self.path.endswith('/chat/completions'):
+                self._send(200, chat_completion(body, config))
+            elif self.path.endswith('/embeddings'):
+                self._send(200, embedding(body))
+            else:
+                self._send(404, {'error': {'message': f'Unknown endpoint {self.path}'}})
+
+    return Handler
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    # Room for the burst of connections that all workers open at the start of a job (the default is 5,
+    # which makes connections fail when the client is faster at opening them than the server at accepting them)
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubServer:
+    """The stub server running in a background thread; use as a context manager."""
+
+    def __init__(self, config: StubConfig, host: str = '127.0.0.1', port: int = 0):
+        self.config = config
+        self.httpd = StubHTTPServer((host, port), make_handler(config))
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', default='fixed:0', help="Latency distribution, e.g. 'fixed:0.1', 'lognormal:-3,0.5'")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests that fail with a 429')
+    parser.add_argument('--completion-tokens', type=int, default=20, help='Output tokens reported per completion')
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help='Fraction of completions that are not JSON')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='Delay in seconds between streamed tokens')
+    parser.add_argument('--prompt-token-latency', type=float, default=0.0, help='Extra delay in seconds per prompt token')
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.error_rate, args.rate_limit_rate, args.completion_tokens,
+                        invalid_rate=args.invalid_rate, token_latency=args.token_latency,
+                        prompt_token_latency=args.prompt_token_latency)
+    with StubServer(config, args.host, args.port) as server:
+        print(f'Serving at {server.base_url}')
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Offline benchmarks for gpt_scientist.
+
+Runs `analyze_csv`, similarity mode and `check_quotes_csv` against a local OpenAI-compatible stub
+(see fake_openai.py) for several dataset sizes and `parallel_rows` settings,
+and reports throughput (rows/sec), CPU time per row and peak RSS as JSON.
+Every scenario runs in a fresh process, so that CPU time and peak RSS are not polluted by other scenarios
+or by the stub server itself.
+
+Examples:
+    python benchmarks/run.py --sizes 1000,10000 --parallel 10,100 --output bench.json
+    python benchmarks/run.py --latency lognormal:-3,0.5 --rate-limit-rate 0.02
+    python benchmarks/run.py --compare bench.json --tolerance 0.15  # exit code 1 on regression
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from fake_openai import StubConfig, StubServer  # noqa: E402
+
+SCENARIOS = ('analyze', 'similarity', 'quotes')
+
+WORDS = ('good', 'bad', 'service', 'delivery', 'price', 'quality', 'great', 'awful', 'would', 'buy',
+         'again', 'never', 'product', 'arrived', 'late', 'broken', 'love', 'it', 'the', 'was')
+
+
+def make_dataset(path: str, rows: int, words_per_row: int, seed: int = 0):
+    """Write a synthetic review dataset to `path`."""
+    import pandas as pd
+    rng = random.Random(seed)
+    texts = [' '.join(rng.choice(WORDS) for _ in range(words_per_row)) for _ in range(rows)]
+    # Quotes for the check_quotes scenario: half exact, half slightly corrupted
+    quotes = [f'"{t[:30]}"' if k % 2 == 0 else f'"{t[:30].replace("e", "a", 1)}"' for k, t in enumerate(texts)]
+    pd.DataFrame({'review_text': texts, 'quote': quotes}).to_csv(path, index=False)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process in megabytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_scenario(scenario: str, rows: int, parallel_rows: int, words_per_row: int, base_url: str) -> dict:
+    """Run one scenario in the current process and return its measurements."""
+    os.environ['OPENAI_BASE_URL'] = base_url
+    from gpt_scientist import Scientist
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data.csv')
+        make_dataset(path, rows, words_per_row)
+
+        sc = Scientist(api_key='stub')
+        sc.set_parallel_rows(parallel_rows)
+        sc.set_report_interval(0)
+        sc.set_num_retries(3)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if scenario == 'analyze':
+            sc.analyze_csv(path, 'Rate the review.', input_fields=['review_text'], output_fields=['sentiment', 'summary'])
+        elif scenario == 'similarity':
+            sc.analyze_csv(path, similarity_queries=['great product', 'late delivery'],
+                           input_fields=['review_text'], output_fields=['similarity'])
+        else:
+            sc.check_quotes_csv(path, output_field='quote', input_fields=['review_text'])
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+    result = {
+        'scenario': scenario,
+        'rows': rows,
+        'parallel_rows': parallel_rows,
+        'wall_seconds': wall,
+        'rows_per_second': rows / wall if wall > 0 else 0.0,
+        'cpu_ms_per_row': 1000 * cpu / rows,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if scenario != 'quotes':
+        snapshot = sc.stats.snapshot()
+        result['errors'] = snapshot['errors']
+        result['retries'] = snapshot['retries']
+        result['api_latency_mean'] = snapshot['latency']['api']['mean']
+        result['connections_opened'] = snapshot['connections']['connections_opened']
+        result['connection_reuse_ratio'] = snapshot['connections']['reuse_ratio']
+    return result
+
+
+def _child(queue, *args):
+    try:
+        queue.put(run_scenario(*args))
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+
+def run_isolated(*args) -> dict:
+    """Run a scenario in a fresh process."""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_child, args=(queue, *args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """Return a description of every scenario that regressed by more than `tolerance` relative to the baseline."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(r):
+        return (r['scenario'], r['rows'], r['parallel_rows'])
+    previous = {key(r): r for r in baseline['results'] if 'error' not in r}
+
+    regressions = []
+    for r in results:
+        old = previous.get(key(r))
+        if old is None or 'error' in r:
+            continue
+        if r['rows_per_second'] < old['rows_per_second'] * (1 - tolerance):
+            regressions.append(f"{key(r)}: rows/sec {old['rows_per_second']:.1f} -> {r['rows_per_second']:.1f}")
+        if r['cpu_ms_per_row'] > old['cpu_ms_per_row'] * (1 + tolerance):
+            regressions.append(f"{key(r)}: CPU ms/row {old['cpu_ms_per_row']:.3f} -> {r['cpu_ms_per_row']:.3f}")
+        if r['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{key(r)}: peak RSS MB {old['peak_rss_mb']:.1f} -> {r['peak_rss_mb']:.1f}")
+    return regressions
+
+
+def versions() -> dict:
+    from importlib.metadata import version, PackageNotFoundError
+    result = {'python': platform.python_version(), 'platform': platform.platform()}
+    for package in ('gpt_scientist', 'openai', 'pandas', 'pydantic'):
+        try:
+            result[package] = version(package)
+        except PackageNotFoundError:
+            result[package] = None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--sizes', default='100,1000', help='Comma-separated numbers of rows')
+    parser.add_argument('--parallel', default='10,100', help='Comma-separated parallel_rows settings')
+    parser.add_argument('--words-per-row', type=int, default=50, help='Length of the synthetic input texts')
+    parser.add_argument('--latency', default='fixed:0', help="Stub latency distribution, e.g. 'fixed:0.05', 'lognormal:-3,0.5'")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests that fail with a 429')
+    parser.add_argument('--completion-tokens', type=int, default=20, help='Output tokens reported per completion')
+    parser.add_argument('--output', help='Write results to this JSON file (default: stdout)')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative regression when comparing')
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    sizes = [int(s) for s in args.sizes.split(',')]
+    parallel = [int(p) for p in args.parallel.split(',')]
+
+    config = StubConfig(args.latency, args.error_rate, args.rate_limit_rate, args.completion_tokens)
+    results = []
+    with StubServer(config) as server:
+        for scenario in scenarios:
+            # check_quotes does not use the model, so parallelism is irrelevant
+            for parallel_rows in (parallel if scenario != 'quotes' else parallel[:1]):
+                for rows in sizes:
+                    result = run_isolated(scenario, rows, parallel_rows, args.words_per_row, server.base_url)
+                    result.setdefault('scenario', scenario)
+                    result.setdefault('rows', rows)
+                    result.setdefault('parallel_rows', parallel_rows)
+                    print(json.dumps(result), file=sys.stderr)
+                    results.append(result)
+
+    report = {
+        'versions': versions(),
+        'stub': {
+            'latency': args.latency,
+            'error_rate': args.error_rate,
+            'rate_limit_rate': args.rate_limit_rate,
+            'completion_tokens': args.completion_tokens,
+            'requests': config.requests,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Startup benchmark for gpt_scientist.
+
+Measures, in fresh interpreters, how long it takes to `import gpt_scientist`, to construct a `Scientist`
+and to load its pricing table, and which heavy modules have been imported by then
+(they should only be imported on first use).
+Runs in offline mode with an empty pricing cache, so the network is never contacted.
+
+Examples:
+    python benchmarks/startup.py --repeat 20 --output startup.json
+    python benchmarks/startup.py --compare startup.json --tolerance 0.25  # exit code 1 on regression
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC = str(Path(__file__).resolve().parent.parent / 'src')
+
+# Modules that should not be imported by `import gpt_scientist` or `Scientist()`
+HEAVY_MODULES = ('pandas', 'numpy', 'openai', 'pydantic', 'requests', 'fuzzysearch', 'tiktoken', 'gspread', 'google.colab')
+
+# Code run in the fresh interpreter; prints the measurements as JSON
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import gpt_scientist
+imported = time.perf_counter()
+sc = gpt_scientist.Scientist(api_key='x')
+constructed = time.perf_counter()
+sc.pricing
+priced = time.perf_counter()
+print(json.dumps({{
+    'import_seconds': imported - start,
+    'construct_seconds': constructed - imported,
+    'pricing_seconds': priced - constructed,
+    'heavy_modules': [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_once(cache_dir: str) -> dict:
+    """Run the probe in a fresh interpreter."""
+    env = dict(os.environ, PYTHONPATH=SRC, XDG_CACHE_HOME=cache_dir, GPT_SCIENTIST_OFFLINE='1')
+    out = subprocess.run([sys.executable, '-c', PROBE], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='Number of fresh interpreters to measure')
+    parser.add_argument('--output', help='Write results to this JSON file (default: stdout)')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression when comparing')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        measure_once(cache_dir)  # Warm up the bytecode cache
+        runs = [measure_once(cache_dir) for _ in range(args.repeat)]
+
+    report = {
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'import_seconds': statistics.median(r['import_seconds'] for r in runs),
+        'construct_seconds': statistics.median(r['construct_seconds'] for r in runs),
+        'pricing_seconds': statistics.median(r['pricing_seconds'] for r in runs),
+        'heavy_modules': sorted({m for r in runs for m in r['heavy_modules']}),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = []
+        for key in ('import_seconds', 'construct_seconds', 'pricing_seconds'):
+            if report[key] > baseline[key] * (1 + args.tolerance):
+                regressions.append(f"{key}: {baseline[key]:.4f} -> {report[key]:.4f}")
+        for module in set(report['heavy_modules']) - set(baseline['heavy_modules']):
+            regressions.append(f"{module} is now imported at startup")
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,8 @@ __email__ = 'nadia.polikarpova@gmail.com'
 __version__ = '0.1.0'
 
 from .scientist import Scientist
-from .stats import JobStats
+from .stats import JobStats, JobEstimate
+from .jobs import Job, set_request_limit
+from .tracing import Tracer, ChromeTraceExporter, SpanTracer, OpenTelemetryExporter
 
-__all__ = ['Scientist', 'JobStats']
+__all__ = ['Scientist', 'JobStats', 'JobEstimate', 'Job', 'set_request_limit', 'Tracer', 'ChromeTraceExporter', 'SpanTracer', 'OpenTelemetryExporter']
@@ -2,18 +2,30 @@
 
 import json
 import logging
+import os
 import re
-import requests
+import time
 import importlib.resources
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
 # Github URL for the default pricing table
 PRICING_URL = "https://raw.githubusercontent.com/nadia-polikarpova/gpt-scientist/main/src/gpt_scientist/model_pricing.json"
 
+# Where the pricing table fetched from Github is cached, and for how long (in seconds) it is used without refetching
+PRICING_CACHE_DIR = os.path.join(os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'gpt_scientist')
+PRICING_CACHE_TTL = 24 * 60 * 60
+
+# Set this environment variable (to anything but '' or '0') to never access the network for the pricing table
+OFFLINE_ENV_VAR = 'GPT_SCIENTIST_OFFLINE'
+
 # Index of the first non-header row in google-sheet indexing
 GSHEET_FIRST_ROW = 2
 
+# Number of the first non-header line of a CSV file (as a spreadsheet numbers it)
+CSV_FIRST_ROW = 2
+
 # Regular expression pattern for Google doc URL
 GOOGLE_DOC_URL_PATTERN = re.compile(r'https://docs.google.com/document/d/(?P<doc_id>[^/]+)/.*')
 
@@ -23,20 +35,75 @@ DEFAULT_MODEL = 'gpt-4o-mini'
 # Default embedding model
 DEFAULT_EMBEDDING_MODEL = 'text-embedding-3-small'
 
+# Default name of the column that marks rows whose results were inherited from a near-duplicate
+INHERITED_FIELD = 'gpt_inherited_from'
+
+# Default number of tokens shared by consecutive chunks of long inputs
+CHUNK_OVERLAP = 100
+
 
-def fetch_pricing() -> dict:
+def is_offline() -> bool:
+    """Return True if offline mode is requested through the environment."""
+    return os.getenv(OFFLINE_ENV_VAR, '') not in ('', '0')
+
+
+def pricing_cache_path() -> str:
+    return os.path.join(PRICING_CACHE_DIR, 'model_pricing.json')
+
+
+def read_cached_pricing() -> tuple[Optional[dict], float]:
+    """Return the cached pricing table and its age in seconds, or None if there is no valid cache."""
+    path = pricing_cache_path()
+    try:
+        with open(path, 'r') as f:
+            pricing = json.load(f)
+        return pricing, time.time() - os.path.getmtime(path)
+    except (OSError, json.JSONDecodeError):
+        return None, 0.0
+
+
+def write_cached_pricing(pricing: dict):
+    """Save the pricing table to the cache (atomically, so that concurrent processes never see a partial file)."""
+    path = pricing_cache_path()
+    try:
+        os.makedirs(PRICING_CACHE_DIR, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(pricing, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.debug(f"Could not cache the pricing table: {e}")
+
+
+def fetch_pricing(offline: bool = False, cache_ttl: float = PRICING_CACHE_TTL) -> dict:
     """
-    Fetch the pricing table from GitHub or fall back to the local file.
+    Load the pricing table: from the on-disk cache if it is younger than `cache_ttl` seconds,
+    otherwise from GitHub (refreshing the cache), or else from the stale cache or the local file.
+    In `offline` mode (or if the GPT_SCIENTIST_OFFLINE environment variable is set), GitHub is never contacted.
     Returns a dictionary mapping model names to pricing info.
     """
-    try:
-        # Try to fetch the pricing table from github
-        resp = requests.get(PRICING_URL, timeout=2)
-        if resp.ok:
-            logger.info(f"Fetched pricing table from {PRICING_URL}")
-            return resp.json()
-    except requests.RequestException:
-        pass
+    offline = offline or is_offline()
+    cached, age = read_cached_pricing()
+    if cached is not None and (offline or age < cache_ttl):
+        logger.info("Loaded pricing table from the cache.")
+        return cached
+
+    if not offline:
+        import requests  # Only needed here, and slow to import
+        try:
+            # Try to fetch the pricing table from github
+            resp = requests.get(PRICING_URL, timeout=2)
+            if resp.ok:
+                logger.info(f"Fetched pricing table from {PRICING_URL}")
+                pricing = resp.json()
+                write_cached_pricing(pricing)
+                return pricing
+        except (requests.RequestException, ValueError):
+            pass
+
+    if cached is not None:
+        logger.info("Loaded pricing table from the (outdated) cache.")
+        return cached
 
     # Otherwise: read the pricing table from the local file
     try:
@@ -0,0 +1,167 @@
+"""Jobs running in the background: on an event loop in a separate thread, so that the caller (e.g. a notebook) is not blocked."""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, TypeVar
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+    from gpt_scientist.processors.results import ResultBatch
+    from gpt_scientist.stats import JobStats
+
+T = TypeVar("T")
+
+# The background job that the current task belongs to (None outside of background jobs)
+current_job: contextvars.ContextVar[Optional['Job']] = contextvars.ContextVar('current_job', default=None)
+
+
+class BackgroundLoop:
+    """
+    An event loop running in a daemon thread, started on first use.
+    All background jobs in the process run on it, and share the limit on requests in flight (see `set_request_limit`).
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.max_requests: Optional[int] = None
+        self.limiter: Optional[asyncio.Semaphore] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='gpt_scientist', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def in_loop(self) -> bool:
+        """Whether the caller runs in the thread of the loop (where blocking on a job would deadlock)."""
+        return self._thread is threading.current_thread()
+
+    def set_request_limit(self, max_requests: Optional[int]):
+        """Limit the number of requests in flight across all jobs started from now on (None: only `parallel_rows` per job)."""
+        if max_requests is not None and max_requests < 1:
+            raise ValueError("The request limit must be positive.")
+        self.max_requests = max_requests
+        self.limiter = asyncio.Semaphore(max_requests) if max_requests is not None else None
+
+    def submit(self, coro: Awaitable[T], job: Optional['Job'] = None) -> concurrent.futures.Future:
+        """Start `coro` on the loop (as part of `job`, if given) and return a future of its result."""
+        async def run():
+            current_job.set(job)
+            return await coro
+        return asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+    def call(self, function: Callable[[], T]) -> T:
+        """Call `function` in the thread of the loop (to read state that the jobs modify) and return its result."""
+        if self._loop is None or self.in_loop():
+            return function()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(function())
+            except Exception as e:
+                future.set_exception(e)
+        self._loop.call_soon_threadsafe(run)
+        return future.result()
+
+
+background = BackgroundLoop()
+
+
+def set_request_limit(max_requests: Optional[int]):
+    """
+    Limit the number of requests in flight across all background jobs (e.g. to the rate limits of an API key
+    shared by several jobs), in addition to `parallel_rows` of each job. Applies to jobs started from now on.
+    """
+    background.set_request_limit(max_requests)
+
+
+class Job:
+    """
+    Handle of a job running in the background (see `Scientist.submit`).
+    `progress()` reports its current metrics, `results()` the results saved so far,
+    `wait()` blocks until it finishes and returns its result, and `cancel()` stops it
+    (results saved before that are kept, like when a job is interrupted).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stats: Optional['JobStats'] = None  # Set when the job starts
+        self.limiter = background.limiter
+        self._batches: list['ResultBatch'] = []
+        self._future: Optional[concurrent.futures.Future] = None
+
+    def start(self, coro: Awaitable[Any]) -> 'Job':
+        """Run `coro` on the background loop as this job."""
+        self._future = background.submit(coro, self)
+        return self
+
+    def add_results(self, batch: 'ResultBatch'):
+        """Record a batch of results saved by the job (called by its writer)."""
+        self._batches.append(batch)
+
+    def done(self) -> bool:
+        """Whether the job has finished (or failed, or was cancelled)."""
+        return self._future is not None and self._future.done()
+
+    def cancelled(self) -> bool:
+        return self._future is not None and self._future.cancelled()
+
+    def progress(self) -> dict:
+        """The current metrics of the job (see `JobStats.snapshot`; empty until it starts)."""
+        if self.stats is None:
+            return {}
+        stats = self.stats
+        return stats.snapshot() if self.done() else background.call(stats.snapshot)
+
+    def results(self) -> 'DataFrame':
+        """The results saved so far, as a dataframe of the output fields indexed by row position."""
+        import pandas as pd
+        batches = list(self._batches)
+        if not batches:
+            return pd.DataFrame()
+        results = pd.concat([batch.to_frame() for batch in batches])
+        if results.index.has_duplicates:
+            # A multi-task job saves the fields of every task in separate batches
+            results = results.groupby(level=0).first()
+        return results.sort_index()
+
+    def cancel(self) -> bool:
+        """Stop the job; return False if it has already finished."""
+        assert self._future is not None
+        return self._future.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """
+        Block until the job finishes and return its result (raising its exception if it failed).
+        Raise TimeoutError if it is still running after `timeout` seconds.
+        """
+        assert self._future is not None
+        return self._future.result(timeout)
+
+    def exception(self) -> Optional[BaseException]:
+        """The exception the job failed with (None if it is running or succeeded)."""
+        if not self.done() or self.cancelled():
+            return None
+        assert self._future is not None
+        return self._future.exception()
+
+    def __repr__(self):
+        if self.cancelled():
+            state = 'cancelled'
+        elif self.done():
+            state = 'failed' if self.exception() is not None else 'done'
+        else:
+            state = 'running'
+        progress = ''
+        if self.stats is not None:
+            total = f"/{self.stats.rows_total}" if self.stats.rows_total else ''
+            progress = f", {self.stats.rows_processed}{total} rows"
+        return f"<Job {self.name}: {state}{progress}>"
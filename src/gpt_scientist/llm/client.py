@@ -1,19 +1,40 @@
 """OpenAI client wrapper for LLM interactions."""
 
+import asyncio
 import json
 import logging
-from typing import Optional
-from pydantic import create_model
+import random
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Optional
+import openai
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
+from gpt_scientist.llm.router import RETRYABLE_STATUSES, Router, retry_after_seconds
+from gpt_scientist.llm.schema import OutputType, python_type
+from gpt_scientist.llm.streaming import ResponseCheck
+from gpt_scientist.llm.tokens import count_message_tokens
+from gpt_scientist.stats import JobStats
+from gpt_scientist.tracing import Tracer
 
 logger = logging.getLogger(__name__)
 
+# Delay (in seconds) before retrying a request the server could not handle (e.g. rate limited):
+# doubles with every attempt, up to the maximum, unless the server asks for a different one
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
 
 class LLMClient:
-    """Wrapper for OpenAI async client with response parsing."""
+    """
+    Wrapper for OpenAI async client with response parsing.
+    `async_client` is an OpenAI client, or a Router that spreads requests over several endpoints.
+    """
 
     def __init__(self, async_client, model: str, system_prompt: str, use_structured_outputs: bool,
                  num_results: int, num_retries: int, model_params: dict, pricing: dict):
         self._client = async_client
+        self.router = async_client if isinstance(async_client, Router) else None
         self.model = model
         self.system_prompt = system_prompt
         self.use_structured_outputs = use_structured_outputs
@@ -22,28 +43,235 @@ class LLMClient:
         self.model_params = model_params
         self.pricing = pricing
         self.examples = []
+        self.output_types: dict[str, OutputType] = {}
+        self._validators: dict[str, TypeAdapter] = {}  # Field -> validator of its type (for typed fields)
+        self._response_models: dict[tuple[str, ...], type[BaseModel]] = {}  # Output fields -> response model
+        self.stats: Optional[JobStats] = None
+        self.tracer: Optional[Tracer] = None
+        self.cascade: list[str] = []  # Cheaper models tried before `model`, in order
+        self.min_logprob: Optional[float] = None
+        self.min_agreement: Optional[float] = None
+        self._missing_logprobs_reported = False
+        self.streaming = False
+        self.limiter: Optional[asyncio.Semaphore] = None  # Shared by the jobs whose requests it limits (see `set_request_limit`)
+
+    def set_streaming(self, streaming: bool):
+        """
+        Stream completions and check them as they arrive (see `ResponseCheck`), abandoning a request
+        as soon as none of its completions can be valid. Only used without structured outputs,
+        whose responses always match the schema.
+        """
+        self.streaming = streaming
+
+    def set_cascade(self, models: list[str], min_logprob: Optional[float] = None, min_agreement: Optional[float] = None):
+        """
+        Try `models` (in order) before the main model, escalating to the next one when the response is invalid
+        or not confident enough: the average log-probability of its tokens is below `min_logprob`,
+        or less than a `min_agreement` fraction of the `num_results` completions agree with it.
+        If the API returns no log-probabilities, the confidence is unknown, and the response is escalated.
+        The main model is only checked for validity.
+        """
+        self.cascade = list(models)
+        self.min_logprob = min_logprob
+        self.min_agreement = min_agreement
 
     def set_examples(self, examples: list[dict]):
         """Set few-shot examples for the model."""
         self.examples = examples
 
-    async def prompt_model(self, prompt: str, output_fields: list[str]) -> dict:
-        """Send the prompt to the model and return the completions."""
+    def set_output_types(self, output_types: dict[str, OutputType]):
+        """
+        Set the types of the output fields (fields that are not listed are strings).
+        Validators and response models for these types are built once and reused for every request.
+        """
+        if output_types == self.output_types:
+            return
+        self.output_types = dict(output_types)
+        self._validators = {field: TypeAdapter(python_type(t)) for field, t in self.output_types.items()}
+        self._response_models = {}
+
+    def response_model(self, output_fields: list[str]) -> type[BaseModel]:
+        """The (cached) pydantic model of a response with `output_fields`, used for structured outputs."""
+        key = tuple(output_fields)
+        model = self._response_models.get(key)
+        if model is None:
+            model = create_model("Response", **{field: (python_type(self.output_types.get(field, 'str')), ...)
+                                                for field in output_fields})
+            self._response_models[key] = model
+        return model
+
+    def set_stats(self, stats: JobStats):
+        """Set the job statistics where request latency, retries and in-flight requests are recorded."""
+        self.stats = stats
+
+    def set_tracer(self, tracer: Optional[Tracer]):
+        """Set the tracer that receives request, retry and parse events (None disables tracing)."""
+        self.tracer = tracer
+
+    async def send(self, call: Callable[[Any], Callable[..., Awaitable[Any]]], model: str,
+                   consume: Optional[Callable[[Any, str], Awaitable[Any]]] = None, main_model: bool = False, **kwargs):
+        """
+        Send a request with `call(client)(model=model, **kwargs)`, where `call` selects the API method of a client,
+        and record its tokens under the model that served it.
+        `consume`, if given, is awaited with the response (e.g. a stream) and the model, and returns the final response.
+        With a router, the request goes to the endpoint it chooses, and the endpoint's latency and tokens are recorded;
+        if `main_model` is set (a completion of the main model), the endpoint's own model, if any, serves it instead.
+        With a `limiter`, the request waits for a free slot first.
+        The request counts as in flight (in `stats`) from when it gets its slot and endpoint until it is done.
+        """
+        if self.limiter is None:
+            return await self._send(call, model, consume, main_model, **kwargs)
+        async with self.limiter:
+            return await self._send(call, model, consume, main_model, **kwargs)
+
+    async def _send(self, call: Callable[[Any], Callable[..., Awaitable[Any]]], model: str,
+                    consume: Optional[Callable[[Any, str], Awaitable[Any]]] = None, main_model: bool = False, **kwargs):
+        if self.router is None:
+            with self._in_flight():
+                response = await call(self._client)(model=model, **kwargs)
+                if consume is not None:
+                    response = await consume(response, model)
+            self._log_usage(model, response)
+            return response
+        endpoint = await self.router.acquire()
+        if main_model and endpoint.model:
+            # Embeddings and cascade models are not replaced: the endpoint's model only stands in for the main one
+            model = endpoint.model
+        start = time.perf_counter()
+        try:
+            with self._in_flight():
+                response = await call(endpoint.client)(model=model, **kwargs)
+                if consume is not None:
+                    response = await consume(response, model)
+        except Exception as e:
+            self.router.release(endpoint, error=e)
+            if self.stats:
+                self.stats.log_endpoint(endpoint.name, time.perf_counter() - start, failed=True)
+            raise
+        except BaseException:
+            # Cancelled: the request neither succeeded nor failed
+            self.router.cancel(endpoint)
+            raise
+        input_tokens, output_tokens = self._log_usage(model, response)
+        self.router.release(endpoint, input_tokens + output_tokens)
+        if self.stats:
+            self.stats.log_endpoint(endpoint.name, time.perf_counter() - start, input_tokens, output_tokens)
+        return response
+
+    @contextmanager
+    def _in_flight(self):
+        """Count a request as in flight in `stats` while it is sent and its response read."""
+        if self.stats:
+            self.stats.in_flight += 1
+        try:
+            yield
+        finally:
+            if self.stats:
+                self.stats.in_flight -= 1
+
+    def _log_usage(self, model: str, response) -> tuple[int, int]:
+        """Record the tokens used by `response` under `model` (so that they are priced as such), and return them."""
+        u = getattr(response, "usage", None)
+        input_tokens = getattr(u, 'prompt_tokens', 0) or 0
+        output_tokens = getattr(u, 'completion_tokens', 0) or 0  # Embeddings have no output tokens
+        if self.stats:
+            self.stats.log_model_usage(model, input_tokens, output_tokens)
+        return input_tokens, output_tokens
+
+    async def prompt_model(self, prompt: str, output_fields: list[str], model: Optional[str] = None,
+                           logprobs: bool = False, examples: Optional[list[dict]] = None) -> dict:
+        """
+        Send the prompt to `model` (default: the main model) and return the completions.
+        `examples` are the few-shot example messages for this request (default: those set with `set_examples`).
+        """
         if not self.use_structured_outputs:
-            fn = self._client.chat.completions.create
+            call = lambda client: client.chat.completions.create
             response_format = {"type": "json_object"}
         else:
-            fn = self._client.chat.completions.parse
-            response_format = create_model("Response", **{field: (str, ...) for field in output_fields})
+            call = lambda client: client.chat.completions.parse
+            response_format = self.response_model(output_fields)
 
-        messages = [{"role": "system", "content": self.system_prompt}] + self.examples + [{"role": "user", "content": prompt}]
+        if examples is None:
+            examples = self.examples
+        model = model or self.model
+        messages = [{"role": "system", "content": self.system_prompt}] + examples + [{"role": "user", "content": prompt}]
 
-        return await fn(
-            model=self.model,
+        if logprobs:
+            kwargs = {**self.model_params, 'logprobs': True}
+        else:
+            kwargs = self.model_params
+        if self.streaming and not self.use_structured_outputs:
+            start = time.perf_counter()
+            return await self.send(
+                call,
+                model,
+                consume=lambda stream, model: self.read_stream(stream, model, messages, output_fields, start),
+                main_model=model == self.model,
+                messages=messages,
+                n=self.num_results,
+                response_format=response_format,
+                stream=True,
+                stream_options={'include_usage': True},
+                **kwargs,
+            )
+        return await self.send(
+            call,
+            model,
+            main_model=model == self.model,
             messages=messages,
             n=self.num_results,
             response_format=response_format,
-            **self.model_params,
+            **kwargs,
+        )
+
+    async def read_stream(self, stream, model: str, messages: list[dict], output_fields: list[str], start: float):
+        """
+        Read a streamed response and return it in the same shape as a complete one.
+        Every completion is checked as it arrives; once all of them are invalid, the stream is closed,
+        and its tokens are estimated (the API only reports them at the end of the stream).
+        The time from `start` (when the request was sent) until the first output field of a completion is complete
+        is recorded as the 'first_field' latency.
+        """
+        checks = [ResponseCheck(output_fields, self._validators) for _ in range(self.num_results)]
+        logprobs: list[list] = [[] for _ in range(self.num_results)]
+        chunks = 0
+        usage = None
+        first_field = False
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                for choice in chunk.choices:
+                    if choice.index >= len(checks):
+                        continue
+                    if choice.delta.content:
+                        chunks += 1
+                        checks[choice.index].feed(choice.delta.content)
+                    if choice.logprobs and choice.logprobs.content:
+                        logprobs[choice.index].extend(choice.logprobs.content)
+                if not first_field and any(check.fields for check in checks):
+                    first_field = True
+                    if self.stats:
+                        self.stats.observe_latency('first_field', time.perf_counter() - start)
+                    if self.tracer:
+                        self.tracer.instant('first_field')
+                if all(check.error for check in checks):
+                    logger.warning(f"Abandoning the response: {checks[0].error}: {checks[0].text}")
+                    if self.stats:
+                        self.stats.log_stream_abort()
+                    if self.tracer:
+                        self.tracer.instant('abort', error=checks[0].error)
+                    break
+        finally:
+            await stream.close()
+        if usage is None:
+            # Every content chunk is one token
+            usage = SimpleNamespace(prompt_tokens=count_message_tokens(messages, model), completion_tokens=chunks)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(index=k, message=SimpleNamespace(content=check.text, refusal=None),
+                                     logprobs=SimpleNamespace(content=logprobs[k]))
+                     for k, check in enumerate(checks)],
+            usage=usage,
         )
 
     def parse_response(self, completion, output_fields: list[str]) -> Optional[dict]:
@@ -56,8 +284,13 @@ class LLMClient:
                 if missing_fields:
                     logger.warning(f"Response is missing fields {missing_fields}: {response}")
                     return None
-                # If there are extra fields, we just ignore them
-                return {field: response[field] for field in output_fields if field in response}
+                # If there are extra fields, we just ignore them;
+                # values of typed fields are validated (and converted, e.g. from "5" to 5)
+                return {field: self._validators[field].validate_python(response[field]) if field in self._validators
+                        else response[field] for field in output_fields}
+            except ValidationError as e:
+                logger.warning(f"Response has values of the wrong type: {e}")
+                return None
             except Exception as _:
                 logger.warning(f"Failed to parse response: {completion}")
                 return None
@@ -67,20 +300,108 @@ class LLMClient:
                 return None
             return completion.parsed.model_dump()
 
-    async def get_response(self, prompt: str, output_fields: list[str] = []) -> tuple[Optional[dict], int, int]:
+    def choose_response(self, completions, output_fields: list[str], check_confidence: bool) -> tuple[Optional[dict], str]:
+        """
+        Return the first valid response among the completions, or None and the reason why there is none:
+        'invalid_response', or, if `check_confidence` is set, 'low_confidence' (see `set_cascade`).
+        With an agreement threshold, the response is the one most completions agree on.
+        """
+        if not check_confidence or self.min_agreement is None:
+            for choice in completions.choices[:self.num_results]:
+                response = self.parse_response(choice.message, output_fields)
+                if response is not None:
+                    break
+            else:
+                return None, 'invalid_response'
+            if check_confidence and self.min_logprob is not None and not self.is_confident([choice]):
+                return None, 'low_confidence'
+            return response, ''
+
+        votes: dict[str, tuple[dict, list]] = {}  # Response (as JSON) -> response and the choices that produced it
+        for choice in completions.choices[:self.num_results]:
+            response = self.parse_response(choice.message, output_fields)
+            if response is not None:
+                votes.setdefault(json.dumps(response, sort_keys=True, default=str), (response, []))[1].append(choice)
+        if not votes:
+            return None, 'invalid_response'
+        response, choices = max(votes.values(), key=lambda vote: len(vote[1]))
+        if len(choices) < self.min_agreement * len(completions.choices[:self.num_results]):
+            return None, 'low_confidence'
+        if self.min_logprob is not None and not self.is_confident(choices):
+            return None, 'low_confidence'
+        return response, ''
+
+    def is_confident(self, choices) -> bool:
+        """
+        Whether the average log-probability of the tokens of any of `choices` reaches `min_logprob`.
+        Choices without log-probabilities (e.g. from an endpoint that does not support them) are not confident.
+        """
+        logprobs = [mean_logprob(choice) for choice in choices]
+        if None in logprobs and not self._missing_logprobs_reported:
+            logger.warning("The API returned no log-probabilities, so the confidence of responses is unknown "
+                           "and they are escalated; check that the models of the cascade support logprobs.")
+            self._missing_logprobs_reported = True
+        assert self.min_logprob is not None
+        return any(logprob is not None and logprob >= self.min_logprob for logprob in logprobs)
+
+    async def get_response(self, prompt: str, output_fields: list[str] = [],
+                           examples: Optional[list[dict]] = None) -> tuple[Optional[dict], int, int]:
         """
         Prompt the model until we get a valid json completion that contains all the output fields.
         Return None if no valid completion is generated after num_retries attempts.
+        With a cascade (see `set_cascade`), the cheaper models are tried first.
+        `examples`, if given, replace the few-shot examples set with `set_examples` for this prompt.
         """
         req_input_tokens = 0
         req_output_tokens = 0
+        models = self.cascade + [self.model]
+        for k, model in enumerate(models):
+            escalate = k < len(models) - 1
+            response, input_tokens, output_tokens = await self.get_model_response(model, prompt, output_fields, escalate, examples)
+            req_input_tokens += input_tokens
+            req_output_tokens += output_tokens
+            if response is not None:
+                return response, req_input_tokens, req_output_tokens
+            if escalate:
+                logger.debug(f"Escalating from {model} to {models[k + 1]}")
+                if self.stats:
+                    self.stats.log_escalation(model)
+                if self.tracer:
+                    self.tracer.instant('escalate', model=model)
+        return None, req_input_tokens, req_output_tokens
+
+    async def get_model_response(self, model: str, prompt: str, output_fields: list[str], escalate: bool = False,
+                                 examples: Optional[list[dict]] = None) -> tuple[Optional[dict], int, int]:
+        """
+        Prompt `model` until we get a valid json completion that contains all the output fields.
+        If `escalate` is set, give up as soon as a completion is invalid or not confident enough,
+        and only retry errors of the request itself.
+        """
+        req_input_tokens = 0
+        req_output_tokens = 0
+        failure = ''  # Why the previous attempt failed (reported as the cause of the retry)
 
         for attempt in range(self.num_retries):
             if attempt > 0:
                 logger.warning(f"Attempt {attempt + 1}")
+                if self.stats:
+                    self.stats.log_retry(failure)
+                if self.tracer:
+                    self.tracer.instant('retry', attempt=attempt + 1, cause=failure)
 
             try:
-                completions = await self.prompt_model(prompt, output_fields)
+                if self.tracer:
+                    self.tracer.begin('request', model=model, attempt=attempt + 1)
+                start = time.perf_counter()
+                try:
+                    completions = await self.prompt_model(prompt, output_fields, model,
+                                                          logprobs=escalate and self.min_logprob is not None,
+                                                          examples=examples)
+                finally:
+                    if self.stats:
+                        self.stats.observe_latency('api', time.perf_counter() - start)
+                    if self.tracer:
+                        self.tracer.end('request')
 
                 u = getattr(completions, "usage", None)
                 if u:
@@ -90,26 +411,88 @@ class LLMClient:
                     # For older models, we might not have usage information
                     logger.warning("No usage information in the response; cost will be reported as 0.")
 
-                for i in range(self.num_results):
-                    response = self.parse_response(completions.choices[i].message, output_fields)
-                    if response is None:
-                        continue
+                if self.tracer:
+                    self.tracer.begin('parse')
+                start = time.perf_counter()
+                response, failure = self.choose_response(completions, output_fields, escalate)
+                if self.stats:
+                    self.stats.observe_latency('parse', time.perf_counter() - start)
+                if self.tracer:
+                    self.tracer.end('parse', valid=response is not None)
+                if response is not None:
                     logger.debug(f"Response:\n{response}")
                     return response, req_input_tokens, req_output_tokens
+                if escalate:
+                    break
             except Exception as e:
                 logger.warning(f"Could not get a response from the model: {e}")
+                failure = type(e).__name__
+                if attempt < self.num_retries - 1:
+                    await self.back_off(e, attempt)
 
         return None, req_input_tokens, req_output_tokens
 
-    async def generate_embedding(self, text: str) -> tuple[list[float], int]:
-        """Generates an embedding for a given text."""
-        response = await self._client.embeddings.create(
-            input=[text],
-            model=self.model
-        )
+    async def back_off(self, error: Exception, attempt: int):
+        """
+        Wait before retrying a request that failed with `error` on `attempt` (counting from 0), if the server
+        could not handle it (rate limits, server errors, lost connections); other errors are retried at once.
+        The OpenAI clients do not retry requests themselves, so that every retry is recorded in the stats.
+        With a router, the endpoint that failed cools down instead, and the retry may go to another one.
+        """
+        if self.router is not None:
+            return
+        status = getattr(error, 'status_code', None)
+        if not isinstance(error, openai.APIConnectionError) and not (
+                status is not None and (status in RETRYABLE_STATUSES or status >= 500)):
+            return
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY) * random.uniform(0.75, 1.0)
+        await asyncio.sleep(min(delay, RETRY_MAX_DELAY))
+
+    async def generate_embedding(self, text: str, model: Optional[str] = None) -> tuple[list[float], int]:
+        """Generates an embedding for a given text (with `model`, by default the main model)."""
+        embeddings, tokens = await self.generate_embeddings([text], model)
+        return embeddings[0], tokens
+
+    async def generate_embeddings(self, texts: list[str], model: Optional[str] = None) -> tuple[list[list[float]], int]:
+        """Generates embeddings for several texts in one request (with `model`, by default the main model)."""
+        model = model or self.model
+        if self.tracer:
+            self.tracer.begin('request', model=model)
+        start = time.perf_counter()
+        attempts = max(self.num_retries, 1)
+        try:
+            for attempt in range(attempts):
+                try:
+                    response = await self.send(lambda client: client.embeddings.create, model, input=texts)
+                    break
+                except Exception as e:
+                    if attempt == attempts - 1:
+                        raise
+                    logger.warning(f"Could not get embeddings from the model: {e}")
+                    if self.stats:
+                        self.stats.log_retry(type(e).__name__)
+                    if self.tracer:
+                        self.tracer.instant('retry', attempt=attempt + 2, cause=type(e).__name__)
+                    await self.back_off(e, attempt)
+        finally:
+            if self.stats:
+                self.stats.observe_latency('api', time.perf_counter() - start)
+            if self.tracer:
+                self.tracer.end('request')
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
         u = getattr(response, "usage", None)
         if u:
-            return response.data[0].embedding, u.prompt_tokens
+            return embeddings, u.prompt_tokens
         else:
             logger.warning("No usage information in the embedding response; cost will be reported as 0.")
-            return response.data[0].embedding, 0
+            return embeddings, 0
+
+
+def mean_logprob(choice) -> Optional[float]:
+    """Average log-probability of the tokens of a completion (None if the API did not return them)."""
+    tokens = getattr(getattr(choice, 'logprobs', None), 'content', None)
+    if not tokens:
+        return None
+    return sum(token.logprob for token in tokens) / len(tokens)
@@ -0,0 +1,134 @@
+"""Pooled HTTP connections to the API, sized to the number of parallel requests and shareable between Scientists."""
+
+import asyncio
+import importlib.util
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# How long (in seconds) idle connections are kept open; longer than the HTTP client's default of 5 seconds,
+# so that connections survive short pauses, such as back-offs after rate limit errors
+KEEPALIVE_EXPIRY = 30.0
+
+# Trace events of the HTTP transport that mean a new connection was opened
+CONNECT_EVENTS = ('connection.connect_tcp.complete', 'connection.connect_unix_socket.complete')
+
+
+class ConnectionStats:
+    """Number of requests sent through a connection pool and of connections it had to open."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+
+    @property
+    def connections_reused(self) -> int:
+        """Number of requests sent over a connection that was already open."""
+        return max(self.requests - self.connections_opened, 0)
+
+    def snapshot(self) -> dict:
+        return {
+            'requests': self.requests,
+            'connections_opened': self.connections_opened,
+            'connections_reused': self.connections_reused,
+            'reuse_ratio': self.connections_reused / self.requests if self.requests else 0.0,
+        }
+
+
+class ConnectionPool:
+    """
+    HTTP connections to the API, kept alive between requests.
+    `max_connections` is the maximum number of open connections (default: the number of parallel requests
+    of the first job that uses the pool), and `max_keepalive_connections` the number of idle connections kept open
+    (default: all of them, so that workers do not reconnect between rows).
+    `http2` multiplexes requests over fewer connections; it needs the `h2` package and falls back to HTTP/1.1 without it.
+    Connections belong to an event loop, so the pool holds a separate HTTP client for every event loop it is used in.
+    Jobs hold the client they use with `connect`, so that a client replaced by a larger one is only closed
+    once the jobs still using it (e.g. other jobs on the same loop) are done.
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: float = KEEPALIVE_EXPIRY, http2: bool = False):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.stats = ConnectionStats()
+        self._clients: dict[Any, tuple[Any, int]] = {}  # Event loop (None outside of one) -> (HTTP client, size)
+        self._users: dict[Any, int] = {}  # HTTP client -> number of jobs holding it
+        self._retired: set[Any] = set()  # Replaced clients, to be closed when their last job is done
+
+    def settings(self) -> dict:
+        """The arguments needed to create an equivalent pool (e.g. in another process)."""
+        return {
+            'max_connections': self.max_connections,
+            'max_keepalive_connections': self.max_keepalive_connections,
+            'keepalive_expiry': self.keepalive_expiry,
+            'http2': self.http2,
+        }
+
+    def http_client(self, concurrency: int):
+        """
+        The HTTP client for the running event loop, created on first use.
+        Unless `max_connections` is set, it has room for `concurrency` parallel requests,
+        and is replaced by a larger one if a later job needs more
+        (the old one is closed right away if no job holds it, see `connect`, and otherwise after the last one is done).
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        # Forget clients of event loops that are gone
+        self._clients = {key: value for key, value in self._clients.items() if key is None or not key.is_closed()}
+        size = self.max_connections or concurrency
+        client, client_size = self._clients.get(loop, (None, 0))
+        if client is None or client_size < size:
+            if client in self._users:
+                self._retired.add(client)
+            elif client is not None and loop is not None:
+                loop.create_task(client.aclose())
+            client = self._create_client(size)
+            self._clients[loop] = (client, size)
+        return client
+
+    @asynccontextmanager
+    async def connect(self, concurrency: int) -> AsyncIterator[Any]:
+        """Hold the HTTP client for the running event loop (see `http_client`) while a job uses it."""
+        client = self.http_client(concurrency)
+        self._users[client] = self._users.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            self._users[client] -= 1
+            if self._users[client] == 0:
+                del self._users[client]
+                if client in self._retired:
+                    self._retired.discard(client)
+                    await client.aclose()
+
+    def _create_client(self, size: int):
+        from openai import DefaultAsyncHttpxClient
+        try:
+            from httpx2 import Limits  # Used by openai since version 3
+        except ImportError:
+            from httpx import Limits
+
+        http2 = self.http2
+        if http2 and importlib.util.find_spec('h2') is None:
+            logger.warning("HTTP/2 needs the h2 package (pip install h2); using HTTP/1.1 instead.")
+            http2 = False
+        limits = Limits(max_connections=size,
+                        max_keepalive_connections=self.max_keepalive_connections or size,
+                        keepalive_expiry=self.keepalive_expiry)
+
+        async def trace(event: str, info: dict):
+            if event in CONNECT_EVENTS:
+                self.stats.connections_opened += 1
+
+        async def count_request(request):
+            self.stats.requests += 1
+            request.extensions = {**request.extensions, 'trace': trace}
+
+        return DefaultAsyncHttpxClient(limits=limits, http2=http2, event_hooks={'request': [count_request]})
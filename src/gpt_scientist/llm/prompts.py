@@ -2,11 +2,18 @@
 
 import json
 import pandas as pd
+from typing import Any, Iterable, Mapping, Optional, Sequence
+from gpt_scientist.llm.schema import OutputType, describe_type, to_plain
 
 
-def format_suffix(fields: list[str]) -> str:
-    """Suffix added to the prompt to explain the expected format of the response."""
-    return f"Return exactly one json object with the following fields: {', '.join(fields)}."
+def format_suffix(fields: list[str], output_types: Optional[dict[str, OutputType]] = None) -> str:
+    """Suffix added to the prompt to explain the expected format of the response (and the types of typed fields)."""
+    output_types = output_types or {}
+
+    def describe(field: str) -> str:
+        description = describe_type(output_types[field]) if field in output_types else None
+        return f"{field} ({description})" if description else field
+    return f"Return exactly one json object with the following fields: {', '.join(describe(field) for field in fields)}."
 
 
 def input_fields_and_values(fields: list[str], row: pd.Series) -> str:
@@ -14,26 +21,60 @@ def input_fields_and_values(fields: list[str], row: pd.Series) -> str:
     return '\n\n'.join([f"{field}:\n```\n{row[field]}\n```" for field in fields])
 
 
+def _escape_braces(text: str) -> str:
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+class PromptTemplate:
+    """
+    A full prompt (user prompt, input fields and values, and format suffix) compiled once per job
+    into a single format string, with a placeholder for the value of every input field.
+    Renders the same text as `create_prompt`, but from bare values
+    (e.g. taken from column arrays extracted once per job), without building a row per request.
+    """
+
+    def __init__(self, user_prompt: str, input_fields: list[str], output_fields: list[str],
+                 use_structured_outputs: bool, output_types: Optional[dict[str, OutputType]] = None):
+        self.input_fields = input_fields
+        template = _escape_braces(f"{user_prompt}\n")
+        template += '\n\n'.join(_escape_braces(f"{field}:\n```\n") + f"{{{k}}}" + '\n```'
+                                 for k, field in enumerate(input_fields))
+        if not use_structured_outputs:
+            # If we are not using structured outputs, we need to add the description of the expected format to the prompt
+            template += _escape_braces(f"\n{format_suffix(output_fields, output_types)}")
+        self._format = template.format
+
+    def render(self, *values: Any) -> str:
+        """Render the prompt for the values of the input fields (in order)."""
+        return self._format(*values)
+
+    def render_row(self, row: Mapping | pd.Series) -> str:
+        """Render the prompt for a row (anything indexable by field name)."""
+        return self._format(*(row[field] for field in self.input_fields))
+
+    def render_many(self, columns: Sequence[Sequence[Any]], rows: Iterable[int]) -> list[str]:
+        """Render the prompts for `rows` in bulk; `columns` holds the values of every input field, indexed by row."""
+        return [self._format(*values) for values in zip(*([column[i] for i in rows] for column in columns))]
+
+
 def create_prompt(user_prompt: str, input_fields: list[str], output_fields: list[str],
-                  row: pd.Series, use_structured_outputs: bool) -> str:
+                  row: pd.Series, use_structured_outputs: bool,
+                  output_types: Optional[dict[str, OutputType]] = None) -> str:
     """Create a full prompt from user prompt, input fields, and row data."""
-    prompt = f"{user_prompt}\n{input_fields_and_values(input_fields, row)}"
-    if not use_structured_outputs:
-        # If we are not using structured outputs, we need to add the description of the expected format to the prompt
-        prompt = f"{prompt}\n{format_suffix(output_fields)}"
-    return prompt
+    return PromptTemplate(user_prompt, input_fields, output_fields, use_structured_outputs, output_types).render_row(row)
 
 
 def create_example_messages(prompt: str, row: pd.Series, input_fields: list[str],
-                            output_fields: list[str], use_structured_outputs: bool) -> list[dict]:
+                            output_fields: list[str], use_structured_outputs: bool,
+                            output_types: Optional[dict[str, OutputType]] = None) -> list[dict]:
     """
     Create a few-shot example where the user message is the prompt and input fields from the given row,
     and the model response is the output fields of the row.
     """
     # The input of the example is the full prompt as it would be sent to the model
-    full_prompt = create_prompt(prompt, input_fields, output_fields, row, use_structured_outputs)
+    full_prompt = create_prompt(prompt, input_fields, output_fields, row, use_structured_outputs, output_types)
     # The output of the example is a json object with the output fields of the row
-    response = {field: row[field] for field in output_fields}
+    response = {field: to_plain(row[field]) for field in output_fields}
     return [
         {"role": "user", "content": full_prompt},
         {"role": "assistant", "content": json.dumps(response, ensure_ascii=False)}
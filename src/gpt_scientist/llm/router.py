@@ -0,0 +1,167 @@
+"""Routing of requests across several OpenAI-compatible endpoints (API keys or servers), by weight and rate limits."""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Optional
+
+# Length (in seconds) of the window that per-minute rate limits are counted over
+RATE_WINDOW = 60.0
+
+# Cool-down of an endpoint after a failed request (in seconds): doubles with every consecutive failure, up to the maximum
+BASE_COOLDOWN = 1.0
+MAX_COOLDOWN = 60.0
+
+# Client error statuses that mean the endpoint is overloaded (rather than that the request was invalid)
+RETRYABLE_STATUSES = (408, 409, 429)
+
+# How often (in seconds) to check for a free endpoint when all of them are busy for reasons that have no known end
+POLL_INTERVAL = 0.05
+
+
+class Endpoint:
+    """
+    An endpoint that requests can be sent to: an OpenAI-compatible client (with its base URL and API key),
+    its share of the traffic (`weight`), and its limits.
+    `model`, if given, replaces the main model of the job at this endpoint (e.g. for a local server).
+    `requests_per_minute` and `tokens_per_minute` are the rate limits of the endpoint,
+    and `max_concurrency` the maximum number of requests in flight (None: unlimited).
+    """
+
+    def __init__(self, name: str, client: Any, weight: float = 1.0, model: Optional[str] = None,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 max_concurrency: Optional[int] = None):
+        if weight <= 0:
+            raise ValueError(f"The weight of endpoint {name} must be positive.")
+        self.name = name
+        self.client = client
+        self.weight = weight
+        self.model = model
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.current_weight = 0.0  # For smooth weighted round-robin
+        self.failures = 0  # Consecutive failed requests
+        self.cooldown_until = 0.0
+        self.requests: deque[float] = deque()  # Start times of requests in the rate window
+        self.tokens: deque[tuple[float, int]] = deque()  # (time, tokens) of requests done in the rate window
+        self.window_tokens = 0
+        self.completed = 0
+        self.total_tokens = 0
+
+    def _prune(self, now: float):
+        while self.requests and self.requests[0] <= now - RATE_WINDOW:
+            self.requests.popleft()
+        while self.tokens and self.tokens[0][0] <= now - RATE_WINDOW:
+            self.window_tokens -= self.tokens.popleft()[1]
+
+    def expected_tokens(self) -> float:
+        """Average number of tokens per request so far (used to reserve tokens for requests in flight)."""
+        return self.total_tokens / self.completed if self.completed else 0.0
+
+    def wait_time(self, now: float) -> float:
+        """How long (in seconds) until this endpoint can take another request (0 if it can take one now)."""
+        self._prune(now)
+        wait = max(self.cooldown_until - now, 0.0)
+        if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+            wait = max(wait, POLL_INTERVAL)
+        if self.requests_per_minute is not None and len(self.requests) >= self.requests_per_minute:
+            wait = max(wait, self.requests[0] + RATE_WINDOW - now)
+        if self.tokens_per_minute is not None:
+            reserved = (self.in_flight + 1) * self.expected_tokens()
+            if self.window_tokens + reserved > self.tokens_per_minute and (self.tokens or self.in_flight):
+                # Wait for the oldest tokens to leave the window, or for requests in flight to finish
+                wait = max(wait, self.tokens[0][0] + RATE_WINDOW - now if self.tokens else POLL_INTERVAL)
+        return wait
+
+    def start(self, now: float):
+        self.in_flight += 1
+        self.requests.append(now)
+
+    def finish(self, now: float, tokens: int, error: Optional[BaseException]):
+        self.in_flight -= 1
+        if error is None:
+            self.failures = 0
+            self.completed += 1
+            self.total_tokens += tokens
+            self.tokens.append((now, tokens))
+            self.window_tokens += tokens
+            return
+        status = getattr(error, 'status_code', None)
+        if status is not None and 400 <= status < 500 and status not in RETRYABLE_STATUSES:
+            return  # The request was at fault, not the endpoint
+        self.failures += 1
+        cooldown = min(BASE_COOLDOWN * 2 ** (self.failures - 1), MAX_COOLDOWN)
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            cooldown = min(retry_after, MAX_COOLDOWN)
+        self.cooldown_until = max(self.cooldown_until, now + cooldown)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The delay requested by the server in the Retry-After header of an error response, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class Router:
+    """
+    Spreads requests over `endpoints` in proportion to their weights (smooth weighted round-robin),
+    skipping endpoints that are at their rate or concurrency limits or cooling down after a failure;
+    when no endpoint is free, waits until one is.
+    """
+
+    def __init__(self, endpoints: list[Endpoint]):
+        if not endpoints:
+            raise ValueError("A router needs at least one endpoint.")
+        names = [endpoint.name for endpoint in endpoints]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Endpoint names must be unique: {names}")
+        self.endpoints = endpoints
+
+    async def acquire(self) -> Endpoint:
+        """Choose the endpoint for the next request, and count the request as started there."""
+        while True:
+            now = time.monotonic()
+            waits = [endpoint.wait_time(now) for endpoint in self.endpoints]
+            free = [endpoint for endpoint, wait in zip(self.endpoints, waits) if wait == 0]
+            if free:
+                total = sum(endpoint.weight for endpoint in free)
+                for endpoint in free:
+                    endpoint.current_weight += endpoint.weight
+                chosen = max(free, key=lambda endpoint: endpoint.current_weight)
+                chosen.current_weight -= total
+                chosen.start(now)
+                return chosen
+            await asyncio.sleep(min(waits))
+
+    def release(self, endpoint: Endpoint, tokens: int = 0, error: Optional[BaseException] = None):
+        """Record that a request to `endpoint` is done, with the tokens it used or the error it failed with."""
+        endpoint.finish(time.monotonic(), tokens, error)
+
+    def cancel(self, endpoint: Endpoint):
+        """Record that a request to `endpoint` was cancelled before it finished."""
+        endpoint.in_flight -= 1
+
+
+def create_router(endpoints: list[dict], http_client=None) -> Router:
+    """
+    Create a router from endpoint settings (see `Scientist.add_endpoint`), with clients that share `http_client`.
+    The clients do not retry failed requests themselves, so that retries can go to other endpoints.
+    """
+    from openai import AsyncOpenAI
+    return Router([
+        Endpoint(settings['name'],
+                 AsyncOpenAI(api_key=settings['api_key'], base_url=settings['base_url'],
+                             http_client=http_client, max_retries=0),
+                 settings['weight'], settings['model'], settings['requests_per_minute'],
+                 settings['tokens_per_minute'], settings['max_concurrency'])
+        for settings in endpoints
+    ])
@@ -0,0 +1,139 @@
+"""Types of output fields: declaration, validation, and storage in dataframe columns."""
+
+import enum
+import typing
+from typing import TYPE_CHECKING, Any, Literal, Optional, Union
+
+# This module is imported by `Scientist`, so pandas is imported on first use (see `import gpt_scientist` startup time)
+if TYPE_CHECKING:
+    import pandas as pd
+
+# A normalized output type: the name of a basic type, or the tuple of allowed values of an enum.
+# Normalized types are plain data, so that they can be sent to worker processes and stored in job descriptions.
+OutputType = Union[str, tuple[str, ...]]
+
+# Basic output types, by name
+OUTPUT_TYPES: dict[str, Any] = {
+    'str': str,
+    'int': int,
+    'float': float,
+    'bool': bool,
+    'list[str]': list[str],
+}
+
+# How each basic type is described to the model when structured outputs are not used
+TYPE_DESCRIPTIONS = {
+    'int': 'integer',
+    'float': 'number',
+    'bool': 'true or false',
+    'list[str]': 'list of strings',
+}
+
+# Dataframe column types: nullable, so that rows without a result yet stay empty
+COLUMN_DTYPES = {
+    'int': 'Int64',
+    'float': 'Float64',
+    'bool': 'boolean',
+}
+
+TRUE_STRINGS = {'true', 't', 'yes', 'y', '1'}
+FALSE_STRINGS = {'false', 'f', 'no', 'n', '0'}
+
+
+def normalize_type(spec: Any) -> OutputType:
+    """
+    Normalize an output type declaration:
+    str, int, float, bool or list[str] (or their names, e.g. 'int');
+    an Enum class, a Literal, or a list or tuple of allowed (string) values, for enums.
+    """
+    if isinstance(spec, str):
+        if spec not in OUTPUT_TYPES:
+            raise ValueError(f"Unknown output type '{spec}'; use one of: {', '.join(OUTPUT_TYPES)}.")
+        return spec
+    for name, python_type in OUTPUT_TYPES.items():
+        if spec == python_type:
+            return name
+    if isinstance(spec, type) and issubclass(spec, enum.Enum):
+        return tuple(str(member.value) for member in spec)
+    if typing.get_origin(spec) is Literal:
+        return tuple(str(value) for value in typing.get_args(spec))
+    if isinstance(spec, (list, tuple)) and spec and all(isinstance(value, str) for value in spec):
+        return tuple(spec)
+    raise ValueError(f"Unsupported output type: {spec!r}.")
+
+
+def normalize_output_fields(output_fields: list[str] | dict[str, Any]) -> tuple[list[str], dict[str, OutputType]]:
+    """
+    Split output field declarations into the list of field names and their (normalized) types.
+    `output_fields` is either a list of names (all fields are strings), or a dictionary from names to types.
+    Only fields with a type other than str are included in the types.
+    """
+    if not isinstance(output_fields, dict):
+        return list(output_fields), {}
+    types = {field: normalize_type(spec) for field, spec in output_fields.items()}
+    return list(output_fields), {field: t for field, t in types.items() if t != 'str'}
+
+
+def python_type(output_type: OutputType) -> Any:
+    """The type used to validate values of `output_type` (and to declare it in response models)."""
+    if isinstance(output_type, tuple):
+        return Literal[output_type]
+    return OUTPUT_TYPES[output_type]
+
+
+def describe_type(output_type: OutputType) -> Optional[str]:
+    """Describe `output_type` for the model (None for strings, which need no description)."""
+    if isinstance(output_type, tuple):
+        return f"one of: {', '.join(output_type)}"
+    return TYPE_DESCRIPTIONS.get(output_type)
+
+
+def _parse_bool(value: str):
+    import pandas as pd
+    lowered = value.strip().lower()
+    if lowered in TRUE_STRINGS:
+        return True
+    if lowered in FALSE_STRINGS:
+        return False
+    return pd.NA
+
+
+def convert_column(column: 'pd.Series', output_type: OutputType) -> 'pd.Series':
+    """
+    Convert an existing column (typically read as strings from a file or a sheet) to the column type of `output_type`;
+    empty and invalid values become missing.
+    """
+    import pandas as pd
+    if isinstance(output_type, tuple):
+        return column.where(column.isin(output_type)).astype(pd.CategoricalDtype(output_type))
+    if output_type in ('int', 'float'):
+        numbers = pd.to_numeric(column.replace('', None), errors='coerce')
+        if output_type == 'int':
+            numbers = numbers.where(numbers.isna() | (numbers == numbers.round()))
+        return numbers.astype(COLUMN_DTYPES[output_type])
+    if output_type == 'bool':
+        if pd.api.types.is_bool_dtype(column):
+            return column.astype('boolean')
+        return column.map(lambda v: _parse_bool(v) if isinstance(v, str) else v, na_action='ignore').astype('boolean')
+    # Lists are stored as Python objects
+    return column.astype(object).where(column.notna() & (column != ''), None)
+
+
+def empty_column(index: 'pd.Index', output_type: OutputType) -> 'pd.Series':
+    """A column of missing values of the column type of `output_type`."""
+    import pandas as pd
+    if isinstance(output_type, tuple):
+        return pd.Series(pd.Categorical([None] * len(index), categories=output_type), index=index)
+    if output_type in COLUMN_DTYPES:
+        return pd.Series(pd.NA, index=index, dtype=COLUMN_DTYPES[output_type])
+    return pd.Series(None, index=index, dtype=object)
+
+
+def to_plain(value: Any) -> Any:
+    """Convert a value read from a typed column to a plain Python value (e.g. for JSON); missing values become None."""
+    import pandas as pd
+    if isinstance(value, (list, tuple, dict)):
+        return value
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
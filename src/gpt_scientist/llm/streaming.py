@@ -0,0 +1,129 @@
+"""Incremental validation of JSON responses that are streamed from the model, so that bad responses can be abandoned early."""
+
+import json
+from typing import Any, Optional
+from pydantic import TypeAdapter, ValidationError
+
+WHITESPACE = ' \t\n\r'
+
+
+class ResponseCheck:
+    """
+    Checks the text of a streamed completion as it arrives, chunk by chunk, and parses the fields of the JSON object
+    as soon as their values are complete.
+    The check fails (and `error` says why) as soon as the text can no longer be a valid response:
+    it does not start with a JSON object, is not valid JSON, has a value of the wrong type for one of `output_fields`,
+    or the object ends without all of `output_fields`.
+    Like `LLMClient.parse_response`, it ignores extra fields.
+    """
+
+    def __init__(self, output_fields: list[str], validators: dict[str, TypeAdapter]):
+        self.output_fields = output_fields
+        self.validators = validators
+        self.text = ''
+        self.fields: dict[str, Any] = {}  # Fields whose values are complete -> their (validated) values
+        self.error: Optional[str] = None
+        self.done = False  # Whether the object is complete
+        self._pos = 0  # Position of the next character to scan
+        self._state = 'start'  # What comes next at the top level: start, key_or_end, key, colon, value or end
+        self._depth = 0  # Nesting depth (1 inside the top-level object)
+        self._in_string = False
+        self._escape = False
+        self._start = 0  # Position where the current key or value starts
+        self._key = ''
+        self._value_started = False
+
+    def feed(self, chunk: str) -> bool:
+        """Add the next chunk of text; return False if the response is invalid."""
+        self.text += chunk
+        text = self.text
+        while self.error is None and self._pos < len(text):
+            self._scan(text, self._pos)
+            self._pos += 1
+        return self.error is None
+
+    def _scan(self, text: str, i: int):
+        c = text[i]
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == '\\':
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if self._state == 'key':
+                    self._key = json.loads(text[self._start:i + 1])
+                    self._state = 'colon'
+            return
+        state = self._state
+        if state == 'value':
+            self._scan_value(text, i)
+        elif c in WHITESPACE:
+            return
+        elif state == 'start':
+            if c != '{':
+                self.error = "the response is not a JSON object"
+                return
+            self._depth = 1
+            self._state = 'key_or_end'
+        elif state in ('key_or_end', 'key') and c == '"':
+            self._in_string = True
+            self._start = i
+            self._state = 'key'
+        elif state == 'key_or_end' and c == '}':
+            self._end()
+        elif state == 'colon' and c == ':':
+            self._state = 'value'
+            self._value_started = False
+        elif state == 'end':
+            self.error = "there is more text after the JSON object"
+        else:
+            self.error = f"the response is not valid JSON (unexpected {c!r})"
+
+    def _scan_value(self, text: str, i: int):
+        c = text[i]
+        if not self._value_started:
+            if c in WHITESPACE:
+                return
+            self._value_started = True
+            self._start = i
+        if c == '"':
+            self._in_string = True
+        elif c in '{[':
+            self._depth += 1
+        elif self._depth > 1 and c in '}]':
+            self._depth -= 1
+        elif self._depth == 1 and c in ',}':
+            self._complete_value(text[self._start:i])
+            if self.error is not None:
+                return
+            if c == ',':
+                self._state = 'key'
+            else:
+                self._end()
+        elif self._depth == 1 and c == ']':
+            self.error = "the response is not valid JSON (unexpected ']')"
+
+    def _complete_value(self, raw: str):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self.error = f"the value of field {self._key} is not valid JSON"
+            return
+        if self._key not in self.output_fields:
+            return
+        if self._key in self.validators:
+            try:
+                value = self.validators[self._key].validate_python(value)
+            except ValidationError:
+                self.error = f"the value of field {self._key} has the wrong type"
+                return
+        self.fields[self._key] = value
+
+    def _end(self):
+        self._depth = 0
+        self._state = 'end'
+        self.done = True
+        missing = [field for field in self.output_fields if field not in self.fields]
+        if missing:
+            self.error = f"the response is missing fields {missing}"
@@ -0,0 +1,90 @@
+"""Local token counting (exact with tiktoken if installed, approximate otherwise)."""
+
+import logging
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Tokens added by the chat format to every message, and to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_OVERHEAD_TOKENS = 3
+
+# Average number of characters per token, used when no tokenizer is available
+CHARS_PER_TOKEN = 4.0
+
+# Encoding used for models that tiktoken does not know about
+DEFAULT_ENCODING = 'o200k_base'
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """Return the tiktoken encoding for `model`, or None if tiktoken is not installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken is not installed; token counts will be approximate.")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Count the tokens in `text` (approximately, if tiktoken is not installed)."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return round(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode_ordinary(text))
+
+
+def count_message_tokens(messages: list[dict], model: str) -> int:
+    """Count the tokens in a list of chat messages, including the chat format overhead."""
+    return sum(count_tokens(m['content'], model) + MESSAGE_OVERHEAD_TOKENS for m in messages) + REPLY_OVERHEAD_TOKENS
+
+
+def tokens_per_char(texts: list[str], model: str) -> Optional[float]:
+    """
+    Return the ratio of tokens to characters in `texts` (typically a sample of a column),
+    or None if tiktoken is not installed or the texts are empty.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return None
+    chars = sum(len(t) for t in texts)
+    if chars == 0:
+        return None
+    tokens = sum(len(ids) for ids in encoding.encode_ordinary_batch(texts))
+    return tokens / chars
+
+
+def split_tokens(text: str, max_tokens: int, overlap: int, model: str) -> list[str]:
+    """
+    Split `text` into consecutive chunks of at most `max_tokens` tokens, where every chunk repeats the last `overlap`
+    tokens of the previous one (so that sentences cut at the boundary are seen whole in one of the chunks).
+    Without tiktoken, tokens are approximated by characters, and chunks end at whitespace where possible.
+    """
+    if not 0 <= overlap < max_tokens:
+        raise ValueError("The overlap of chunks must be smaller than their size.")
+    encoding = get_encoding(model)
+    if encoding is None:
+        max_chars = int(max_tokens * CHARS_PER_TOKEN)
+        overlap_chars = int(overlap * CHARS_PER_TOKEN)
+        chunks = []
+        start = 0
+        while True:
+            end = start + max_chars
+            if end >= len(text):
+                chunks.append(text[start:])
+                return chunks
+            # End the chunk at the last whitespace in its second half, if any
+            space = max(text.rfind(' ', start + max_chars // 2, end), text.rfind('\n', start + max_chars // 2, end))
+            if space > 0:
+                end = space + 1
+            chunks.append(text[start:end])
+            start = max(end - overlap_chars, start + 1)
+    ids = encoding.encode_ordinary(text)
+    step = max_tokens - overlap
+    return [encoding.decode(ids[start:start + max_tokens])
+            for start in range(0, max(len(ids) - overlap, 1), step)]
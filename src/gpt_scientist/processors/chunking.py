@@ -0,0 +1,132 @@
+"""Map-reduce over long inputs: splitting input values into token-bounded chunks, and combining the results of the chunks."""
+
+import asyncio
+import json
+import logging
+from collections import Counter
+from typing import Any, Optional
+from gpt_scientist.config import CHUNK_OVERLAP
+from gpt_scientist.llm.prompts import format_suffix
+from gpt_scientist.llm.schema import OutputType
+from gpt_scientist.llm.tokens import count_tokens, split_tokens
+
+logger = logging.getLogger(__name__)
+
+# Ways to combine the values of a field across chunks
+AGGREGATIONS = ('join', 'concat', 'vote', 'any', 'all', 'min', 'max', 'sum', 'mean', 'first')
+
+# Prompt of the request that merges the results of the chunks (with `reduce='merge'`)
+MERGE_PROMPT = (
+    "The input was too long to analyze at once, so it was split into consecutive parts, "
+    "and each part was analyzed separately with the task below. "
+    "Combine the results of the parts into a single result for the whole input."
+)
+
+
+def default_aggregation(output_type: Optional[OutputType]) -> str:
+    """How a field of the given type is combined by default: texts are joined, lists concatenated, other values voted on."""
+    if output_type is None or output_type == 'str':
+        return 'join'
+    if output_type == 'list[str]':
+        return 'concat'
+    if output_type == 'bool':
+        return 'any'
+    return 'vote'
+
+
+def aggregate(values: list[Any], aggregation: str) -> Any:
+    """Combine the values of a field in the results of all chunks (in order)."""
+    if aggregation == 'join':
+        return '\n\n'.join(str(value) for value in values if value not in ('', None))
+    if aggregation == 'concat':
+        return list(dict.fromkeys(item for value in values for item in value))
+    if aggregation == 'vote':
+        # The most common value (the earliest one in case of a tie)
+        keys = [json.dumps(value, sort_keys=True, default=str) for value in values]
+        return values[keys.index(Counter(keys).most_common(1)[0][0])]
+    if aggregation == 'any':
+        return any(values)
+    if aggregation == 'all':
+        return all(values)
+    if aggregation == 'min':
+        return min(values)
+    if aggregation == 'max':
+        return max(values)
+    if aggregation == 'sum':
+        return sum(values)
+    if aggregation == 'mean':
+        return sum(values) / len(values)
+    if aggregation == 'first':
+        return values[0]
+    raise ValueError(f"Unknown aggregation '{aggregation}'; use one of: {', '.join(AGGREGATIONS)}.")
+
+
+class Chunker:
+    """
+    Splits the inputs of a row that are too long for one request into chunks, and combines the results of the chunks.
+    When an input field value has more than `chunk_tokens` tokens, the longest such value is split into chunks
+    of at most `chunk_tokens` tokens that overlap by `chunk_overlap` tokens (the other input fields are sent whole with every chunk).
+    `reduce` is how the results of the chunks are combined:
+    'merge' sends them to the model with `merge_prompt` (default: MERGE_PROMPT) and the original `prompt`;
+    'fields' combines every output field on its own, with the default aggregation for its type (see `default_aggregation`);
+    a dict maps output fields to aggregations (see AGGREGATIONS), and other fields get the default.
+    """
+
+    def __init__(self, prompt: str, output_fields: list[str], model: str, use_structured_outputs: bool,
+                 chunk_tokens: int, chunk_overlap: int = CHUNK_OVERLAP, reduce: str | dict[str, str] = 'merge',
+                 merge_prompt: Optional[str] = None, output_types: Optional[dict[str, OutputType]] = None):
+        if not 0 <= chunk_overlap < chunk_tokens:
+            raise ValueError("The overlap of chunks must be smaller than their size.")
+        self.prompt = prompt
+        self.output_fields = output_fields
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.output_types = output_types or {}
+        self.merge = reduce == 'merge'
+        if isinstance(reduce, dict):
+            unknown = [aggregation for aggregation in reduce.values() if aggregation not in AGGREGATIONS]
+            if unknown:
+                raise ValueError(f"Unknown aggregations {unknown}; use one of: {', '.join(AGGREGATIONS)}.")
+        elif reduce not in ('merge', 'fields'):
+            raise ValueError("`reduce` must be 'merge', 'fields', or a dict from output fields to aggregations.")
+        reduce = reduce if isinstance(reduce, dict) else {}
+        self.aggregations = {field: reduce.get(field) or default_aggregation(self.output_types.get(field))
+                             for field in output_fields}
+        self.merge_prompt = merge_prompt or MERGE_PROMPT
+        self.merge_suffix = '' if use_structured_outputs else f"\n{format_suffix(output_fields, output_types)}"
+
+    def is_long(self, value: Any) -> bool:
+        """Whether `value` has more than `chunk_tokens` tokens."""
+        text = str(value)
+        # A token is at least one character, so short values are not tokenized
+        return len(text) > self.chunk_tokens and count_tokens(text, self.model) > self.chunk_tokens
+
+    async def split(self, values: list[Any]) -> list[list[Any]]:
+        """Return the input values of every chunk of a row (or just `values`, if none of them is too long)."""
+        long = [k for k, value in enumerate(values) if self.is_long(value)]
+        if not long:
+            return [values]
+        k = max(long, key=lambda k: len(str(values[k])))
+        if len(long) > 1:
+            logger.warning(f"Several input values are longer than {self.chunk_tokens} tokens; only the longest one is split.")
+        # Tokenizing a long document takes a while, so do not block the other workers
+        chunks = await asyncio.to_thread(split_tokens, str(values[k]), self.chunk_tokens, self.chunk_overlap, self.model)
+        return [values[:k] + [f"[Part {n + 1} of {len(chunks)}]\n{chunk}"] + values[k + 1:]
+                for n, chunk in enumerate(chunks)]
+
+    def merge_request(self, results: list[dict]) -> str:
+        """The prompt of the request that merges the `results` of the chunks (in order)."""
+        parts = '\n'.join(json.dumps(result, ensure_ascii=False, default=str) for result in results)
+        return (f"{self.merge_prompt}\n\nTask:\n```\n{self.prompt}\n```\n\n"
+                f"Results of the parts, in order:\n```\n{parts}\n```{self.merge_suffix}")
+
+    def combine(self, results: list[dict]) -> dict:
+        """Combine the `results` of the chunks (in order) field by field."""
+        combined = {}
+        for field, aggregation in self.aggregations.items():
+            value = aggregate([result[field] for result in results], aggregation)
+            if self.output_types.get(field) == 'int' and isinstance(value, float):
+                value = round(value)
+            combined[field] = value
+        return combined
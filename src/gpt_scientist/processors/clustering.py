@@ -0,0 +1,123 @@
+"""Near-duplicate detection with MinHash and locality-sensitive hashing (LSH)."""
+
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Default number of MinHash permutations
+NUM_PERM = 64
+
+# Number of consecutive words in a shingle
+SHINGLE_SIZE = 3
+
+# Number of texts processed at once, and the maximum number of (permutation, shingle) cells computed at once;
+# together they bound the memory used by the pre-pass
+CHUNK_ROWS = 5000
+MAX_CELLS = 8_000_000
+
+# Prime modulus for the MinHash permutations (the largest prime below 2^32)
+MERSENNE_PRIME = np.uint64(4294967291)
+
+URL_PATTERN = r'https?://\S+|www\.\S+'
+
+
+def normalize_text(texts: pd.Series) -> pd.Series:
+    """Lowercase, drop URLs and punctuation, and collapse whitespace."""
+    return (texts.str.lower()
+            .str.replace(URL_PATTERN, ' ', regex=True)
+            .str.replace(r'[^\w\s]', ' ', regex=True)
+            .str.replace(r'\s+', ' ', regex=True)
+            .str.strip())
+
+
+def shingle_hashes(texts: pd.Series, shingle_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return 32-bit hashes of all word shingles of `texts` (which must have a 0-based positional index),
+    together with the position of the text each shingle belongs to.
+    Every text also gets a shingle for its whole content, so that texts shorter than a shingle are not empty.
+    """
+    words = texts.str.split().explode()
+    docs = words.index.to_numpy()
+    present = words.notna().to_numpy()
+    word_hashes = pd.util.hash_array(words.fillna('').to_numpy(dtype=object))
+
+    hashes = word_hashes.copy()
+    valid = present.copy()
+    for k in range(1, shingle_size):
+        # Combine every word with the k-th next one, as long as it is in the same text
+        shifted = np.roll(word_hashes, -k)
+        valid &= np.roll(docs, -k) == docs
+        valid[-k:] = False
+        hashes = hashes * np.uint64(1000003) + shifted
+
+    whole = pd.util.hash_array(texts.to_numpy(dtype=object))
+    hashes = np.concatenate([hashes[valid], whole])
+    docs = np.concatenate([docs[valid], np.arange(len(texts))])
+    return (hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xFFFFFFFF), docs
+
+
+def minhash_signatures(texts: pd.Series, num_perm: int, shingle_size: int, seed: int = 0) -> np.ndarray:
+    """Compute the MinHash signatures (one row of `num_perm` values per text) of a chunk of texts."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(MERSENNE_PRIME), num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(MERSENNE_PRIME), num_perm, dtype=np.uint64)
+
+    hashes, docs = shingle_hashes(texts.reset_index(drop=True), shingle_size)
+    order = np.argsort(docs, kind='stable')
+    hashes = hashes[order]
+    starts = np.searchsorted(docs[order], np.arange(len(texts)))
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    block = max(1, MAX_CELLS // max(len(hashes), 1))
+    for p in range(0, num_perm, block):
+        values = (a[p:p + block, None] * hashes[None, :] + b[p:p + block, None]) % MERSENNE_PRIME
+        signatures[:, p:p + block] = np.minimum.reduceat(values, starts, axis=1).T
+    return signatures
+
+
+def lsh_bands(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    Choose the number of bands and rows per band so that texts with Jaccard similarity around `threshold`
+    have a 50% chance of sharing a band.
+    """
+    divisors = [r for r in range(1, num_perm + 1) if num_perm % r == 0]
+    rows = min(divisors, key=lambda r: abs((1 / (num_perm // r)) ** (1 / r) - threshold))
+    return num_perm // rows, rows
+
+
+def band_keys(signatures: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """Hash every band of every signature into a single 64-bit key."""
+    keys = np.zeros((len(signatures), bands), dtype=np.uint64)
+    for j in range(bands):
+        for t in range(rows):
+            keys[:, j] = keys[:, j] * np.uint64(0x100000001B3) + signatures[:, j * rows + t].astype(np.uint64)
+    return keys
+
+
+def cluster_near_duplicates(texts: pd.Series, threshold: float = 0.8, num_perm: int = NUM_PERM,
+                            shingle_size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Group texts whose normalized word shingles have estimated Jaccard similarity above roughly `threshold`.
+    Return an array that maps every position in `texts` to the position of the first text in its cluster.
+    Texts are processed in chunks, and only the LSH band keys (not the signatures) of all texts are kept in memory.
+    """
+    bands, rows = lsh_bands(num_perm, threshold)
+    keys = np.empty((len(texts), bands), dtype=np.uint64)
+    for start in range(0, len(texts), CHUNK_ROWS):
+        chunk = normalize_text(texts.iloc[start:start + CHUNK_ROWS].astype(str))
+        keys[start:start + CHUNK_ROWS] = band_keys(minhash_signatures(chunk, num_perm, shingle_size), bands, rows)
+
+    # Texts that share any band are in the same cluster: propagate the smallest position through shared keys
+    labels = np.arange(len(texts))
+    changed = True
+    while changed:
+        changed = False
+        for j in range(bands):
+            smallest = pd.Series(labels).groupby(keys[:, j]).transform('min').to_numpy()
+            smallest = labels[smallest]  # Follow labels to their own labels to converge faster
+            if (smallest < labels).any():
+                labels = np.minimum(labels, smallest)
+                changed = True
+    return labels
@@ -2,16 +2,27 @@
 
 import asyncio
 import logging
+import numpy as np
 import pandas as pd
-from typing import Callable, Iterable
+from typing import Callable, Iterable, Optional, Sequence
 from gpt_scientist.llm.client import LLMClient
 from gpt_scientist.stats import JobStats
-from gpt_scientist.processors.workers import writer, analyze_row_worker, similarity_row_worker
-from gpt_scientist.llm.prompts import create_example_messages
-from gpt_scientist.config import is_embedding_model, DEFAULT_MODEL, DEFAULT_EMBEDDING_MODEL
+from gpt_scientist.tracing import Tracer
+from gpt_scientist.processors.workers import writer, analyze_row_worker, analyze_chunked_row_worker, similarity_row_worker
+from gpt_scientist.processors.chunking import Chunker
+from gpt_scientist.processors.examples import ExampleSelector
+from gpt_scientist.processors.scheduling import schedule_rows
+from gpt_scientist.processors.results import ResultBatch
+from gpt_scientist.processors.clustering import cluster_near_duplicates
+from gpt_scientist.llm.prompts import PromptTemplate, create_example_messages
+from gpt_scientist.llm.schema import OutputType, convert_column, empty_column
+from gpt_scientist.config import is_embedding_model, DEFAULT_MODEL, DEFAULT_EMBEDDING_MODEL, INHERITED_FIELD, CHUNK_OVERLAP
 
 logger = logging.getLogger(__name__)
 
+# How often (in seconds) the scheduler checks whether the cost of the first row is known yet
+BUDGET_POLL_INTERVAL = 0.05
+
 
 def validate_input(data: pd.DataFrame, input_fields: list[str], output_fields: list[str],
                    is_similarity: bool, model: str, pricing: dict) -> str:
@@ -49,29 +60,159 @@ def validate_input(data: pd.DataFrame, input_fields: list[str], output_fields: l
     return adjusted_model
 
 
-def prepare_output_fields(data: pd.DataFrame, output_fields: list[str]):
+def prepare_output_fields(data: pd.DataFrame, output_fields: list[str],
+                          output_types: Optional[dict[str, OutputType]] = None):
     """
-    Ensure that all output fields are present in the dataframe.
-    If an output field is missing, create it with empty strings.
-    If an output field is present, convert it to string type.
+    Ensure that all output fields are present in the dataframe, with the column type of their output type.
+    Untyped fields are strings: if such a field is missing, create it with empty strings,
+    and if it is present, convert it to string type.
+    Typed fields are stored in nullable columns (e.g. Int64), where missing values mean no result yet.
     """
+    output_types = output_types or {}
     for field in output_fields:
-        if field not in data.columns:
+        if field in output_types:
+            if field not in data.columns:
+                data[field] = empty_column(data.index, output_types[field])
+            else:
+                data[field] = convert_column(data[field], output_types[field])
+        elif field not in data.columns:
             # If the output field is not in the dataframe, add it
             data[field] = ''
         else:
             # Otherwise, convert the field to string because the model will be returning strings
-            # TODO: in the future, we may want to specify the type of the output fields
             data[field] = data[field].fillna('').astype(str)
 
 
+def select_rows(data: pd.DataFrame, rows: Iterable[int], output_fields: list[str],
+                overwrite: bool, row_index_offset: int = 0, stats: Optional[JobStats] = None) -> np.ndarray:
+    """
+    Return (as an array, in the order given) those of `rows` that need to be processed:
+    rows that exist in the data, and unless `overwrite` is set, where none of the output fields are filled.
+    The selection is vectorized over the output columns, so it is fast even for millions of rows.
+    If `stats` is given, the number of skipped rows is recorded there.
+    """
+    if isinstance(rows, range):
+        requested = np.arange(rows.start, rows.stop, rows.step, dtype=np.int64)
+    else:
+        requested = np.fromiter(rows, dtype=np.int64)
+
+    exists = (requested >= 0) & (requested < len(data))
+    missing = requested[~exists]
+    if len(missing) > 0:
+        shown = ', '.join(str(i + row_index_offset) for i in missing[:10])
+        logger.warning(f"Skipping {len(missing)} rows that do not exist: {shown}{', ...' if len(missing) > 10 else ''}")
+    requested = requested[exists]
+
+    filled = np.zeros(len(requested), dtype=bool)
+    if not overwrite:
+        # A row is filled if any of its output values is neither missing nor an empty string
+        for field in output_fields:
+            values = data[field].to_numpy(dtype=object)[requested]
+            values[pd.isna(values)] = ''
+            filled |= values != ''
+        if filled.any():
+            logger.info(f"Skipping {int(filled.sum())} rows that are already filled")
+
+    if stats is not None:
+        stats.rows_skipped = len(missing) + int(filled.sum())
+    return requested[~filled]
+
+
+def group_duplicates(data: pd.DataFrame, rows: np.ndarray, input_fields: list[str]) -> tuple[np.ndarray, dict[int, list[int]]]:
+    """
+    Group `rows` that have exactly the same values in all `input_fields` (and hence would be sent the same prompt).
+    Return the first row of every group, and a map from each of those rows to the other rows in its group.
+    """
+    if len(rows) == 0:
+        return rows, {}
+    values = data.loc[rows, input_fields].astype(str)
+    group_ids = values.groupby(input_fields, sort=False).ngroup().to_numpy()
+    representatives = pd.Series(rows).groupby(group_ids).transform('first').to_numpy()
+    is_first = rows == representatives
+    duplicates: dict[int, list[int]] = {}
+    for i, representative in zip(rows[~is_first].tolist(), representatives[~is_first].tolist()):
+        duplicates.setdefault(representative, []).append(i)
+    return rows[is_first], duplicates
+
+
+def group_near_duplicates(data: pd.DataFrame, rows: np.ndarray, input_fields: list[str], threshold: float,
+                          sample: int = 1) -> tuple[np.ndarray, dict[int, list[int]]]:
+    """
+    Cluster `rows` whose input field values are near-duplicates (see `cluster_near_duplicates`).
+    Return the rows to process, which are the first `sample` rows of every cluster,
+    and a map from the first row of every cluster to the other rows that inherit its response.
+    """
+    if len(rows) == 0:
+        return rows, {}
+    values = data.loc[rows, input_fields].astype(str)
+    texts = values[input_fields[0]]
+    if len(input_fields) > 1:
+        texts = texts.str.cat([values[field] for field in input_fields[1:]], sep='\n')
+    labels = cluster_near_duplicates(texts, threshold)
+    positions = pd.Series(labels)
+    sampled = (positions.groupby(labels).cumcount() < sample).to_numpy()
+    representatives = rows[labels]
+    duplicates: dict[int, list[int]] = {}
+    for i, representative in zip(rows[~sampled].tolist(), representatives[~sampled].tolist()):
+        duplicates.setdefault(representative, []).append(i)
+    return rows[sampled], duplicates
+
+
+def build_example_pool(data: pd.DataFrame, prompt: str, examples: Iterable[int], input_fields: list[str],
+                       output_fields: list[str], use_structured_outputs: bool,
+                       row_index_offset: int = 0,
+                       output_types: Optional[dict[str, OutputType]] = None) -> list[tuple[int, list, list[dict]]]:
+    """Turn the rows with indexes `examples` into few-shot examples: the row, its input field values, and its example messages."""
+    pool = []
+    for i in examples:
+        if i < 0 or i >= len(data):
+            logger.warning(f"Skipping example {i + row_index_offset} (no such row)")
+            continue
+        row = data.loc[i]
+        logger.info(f"Adding example row {i + row_index_offset}")
+        pool.append((i, [row[field] for field in input_fields],
+                     create_example_messages(prompt, row, input_fields, output_fields, use_structured_outputs, output_types)))
+    return pool
+
+
+def build_example_messages(data: pd.DataFrame, prompt: str, examples: Iterable[int], input_fields: list[str],
+                           output_fields: list[str], use_structured_outputs: bool,
+                           row_index_offset: int = 0,
+                           output_types: Optional[dict[str, OutputType]] = None) -> list[dict]:
+    """Turn the rows with indexes `examples` into few-shot example messages."""
+    return [message for _, _, messages in build_example_pool(data, prompt, examples, input_fields, output_fields,
+                                                             use_structured_outputs, row_index_offset, output_types)
+            for message in messages]
+
+
+def exceeds_budget(stats: JobStats, pending_rows: int, baseline: dict,
+                   max_cost: Optional[float], max_tokens: Optional[int]) -> bool:
+    """
+    Return True if admitting one more row would likely exceed the budget.
+    The spend is projected from what has been spent so far plus the average spend per processed row
+    for each pending row (admitted, but not yet processed) and for the new row.
+    `baseline` is the spend and the number of processed rows before the first row was admitted
+    (e.g. the spend on embedding similarity queries, or on earlier calls with the same `stats`, is not a per-row spend).
+    """
+    cost = stats.current_cost()
+    spent = {'cost': cost['input'] + cost['output'], 'tokens': stats.input_tokens + stats.output_tokens}
+    rows_processed = stats.rows_processed - baseline['rows']
+    for kind, limit in (('cost', max_cost), ('tokens', max_tokens)):
+        if limit is None:
+            continue
+        per_row = (spent[kind] - baseline[kind]) / rows_processed if rows_processed else 0
+        if spent[kind] + (pending_rows + 1) * per_row > limit:
+            return True
+    return False
+
+
 async def analyze_data(
     data: pd.DataFrame,
     prompt: str,
     similarity_queries: list[str],
     input_fields: list[str],
     output_fields: list[str],
-    write_output_rows: Callable[[pd.DataFrame, list[int]], None],
+    write_output_rows: Optional[Callable[[ResultBatch], None]],
     rows: Iterable[int],
     examples: Iterable[int],
     overwrite: bool,
@@ -79,19 +220,69 @@ async def analyze_data(
     similarity_mode: str,
     parallel_rows: int,
     stats: JobStats,
-    row_index_offset: int = 0
+    row_index_offset: int = 0,
+    tracer: Optional[Tracer] = None,
+    max_cost: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    deduplicate: bool = False,
+    near_duplicate_threshold: Optional[float] = None,
+    near_duplicate_sample: int = 1,
+    inherited_field: str = INHERITED_FIELD,
+    output_types: Optional[dict[str, OutputType]] = None,
+    chunk_tokens: Optional[int] = None,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    reduce: str | dict[str, str] = 'merge',
+    merge_prompt: Optional[str] = None,
+    examples_per_row: Optional[int] = None,
+    example_token_budget: Optional[int] = None,
+    example_embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    embedding_cache: Optional[dict] = None,
+    schedule: str = 'index',
+    result_buffer: Optional[int] = None,
+    row_labels: Optional[Sequence] = None,
+    prepared: Optional[dict] = None
 ):
     """
     Analyze all the `rows` in a pandas dataframe:
     for every value in the input_field column,
     send to the model the `prompt`, together with names and values of `input_fields`;
     parse `output_fields` from the response and write the current row into the dataframe.
-    The dataframe is modified in place.
-    `write_output_row` is a function used to save progress after every row (e.g. write to a spreadsheet where data came from).
+    The dataframe is modified in place; results are applied to it in bulk, so it is only complete once this function returns.
+    `write_output_rows` is a function used to save progress after every batch of rows
+    (e.g. write to a spreadsheet where data came from); it receives the results as a ResultBatch (None: nothing to save).
     `examples` is a sequence of row indexes to be used as few-shot examples for the model;
     if `overwrite` is false, rows where any of the `output_fields` is non-empty will be skipped;
     `row_index_offset` is only used for progress reporting,
     to account for the fact that the user might see a non-zero based row indexing.
+    `tracer`, if given, receives lifecycle events of every row (see gpt_scientist.tracing).
+    `max_cost` (in dollars) and `max_tokens` set a budget for the job: once the projected spend reaches it,
+    no more rows are admitted, rows in flight are finished and saved,
+    and the rows left unprocessed are recorded in `stats.unprocessed_rows`;
+    since those rows are left empty, running the job again resumes from where it stopped.
+    If `deduplicate` is set, rows with identical input field values are sent to the model only once,
+    and the response is written to all of them.
+    If `near_duplicate_threshold` is set, rows whose input field values are near-duplicates
+    (roughly, share at least that fraction of their word triples, after normalizing case, punctuation and URLs)
+    are clustered, only the first `near_duplicate_sample` rows of every cluster are sent to the model,
+    and the other rows inherit the response of the first one, with its label in the `inherited_field` column
+    (`row_labels` are the labels of the rows as the user sees them, by default their positions plus `row_index_offset`);
+    this subsumes `deduplicate`.
+    `output_types` maps output fields to their types (see gpt_scientist.llm.schema; other fields are strings);
+    responses are validated against these types and stored in typed columns.
+    In similarity mode, the output field is a float unless declared otherwise.
+    If `chunk_tokens` is set, input values longer than that many tokens are split into chunks that overlap by `chunk_overlap` tokens,
+    the chunks are processed in parallel, and their results are combined as specified by `reduce` and `merge_prompt`
+    (see gpt_scientist.processors.chunking.Chunker).
+    If `examples_per_row` is set, `examples` is a pool: every request gets only that many examples from it,
+    those most similar to the row (by the embeddings of `example_embedding_model`) that fit in `example_token_budget` tokens;
+    `embedding_cache` keeps the embeddings of the pool for later jobs (see gpt_scientist.processors.examples.ExampleSelector).
+    `schedule` is the order in which rows are processed: in the order given ('index'), or with long rows first,
+    so that they do not hold up the end of the job (see gpt_scientist.processors.scheduling.schedule_rows).
+    At most `result_buffer` (default: twice `parallel_rows`) results wait for the writer;
+    when the writer falls behind (e.g. the spreadsheet API is backing off), workers wait too instead of taking more rows,
+    so that memory use stays flat (the time they wait is recorded in `stats`).
+    `prepared`, if given, keeps the embeddings of the similarity queries and the few-shot examples
+    for later calls with the same job and data (e.g. for every batch of rows of a distributed worker), so they are prepared once.
     This function is asynchronous and uses `parallel_rows` workers to process this many rows in parallel,
     and a single writer to write the output rows.
     """
@@ -104,67 +295,126 @@ async def analyze_data(
         llm_client.model = adjusted_model
         stats.model = adjusted_model
 
-    prepare_output_fields(data, output_fields)
+    if is_similarity:
+        output_types = {output_fields[0]: 'float', **(output_types or {})}
+    prepare_output_fields(data, output_fields, output_types)
+    llm_client.set_output_types(output_types or {})
+    if near_duplicate_threshold is not None:
+        prepare_output_fields(data, [inherited_field])
+
+    # Extract the input values once, so that workers do not look up rows in the dataframe
+    columns = [data[field].to_numpy(dtype=object) for field in input_fields]
 
     # Create task queues
     row_queue = asyncio.Queue(2 * parallel_rows)  # Double the size to avoid blocking
-    output_queue = asyncio.Queue()
+    output_queue = asyncio.Queue(result_buffer or 2 * parallel_rows)  # Bounded, so that a slow writer holds back the workers
+    stats.watch_queue('row_queue', row_queue)
+    stats.watch_queue('output_queue', output_queue)
+    llm_client.set_stats(stats)
+    llm_client.set_tracer(tracer)
 
     # Prepare mode-specific setup and create worker coroutines
+    if prepared is None:
+        prepared = {}
     if is_similarity:
-        # Compute embeddings for the prompts
-        tasks = [llm_client.generate_embedding(q) for q in similarity_queries]
-        embeddings_and_tokens = await asyncio.gather(*tasks)
-        query_embeddings = [emb for emb, _ in embeddings_and_tokens]
-        input_tokens = sum(tokens for _, tokens in embeddings_and_tokens)
-        stats.input_tokens += input_tokens
+        if 'query_embeddings' not in prepared:
+            # Compute embeddings for the prompts
+            tasks = [llm_client.generate_embedding(q) for q in similarity_queries]
+            embeddings_and_tokens = await asyncio.gather(*tasks)
+            prepared['query_embeddings'] = [emb for emb, _ in embeddings_and_tokens]
+            input_tokens = sum(tokens for _, tokens in embeddings_and_tokens)
+            stats.input_tokens += input_tokens
+        query_embeddings = prepared['query_embeddings']
         # Create worker coroutines for similarity mode
         worker_coros = [
             similarity_row_worker(
-                data, query_embeddings, input_fields[0], output_fields[0],
-                row_queue, output_queue, llm_client, similarity_mode
+                columns[0], query_embeddings, output_fields[0],
+                row_queue, output_queue, llm_client, similarity_mode, tracer
             )
             for _ in range(parallel_rows)
         ]
     else:
         # Prepare the few-shot examples
-        example_messages = []
-        for i in examples:
-            if i < 0 or i >= len(data):
-                logger.warning(f"Skipping example {i + row_index_offset} (no such row)")
-                continue
-            row = data.loc[i]
-            logger.info(f"Adding example row {i + row_index_offset}")
-            example_messages.extend(create_example_messages(prompt, row, input_fields, output_fields,
-                                                            llm_client.use_structured_outputs))
+        if 'examples' not in prepared:
+            selector = None
+            example_messages = []
+            if examples_per_row is None:
+                example_messages = build_example_messages(data, prompt, examples, input_fields, output_fields,
+                                                          llm_client.use_structured_outputs, row_index_offset, output_types)
+            else:
+                pool = build_example_pool(data, prompt, examples, input_fields, output_fields,
+                                          llm_client.use_structured_outputs, row_index_offset, output_types)
+                selector = ExampleSelector(pool, examples_per_row, example_token_budget, example_embedding_model,
+                                           llm_client.model, embedding_cache)
+                stats.input_tokens += await selector.prepare(llm_client)
+            prepared['examples'] = (example_messages, selector)
+        example_messages, selector = prepared['examples']
         llm_client.set_examples(example_messages)
         # Create worker coroutines for analyze mode
-        worker_coros = [
-            analyze_row_worker(
-                data, prompt, input_fields, output_fields, row_queue, output_queue, llm_client
-            )
-            for _ in range(parallel_rows)
-        ]
+        template = PromptTemplate(prompt, input_fields, output_fields, llm_client.use_structured_outputs, output_types)
+        if chunk_tokens is None:
+            worker_coros = [
+                analyze_row_worker(
+                    template, columns, output_fields, row_queue, output_queue, llm_client, tracer, selector
+                )
+                for _ in range(parallel_rows)
+            ]
+        else:
+            chunker = Chunker(prompt, output_fields, llm_client.model, llm_client.use_structured_outputs,
+                              chunk_tokens, chunk_overlap, reduce, merge_prompt, output_types)
+            requests = asyncio.Semaphore(parallel_rows)
+            worker_coros = [
+                analyze_chunked_row_worker(
+                    template, columns, output_fields, row_queue, output_queue, llm_client, chunker, requests, stats, tracer, selector
+                )
+                for _ in range(parallel_rows)
+            ]
 
     # Start workers and writer in a task group
     async with asyncio.TaskGroup() as tg:
         # Start all workers
         for worker_coro in worker_coros:
             tg.create_task(worker_coro)
+        # Decide which rows to process up front, so that progress can be reported against the total
+        rows_to_process = select_rows(data, rows, output_fields, overwrite, row_index_offset, stats)
+        duplicates: dict[int, list[int]] = {}
+        if near_duplicate_threshold is not None:
+            rows_to_process, duplicates = await asyncio.to_thread(
+                group_near_duplicates, data, rows_to_process, input_fields, near_duplicate_threshold, near_duplicate_sample)
+            stats.rows_inherited = sum(len(d) for d in duplicates.values())
+            logger.info(f"Found {stats.rows_inherited} near-duplicate rows; they will inherit the responses of their clusters")
+        elif deduplicate:
+            rows_to_process, duplicates = group_duplicates(data, rows_to_process, input_fields)
+            stats.duplicates_skipped = sum(len(d) for d in duplicates.values())
+            logger.info(f"Found {stats.duplicates_skipped} duplicate rows; they will get the same responses as the originals")
+        rows_to_process = schedule_rows(data, rows_to_process, input_fields, schedule)
+        stats.set_total_rows(len(rows_to_process))
+        logger.info(f"Queued {len(rows_to_process)} rows for processing ({stats.rows_skipped} skipped)")
+
         # Start writer
-        tg.create_task(writer(output_queue, write_output_rows, data, stats, row_index_offset))
-
-        # Add rows to be processed by the workers
-        for i in rows:
-            if i < 0 or i >= len(data):
-                logger.warning(f"Skipping row {i + row_index_offset} (no such row)")
-                continue
-            row = data.loc[i]
-            if not overwrite and any(row[field] for field in output_fields):
-                # If any of the output fields is already filled, skip the row
-                logger.debug(f"Skipping row {i + row_index_offset} (already filled)")
-                continue
+        tg.create_task(writer(output_queue, write_output_rows, data, output_fields, stats, row_index_offset, tracer, duplicates,
+                              inherited_field if near_duplicate_threshold is not None else None, row_labels))
+
+        # Add rows to be processed by the workers, as long as they fit in the budget
+        has_budget = max_cost is not None or max_tokens is not None
+        cost = stats.current_cost()
+        baseline = {'cost': cost['input'] + cost['output'], 'tokens': stats.input_tokens + stats.output_tokens,
+                    'rows': stats.rows_processed}
+        admitted = 0
+        for k, i in enumerate(map(int, rows_to_process)):
+            if has_budget:
+                # The cost of a row is unknown until the first one is done, so wait for it
+                while admitted > 0 and stats.rows_processed == baseline['rows']:
+                    await asyncio.sleep(BUDGET_POLL_INTERVAL)
+                if exceeds_budget(stats, admitted - (stats.rows_processed - baseline['rows']), baseline, max_cost, max_tokens):
+                    stats.unprocessed_rows = sorted(j for i in rows_to_process[k:].tolist() for j in [i] + duplicates.get(i, []))
+                    logger.warning(f"Stopping early to stay within the budget: {len(stats.unprocessed_rows)} rows will not be processed "
+                                   f"(starting with row {i + row_index_offset}). Run the analysis again to resume.")
+                    break
             await row_queue.put(i)
+            admitted += 1
+            if tracer:
+                tracer.instant('row_enqueued', row=i)
 
         # Wait for input processing to finish
         await row_queue.join()
@@ -3,9 +3,13 @@
 import os
 import asyncio
 import pandas as pd
-from typing import Iterable, Optional
+from typing import Awaitable, Callable, Iterable, Optional
+from gpt_scientist.config import CSV_FIRST_ROW
 from gpt_scientist.llm.client import LLMClient
 from gpt_scientist.processors.core import analyze_data
+from gpt_scientist.processors.estimate import estimate_data
+from gpt_scientist.processors.results import ResultBatch
+from gpt_scientist.processors.tasks import Task, analyze_tasks
 from gpt_scientist.stats import JobStats
 from gpt_scientist.verification.quotes import check_quotes
 
@@ -21,29 +25,82 @@ async def analyze_csv(
     llm_client: LLMClient,
     similarity_mode: str,
     parallel_rows: int,
-    stats: JobStats
+    stats: JobStats,
+    estimate_options: Optional[dict] = None,
+    **options
 ):
-    """Analyze a CSV file (in place) - async version."""
+    """
+    Analyze a CSV file (in place) - async version.
+    If `estimate_options` is not None, this is a dry run: the file is not modified,
+    and the result of `estimate_data` (called with these options) is returned.
+    `options` are passed on to `analyze_data`; rows with inherited responses get the line number of the row they inherited from.
+    """
+    if estimate_options is not None:
+        data = await asyncio.to_thread(pd.read_csv, path, dtype=str, na_filter=False)
+        return await estimate_data(data, prompt, similarity_queries, input_fields, output_fields,
+                                   range(len(data)) if rows is None else rows, examples or [], overwrite,
+                                   llm_client, parallel_rows, stats, output_types=options.get('output_types'),
+                                   **estimate_options)
+
+    async def analyze(data: pd.DataFrame, write_output_rows: Callable[[ResultBatch], None]):
+        await analyze_data(data, prompt, similarity_queries, input_fields, output_fields,
+                           write_output_rows, range(len(data)) if rows is None else rows, examples or [], overwrite, llm_client,
+                           similarity_mode, parallel_rows, stats,
+                           row_labels=pd.RangeIndex(CSV_FIRST_ROW, CSV_FIRST_ROW + len(data)), **options)
+
+    await analyze_csv_file(path, analyze)
+
+
+async def analyze_csv_tasks(
+    path: str,
+    tasks: list[Task],
+    rows: Optional[Iterable[int]],
+    overwrite: bool,
+    llm_client: LLMClient,
+    parallel_rows: int,
+    stats: JobStats,
+    **options
+):
+    """
+    Analyze a CSV file (in place) with several tasks in one pass (see `analyze_tasks`),
+    so that the file is read and written only once. `options` are passed on to `analyze_tasks`.
+    """
+    output_fields = [field for task in tasks for field in task.output_fields]
+
+    async def analyze(data: pd.DataFrame, write_output_rows: Callable[[ResultBatch], None]):
+        await analyze_tasks(data, tasks, write_output_rows, range(len(data)) if rows is None else rows, overwrite,
+                            llm_client, parallel_rows, stats, **options)
+
+    await analyze_csv_file(path, analyze, output_fields)
+
+
+async def analyze_csv_file(
+    path: str,
+    analyze: Callable[[pd.DataFrame, Callable[[ResultBatch], None]], Awaitable[None]],
+    output_fields: Optional[list[str]] = None
+):
+    """
+    Read the CSV file at `path`, run `analyze` on its data with a function that saves the progress,
+    and write the data back to the file (even if the analysis fails).
+    The progress is saved to a backup file next to `path` (`<name>_output_<timestamp>.csv`), which is removed
+    once the data is written back. It holds the results only: the row index (the position of the row in the file)
+    and the output columns, without the input columns; to recover results from it, join it with the file by row index.
+    If batches have different fields (as in a multi-task job), `output_fields` are the columns of the backup file.
+    """
     # Create a unique output file name based on current time;
-    # this file only serves as a backup, in case the finally block fails to run
+    # this file only serves as a backup of the results (by row index), in case the finally block fails to run
     out_file_name = os.path.splitext(path)[0] + f'_output_{pd.Timestamp.now().strftime("%Y%m%d%H%M%S")}.csv'
 
-    def write_output_rows(data, indices):
-        # Append the rows to the output file
-        data.loc[indices].to_csv(out_file_name, mode='a', header=False, index=True)
+    def write_output_rows(batch):
+        # Append the results to the output file, with headers at the top
+        frame = batch.to_frame() if output_fields is None else batch.to_frame().reindex(columns=output_fields)
+        frame.to_csv(out_file_name, mode='a', header=os.path.getsize(out_file_name) == 0, index=True)
 
     # Use asyncio.to_thread for blocking I/O operations
     data = await asyncio.to_thread(pd.read_csv, path, dtype=str, na_filter=False)
-    # Write headers once at the top
-    await asyncio.to_thread(data.iloc[[]].to_csv, out_file_name, mode='w', index=True)
-    if rows is None:
-        rows = range(len(data))
-    if examples is None:
-        examples = []
+    await asyncio.to_thread(lambda: open(out_file_name, 'w').close())
     try:
-        await analyze_data(data, prompt, similarity_queries, input_fields, output_fields,
-                          write_output_rows, rows, examples, overwrite, llm_client,
-                          similarity_mode, parallel_rows, stats)
+        await analyze(data, write_output_rows)
     except Exception as e:
         raise RuntimeError(f"Error analyzing CSV: {e}")
     finally:
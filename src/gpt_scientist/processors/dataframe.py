@@ -0,0 +1,119 @@
+"""In-memory dataframe processing."""
+
+import pandas as pd
+from typing import Awaitable, Callable, Iterable, Optional
+from gpt_scientist.llm.client import LLMClient
+from gpt_scientist.processors.core import analyze_data
+from gpt_scientist.processors.estimate import estimate_data
+from gpt_scientist.processors.results import ResultBatch
+from gpt_scientist.processors.tasks import Task, analyze_tasks
+from gpt_scientist.stats import JobStats
+
+
+async def analyze_dataframe(
+    data: pd.DataFrame,
+    prompt: str,
+    similarity_queries: list[str],
+    input_fields: list[str],
+    output_fields: list[str],
+    rows: Optional[Iterable[int]],
+    examples: Optional[Iterable[int]],
+    overwrite: bool,
+    llm_client: LLMClient,
+    similarity_mode: str,
+    parallel_rows: int,
+    stats: JobStats,
+    estimate_options: Optional[dict] = None,
+    in_place: bool = False,
+    write_output_rows: Optional[Callable[[ResultBatch], None]] = None,
+    **options
+):
+    """
+    Analyze a dataframe held in memory - async version.
+    `rows` and `examples` are positions of rows (not index labels).
+    Return a copy of `data` with the output fields filled in,
+    or, if `in_place` is set, write them directly into `data` (without copying it) and return it.
+    `write_output_rows`, if given, is called (in a separate thread) with every batch of results to save the progress;
+    the batch has the index labels of the rows.
+    If `estimate_options` is not None, this is a dry run: `data` is not modified,
+    and the result of `estimate_data` (called with these options) is returned.
+    `options` are passed on to `analyze_data`; rows with inherited responses get the index label of the row they inherited from.
+    """
+    if rows is None:
+        rows = range(len(data))
+    if examples is None:
+        examples = []
+
+    if estimate_options is not None:
+        return await estimate_data(data.reset_index(drop=True), prompt, similarity_queries, input_fields, output_fields,
+                                   rows, examples, overwrite, llm_client, parallel_rows, stats,
+                                   output_types=options.get('output_types'), **estimate_options)
+
+    labels = data.index
+
+    async def analyze(data: pd.DataFrame, save: Optional[Callable[[ResultBatch], None]]):
+        await analyze_data(data, prompt, similarity_queries, input_fields, output_fields,
+                           save, rows, examples, overwrite, llm_client,
+                           similarity_mode, parallel_rows, stats, row_labels=labels, **options)
+
+    return await analyze_positional(data, analyze, in_place, write_output_rows)
+
+
+async def analyze_dataframe_tasks(
+    data: pd.DataFrame,
+    tasks: list[Task],
+    rows: Optional[Iterable[int]],
+    overwrite: bool,
+    llm_client: LLMClient,
+    parallel_rows: int,
+    stats: JobStats,
+    in_place: bool = False,
+    write_output_rows: Optional[Callable[[ResultBatch], None]] = None,
+    **options
+):
+    """
+    Analyze a dataframe held in memory with several tasks in one pass (see `analyze_tasks`), otherwise like `analyze_dataframe`.
+    `write_output_rows` is called with a separate batch for every task.
+    """
+    async def analyze(data: pd.DataFrame, save: Optional[Callable[[ResultBatch], None]]):
+        await analyze_tasks(data, tasks, save, range(len(data)) if rows is None else rows, overwrite,
+                            llm_client, parallel_rows, stats, **options)
+
+    return await analyze_positional(data, analyze, in_place, write_output_rows)
+
+
+async def analyze_positional(
+    data: pd.DataFrame,
+    analyze: Callable[[pd.DataFrame, Optional[Callable[[ResultBatch], None]]], Awaitable[None]],
+    in_place: bool,
+    write_output_rows: Optional[Callable[[ResultBatch], None]]
+) -> pd.DataFrame:
+    """
+    Run `analyze` on `data` (or a copy, unless `in_place` is set) with a positional index,
+    passing it a function that saves batches with `write_output_rows` under the original index labels
+    (or None if `write_output_rows` is not given, so that there is nothing to save).
+    Return the analyzed dataframe, with its original index.
+    """
+    if not in_place:
+        data = data.copy()
+    # Rows are processed by position, so temporarily give the frame a positional index (this does not copy the data)
+    labels = data.index
+    positional = labels.equals(pd.RangeIndex(len(data)))
+    if not positional:
+        data.index = pd.RangeIndex(len(data))
+
+    def save(batch: ResultBatch):
+        assert write_output_rows is not None
+        if not positional:
+            relabeled = ResultBatch(batch.fields)
+            relabeled.rows = labels[batch.rows].tolist()
+            relabeled.values = batch.values
+            batch = relabeled
+        write_output_rows(batch)
+
+    try:
+        await analyze(data, save if write_output_rows is not None else None)
+    finally:
+        if not positional:
+            data.index = labels
+    return data
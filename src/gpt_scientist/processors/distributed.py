@@ -0,0 +1,461 @@
+"""
+Distributed processing: several processes (possibly on several machines sharing a filesystem)
+pull leases on rows from a file-based work queue and process them with `analyze_data`.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+import pandas as pd
+from typing import Iterable, Optional
+from openai import AsyncOpenAI
+from gpt_scientist.llm.client import LLMClient
+from gpt_scientist.llm.http import ConnectionPool
+from gpt_scientist.llm.router import create_router
+from gpt_scientist.config import CSV_FIRST_ROW
+from gpt_scientist.processors.core import (analyze_data, group_duplicates, group_near_duplicates, prepare_output_fields,
+                                           select_rows, validate_input)
+from gpt_scientist.stats import JobStats
+
+logger = logging.getLogger(__name__)
+
+# How long (in seconds) a worker owns leased rows before others may reclaim them
+DEFAULT_LEASE_SECONDS = 300
+
+# How many times a row may be leased before it is given up on (e.g. because it keeps crashing workers)
+MAX_ATTEMPTS = 3
+
+# How often (in seconds) idle workers check for expired leases
+POLL_INTERVAL = 5.0
+
+
+class WorkQueue:
+    """
+    A queue of rows backed by an SQLite file.
+    Every row is 'pending', 'leased' (to a worker, until the lease expires), 'done' (with a result), or 'failed'.
+    Leases are taken in exclusive transactions, so any number of processes can share the queue;
+    rows whose lease expired (because the worker died) are leased again.
+    Note that SQLite relies on file locking, which some network filesystems implement poorly.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS rows_status ON rows(status, lease_expires)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS workers (
+                worker TEXT PRIMARY KEY,
+                rows_processed INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                cost REAL NOT NULL DEFAULT 0,
+                allowed_cost REAL NOT NULL DEFAULT 0,
+                allowed_tokens INTEGER NOT NULL DEFAULT 0,
+                running INTEGER NOT NULL DEFAULT 1)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS worker_models (
+                worker TEXT,
+                model TEXT,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                escalations INTEGER,
+                PRIMARY KEY (worker, model))""")
+
+    @contextmanager
+    def _connect(self):
+        # A new connection per operation, so that the queue can be used from worker threads
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add_rows(self, rows: Iterable[int]):
+        """Add rows to the queue; rows that previously failed are retried, rows already queued or done are kept as is."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR IGNORE INTO rows (row) VALUES (?)", ((int(i),) for i in rows))
+            conn.execute("UPDATE rows SET status = 'pending', attempts = 0 WHERE status = 'failed'")
+            conn.execute("COMMIT")
+
+    def lease(self, worker: str, n: int) -> list[int]:
+        """Lease up to `n` pending (or expired) rows to `worker`."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE rows SET status = 'failed' WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (now, MAX_ATTEMPTS))
+            rows = [row for (row,) in conn.execute(
+                "SELECT row FROM rows WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY row LIMIT ?",
+                (now, n))]
+            conn.executemany(
+                "UPDATE rows SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE row = ?",
+                ((worker, now + self.lease_seconds, row) for row in rows))
+            conn.execute("COMMIT")
+        return rows
+
+    def renew(self, worker: str):
+        """Extend the leases of all rows currently leased to `worker`."""
+        with self._connect() as conn:
+            conn.execute("UPDATE rows SET lease_expires = ? WHERE owner = ? AND status = 'leased'",
+                         (time.time() + self.lease_seconds, worker))
+
+    def complete(self, results: list[tuple[int, dict]]):
+        """Store the results of processed rows."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE rows SET status = 'done', result = ? WHERE row = ? AND status != 'done'",
+                             ((json.dumps(result, default=_to_json), row) for row, result in results))
+            conn.execute("COMMIT")
+
+    def release(self, worker: str, rows: list[int]):
+        """Mark those of `rows` that are still leased to `worker` (i.e. no valid response was generated) as failed."""
+        with self._connect() as conn:
+            conn.executemany("UPDATE rows SET status = 'failed' WHERE row = ? AND owner = ? AND status = 'leased'",
+                             ((row, worker) for row in rows))
+
+    def return_rows(self, worker: str, rows: list[int]):
+        """Put those of `rows` that are still leased to `worker` back in the queue (e.g. the budget ran out before they were processed)."""
+        with self._connect() as conn:
+            conn.executemany("UPDATE rows SET status = 'pending', owner = NULL, attempts = attempts - 1 "
+                             "WHERE row = ? AND owner = ? AND status = 'leased'",
+                             ((row, worker) for row in rows))
+
+    def pending(self) -> list[int]:
+        """Rows that are waiting for a worker: pending, or leased with an expired lease."""
+        with self._connect() as conn:
+            return [row for (row,) in conn.execute(
+                "SELECT row FROM rows WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY row",
+                (time.time(),))]
+
+    def active_workers(self) -> int:
+        """Number of workers that hold unexpired leases."""
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(DISTINCT owner) FROM rows WHERE status = 'leased' AND lease_expires >= ?",
+                                    (time.time(),)).fetchone()
+        return count
+
+    def unfinished(self) -> int:
+        """Number of rows that are pending or leased."""
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM rows WHERE status IN ('pending', 'leased')").fetchone()
+        return count
+
+    def results(self) -> Iterable[tuple[int, dict]]:
+        """All stored results."""
+        with self._connect() as conn:
+            for row, result in conn.execute("SELECT row, result FROM rows WHERE status = 'done'"):
+                yield row, json.loads(result)
+
+    def register(self, workers: list[str]):
+        """Add workers that are about to start, so that they get their shares of the budget from the start (see `allow`)."""
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO workers (worker) VALUES (?)", ((worker,) for worker in workers))
+
+    def finish(self, worker: str):
+        """Record that `worker` stopped, so that it no longer gets a share of the budget."""
+        with self._connect() as conn:
+            conn.execute("UPDATE workers SET running = 0 WHERE worker = ?", (worker,))
+
+    def allow(self, worker: str, stats: JobStats, max_cost: Optional[float], max_tokens: Optional[int]) -> Optional[dict]:
+        """
+        Give `worker` (with JobStats `stats`) its share of what is left of the budget of the job, for its next batch,
+        and return the share as the `max_cost` and `max_tokens` of `analyze_data` (which count what the worker has already spent).
+        What is left is what the other workers have not spent or (if they are still running) been allowed to spend,
+        and it is split evenly among the running workers.
+        Return None if the share would not cover another row (at the average spend of the worker's rows so far).
+        """
+        cost = stats.current_cost()
+        own = {'cost': cost['input'] + cost['output'], 'tokens': stats.input_tokens + stats.output_tokens}
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            others_cost, others_tokens, running = conn.execute(
+                "SELECT COALESCE(SUM(CASE WHEN running THEN MAX(cost, allowed_cost) ELSE cost END), 0), "
+                "COALESCE(SUM(CASE WHEN running THEN MAX(input_tokens + output_tokens, allowed_tokens) "
+                "ELSE input_tokens + output_tokens END), 0), "
+                "COALESCE(SUM(running), 0) FROM workers WHERE worker != ?", (worker,)).fetchone()
+            others = {'cost': others_cost, 'tokens': others_tokens}
+            allowed = {}
+            for kind, limit in (('cost', max_cost), ('tokens', max_tokens)):
+                if limit is None:
+                    continue
+                share = (limit - others[kind] - own[kind]) / (running + 1)
+                if share <= 0 or (stats.rows_processed and share < own[kind] / stats.rows_processed):
+                    conn.execute("COMMIT")
+                    return None
+                allowed[kind] = own[kind] + share
+            conn.execute("INSERT INTO workers (worker, allowed_cost, allowed_tokens) VALUES (?, ?, ?) "
+                         "ON CONFLICT (worker) DO UPDATE SET allowed_cost = excluded.allowed_cost, "
+                         "allowed_tokens = excluded.allowed_tokens, running = 1",
+                         (worker, allowed.get('cost', 0), int(allowed.get('tokens', 0))))
+            conn.execute("COMMIT")
+        return {f'max_{kind}': value for kind, value in allowed.items()}
+
+    def record_stats(self, worker: str, stats: JobStats):
+        """Save the totals of a worker's JobStats."""
+        cost = stats.current_cost()
+        with self._connect() as conn:
+            conn.execute("INSERT INTO workers (worker, rows_processed, errors, input_tokens, output_tokens, cost) "
+                         "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (worker) DO UPDATE SET "
+                         "rows_processed = excluded.rows_processed, errors = excluded.errors, input_tokens = excluded.input_tokens, "
+                         "output_tokens = excluded.output_tokens, cost = excluded.cost",
+                         (worker, stats.rows_processed, stats.errors, stats.input_tokens, stats.output_tokens,
+                          cost['input'] + cost['output']))
+            conn.executemany("INSERT OR REPLACE INTO worker_models VALUES (?, ?, ?, ?, ?)",
+                             ((worker, model, usage['input_tokens'], usage['output_tokens'], stats.escalations.get(model, 0))
+                              for model, usage in stats.usage_by_model.items()))
+
+    def aggregate_stats(self, stats: JobStats):
+        """Add the totals of all workers to `stats`."""
+        with self._connect() as conn:
+            rows, errors, input_tokens, output_tokens = conn.execute(
+                "SELECT COALESCE(SUM(rows_processed), 0), COALESCE(SUM(errors), 0), "
+                "COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0) FROM workers").fetchone()
+            by_model = conn.execute(
+                "SELECT model, SUM(input_tokens), SUM(output_tokens), SUM(escalations) FROM worker_models GROUP BY model").fetchall()
+        stats.rows_processed += rows
+        stats.errors += errors
+        stats.input_tokens += input_tokens
+        stats.output_tokens += output_tokens
+        for model, input_tokens, output_tokens, escalations in by_model:
+            stats.log_model_usage(model, input_tokens, output_tokens)
+            if escalations:
+                stats.escalations[model] = stats.escalations.get(model, 0) + escalations
+
+
+def _to_json(value):
+    """Convert numpy scalars (and anything else json does not know) for storage in the queue."""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def worker_name(index: int) -> str:
+    """A name for the `index`th worker process that this process starts, unique across hosts and runs."""
+    return f"{socket.gethostname()}:{os.getpid()}:{time.time_ns()}:{index}"
+
+
+async def run_queue_worker(
+    queue: WorkQueue,
+    worker: str,
+    data: pd.DataFrame,
+    job: dict,
+    llm_client: LLMClient,
+    similarity_mode: str,
+    parallel_rows: int,
+    stats: JobStats,
+    batch_size: int
+):
+    """
+    Lease batches of rows from the queue and process them with `analyze_data`, storing the results in the queue,
+    until no rows are pending or leased to other workers, or the budget of the job runs out.
+    `job` holds the prompt, similarity_queries, input_fields, output_fields, output_types, examples, the budget (max_cost, max_tokens),
+    and the chunking, example selection, scheduling and result_buffer options of the job.
+    The budget is shared by all workers through the queue (see `WorkQueue.allow`): a worker gets a share of what is left
+    for every batch, and rows that it did not process because its share ran out are put back in the queue;
+    it stops once its share does not cover another row.
+    """
+    output_fields = job['output_fields']
+    options = {**job.get('chunking', {}), **job.get('example_selection', {}), 'schedule': job.get('schedule', 'index'),
+               'result_buffer': job.get('result_buffer')}
+    max_cost, max_tokens = job.get('max_cost'), job.get('max_tokens')
+    has_budget = max_cost is not None or max_tokens is not None
+    prepared: dict = {}  # Embed the similarity queries and prepare the examples once, not for every batch
+
+    def write_output_rows(batch):
+        queue.complete(list(batch.records()))
+        queue.renew(worker)
+
+    while True:
+        budget = {}
+        if has_budget:
+            budget = await asyncio.to_thread(queue.allow, worker, stats, max_cost, max_tokens)
+            if budget is None:
+                logger.info(f"Worker {worker} stops: the budget of the job is spent")
+                break
+        rows = await asyncio.to_thread(queue.lease, worker, batch_size)
+        if not rows:
+            if await asyncio.to_thread(queue.unfinished) == 0:
+                break
+            # Other workers still hold leases: wait in case they expire
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+        logger.info(f"Worker {worker} leased {len(rows)} rows")
+        # The rows were selected when the job was created, so process them even if they have outputs
+        stats.unprocessed_rows = []
+        await analyze_data(data, job['prompt'], job['similarity_queries'], job['input_fields'], output_fields,
+                           write_output_rows, rows, job['examples'], True, llm_client,
+                           similarity_mode, parallel_rows, stats, output_types=job.get('output_types'),
+                           prepared=prepared, **budget, **options)
+        if stats.unprocessed_rows:
+            await asyncio.to_thread(queue.return_rows, worker, stats.unprocessed_rows)
+        await asyncio.to_thread(queue.release, worker, rows)
+        # Record the spend after every batch, so that the other workers see what is left of the budget
+        await asyncio.to_thread(queue.record_stats, worker, stats)
+    await asyncio.to_thread(queue.finish, worker)
+
+
+async def csv_worker(settings: dict, path: str, queue_path: str, job: dict, worker: str, batch_size: int):
+    """Run a queue worker over the CSV file at `path`; `settings` are the LLM client and processing settings."""
+    pool = ConnectionPool(**settings['connection_pool'])
+    http_client = pool.http_client(settings['parallel_rows'])
+    if settings['endpoints']:
+        client = create_router(settings['endpoints'], http_client)
+    else:
+        client = AsyncOpenAI(api_key=settings['api_key'], base_url=settings['base_url'], http_client=http_client,
+                             max_retries=0)
+    llm_client = LLMClient(client, **settings['llm'])
+    llm_client.set_cascade(**settings['cascade'])
+    llm_client.set_streaming(settings['streaming'])
+    stats = JobStats(llm_client.model, llm_client.pricing, settings['report_interval'])
+    stats.watch_connections(pool.stats)
+    data = await asyncio.to_thread(pd.read_csv, path, dtype=str, na_filter=False)
+    queue = WorkQueue(queue_path, settings['lease_seconds'])
+    await run_queue_worker(queue, worker, data, job, llm_client, settings['similarity_mode'],
+                           settings['parallel_rows'], stats, batch_size)
+
+
+def csv_worker_process(settings: dict, path: str, queue_path: str, job: dict, worker: str, batch_size: int):
+    """Entry point of a worker process."""
+    logging.basicConfig(level=settings['log_level'])
+    asyncio.run(csv_worker(settings, path, queue_path, job, worker, batch_size))
+
+
+def default_queue_path(path: str) -> str:
+    return os.path.splitext(path)[0] + '.queue.sqlite'
+
+
+async def run_csv_workers(settings: dict, path: str, queue_path: str, job: dict, num_processes: int,
+                          batch_size: int) -> list[int]:
+    """Run `num_processes` worker processes until the queue is drained, and return their exit codes."""
+    ctx = multiprocessing.get_context('spawn')
+    workers = [worker_name(k) for k in range(num_processes)]
+    await asyncio.to_thread(WorkQueue(queue_path, settings['lease_seconds']).register, workers)
+    processes = [ctx.Process(target=csv_worker_process, args=(settings, path, queue_path, job, worker, batch_size))
+                 for worker in workers]
+    for process in processes:
+        process.start()
+    for process in processes:
+        await asyncio.to_thread(process.join)
+        if process.exitcode != 0:
+            logger.error(f"Worker process {process.pid} exited with code {process.exitcode}")
+    return [process.exitcode for process in processes]
+
+
+def validate_job(data: pd.DataFrame, job: dict, settings: dict):
+    """Check the fields and the prompt of a job before starting workers, which would otherwise all fail on their own."""
+    validate_input(data, job['input_fields'], job['output_fields'], len(job['similarity_queries']) > 0,
+                   settings['llm']['model'], settings['llm']['pricing'])
+    if not job['output_fields']:
+        raise ValueError("No output fields specified.")
+    if not job['similarity_queries'] and not job['prompt'].strip():
+        raise ValueError("No prompt specified.")
+
+
+def merge_results(data: pd.DataFrame, results: list[tuple[int, dict]], duplicates: dict[int, list[int]],
+                  inherited_field: Optional[str]):
+    """
+    Write the `results` of rows into `data`, and to their `duplicates` (as the writer of `analyze_data` does);
+    if `inherited_field` is given, the duplicates get the label of the row they inherit from (its line in the CSV file) in it.
+    """
+    for i, result in results:
+        for j in [i] + duplicates.get(i, []):
+            for field, value in result.items():
+                data.at[j, field] = value
+        if inherited_field:
+            data.at[i, inherited_field] = ''
+            for j in duplicates.get(i, []):
+                data.at[j, inherited_field] = str(i + CSV_FIRST_ROW)
+
+
+async def analyze_csv_distributed(
+    path: str,
+    job: dict,
+    overwrite: bool,
+    rows: Optional[Iterable[int]],
+    settings: dict,
+    stats: JobStats,
+    num_processes: int,
+    batch_size: int,
+    queue_path: Optional[str] = None
+):
+    """
+    Analyze a CSV file (in place) with `num_processes` worker processes sharing a work queue at `queue_path`.
+    Processes on other machines can join the job with `join_csv_job` while it runs.
+    Once all rows are done, results are merged into the file, and the totals of all workers are added to `stats`.
+    If the job is interrupted, or all worker processes fail (which raises a RuntimeError), running it again continues from the queue.
+    Duplicate and near-duplicate rows (if the job has `deduplicate` or `near_duplicate_threshold` set, see `analyze_data`)
+    are grouped here, only the rows that represent their groups are queued, and the others get their results when they are merged.
+    If the budget of the job (its max_cost and max_tokens) runs out, the results so far are merged,
+    the rows left unprocessed are recorded in `stats.unprocessed_rows`, and running the job again resumes from them.
+    """
+    queue_path = queue_path or default_queue_path(path)
+    data = await asyncio.to_thread(pd.read_csv, path, dtype=str, na_filter=False)
+    validate_job(data, job, settings)
+    prepare_output_fields(data, job['output_fields'], job.get('output_types'))
+    if rows is None:
+        rows = range(len(data))
+    rows_to_process = select_rows(data, rows, job['output_fields'], overwrite, 0, stats)
+    duplicates: dict[int, list[int]] = {}
+    inherited_field = None
+    if job.get('near_duplicate_threshold') is not None:
+        inherited_field = job['inherited_field']
+        prepare_output_fields(data, [inherited_field])
+        rows_to_process, duplicates = await asyncio.to_thread(
+            group_near_duplicates, data, rows_to_process, job['input_fields'], job['near_duplicate_threshold'],
+            job.get('near_duplicate_sample', 1))
+        stats.rows_inherited = sum(len(d) for d in duplicates.values())
+        logger.info(f"Found {stats.rows_inherited} near-duplicate rows; they will inherit the responses of their clusters")
+    elif job.get('deduplicate'):
+        rows_to_process, duplicates = group_duplicates(data, rows_to_process, job['input_fields'])
+        stats.duplicates_skipped = sum(len(d) for d in duplicates.values())
+        logger.info(f"Found {stats.duplicates_skipped} duplicate rows; they will get the same responses as the originals")
+    queue = WorkQueue(queue_path, settings['lease_seconds'])
+    await asyncio.to_thread(queue.add_rows, rows_to_process)
+
+    exit_codes = await run_csv_workers(settings, path, queue_path, job, num_processes, batch_size)
+    # A worker only stops on its own once no rows are left, so if none did, no local worker will finish the job
+    unfinished = await asyncio.to_thread(queue.unfinished)
+    if unfinished > 0 and all(code != 0 for code in exit_codes):
+        raise RuntimeError(f"All worker processes failed (exit codes {exit_codes}) with {unfinished} rows unfinished; "
+                           f"see their logs. Running the job again continues from the queue at {queue_path}.")
+    # Workers on other machines may still be finishing their leases
+    has_budget = job.get('max_cost') is not None or job.get('max_tokens') is not None
+    while await asyncio.to_thread(queue.unfinished) > 0:
+        # Workers only leave rows behind when the budget runs out
+        if has_budget and await asyncio.to_thread(queue.active_workers) == 0:
+            pending = await asyncio.to_thread(queue.pending)
+            stats.unprocessed_rows = sorted(j for i in pending for j in [i] + duplicates.get(i, []))
+            logger.warning(f"Stopped early to stay within the budget: {len(stats.unprocessed_rows)} rows were not processed. "
+                           f"Run the analysis again to resume.")
+            break
+        await asyncio.sleep(POLL_INTERVAL)
+
+    # Merge the results into the file
+    results = await asyncio.to_thread(lambda: list(queue.results()))
+    merge_results(data, results, duplicates, inherited_field)
+    await asyncio.to_thread(data.to_csv, path, index=False)
+    await asyncio.to_thread(queue.aggregate_stats, stats)
+    await asyncio.to_thread(os.remove, queue_path)
+    stats.report_cost()
+
+
+async def join_csv_job(path: str, job: dict, settings: dict, num_processes: int, batch_size: int,
+                       queue_path: Optional[str] = None):
+    """Help process a job started by `analyze_csv_distributed` (e.g. on another machine sharing the filesystem)."""
+    queue_path = queue_path or default_queue_path(path)
+    if not os.path.exists(queue_path):
+        logger.error(f"No job queue found at {queue_path}")
+        return
+    await run_csv_workers(settings, path, queue_path, job, num_processes, batch_size)
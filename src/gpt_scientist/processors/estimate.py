@@ -0,0 +1,151 @@
+"""Dry runs: estimate the size, cost and duration of a job without processing it."""
+
+import asyncio
+import logging
+import time
+import numpy as np
+import pandas as pd
+from typing import Iterable, Optional
+from gpt_scientist.llm.client import LLMClient
+from gpt_scientist.llm.prompts import PromptTemplate, create_prompt
+from gpt_scientist.llm.schema import OutputType
+from gpt_scientist.llm.tokens import CHARS_PER_TOKEN, count_message_tokens, count_tokens, tokens_per_char
+from gpt_scientist.processors.core import build_example_messages, prepare_output_fields, select_rows, validate_input
+from gpt_scientist.stats import JobEstimate, JobStats
+
+logger = logging.getLogger(__name__)
+
+# Number of values per column that are actually tokenized to estimate the tokens-per-character ratio
+TOKENIZER_SAMPLE_SIZE = 10000
+
+# Number of rows whose lengths are computed at once
+CHUNK_SIZE = 1_000_000
+
+
+def input_field_tokens(data: pd.DataFrame, rows: np.ndarray, field: str, model: str) -> float:
+    """
+    Estimate the total number of tokens in the values of `field` in `rows`.
+    Character counts are computed for all rows (vectorized, in chunks),
+    and converted to tokens using the ratio measured on a sample of values.
+    """
+    column = data[field]
+    rng = np.random.default_rng(0)
+    sample = rows if len(rows) <= TOKENIZER_SAMPLE_SIZE else rng.choice(rows, TOKENIZER_SAMPLE_SIZE, replace=False)
+    ratio = tokens_per_char(column.loc[sample].astype(str).tolist(), model) or 1 / CHARS_PER_TOKEN
+
+    chars = 0
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = column.loc[rows[start:start + CHUNK_SIZE]]
+        chars += int(chunk.astype(str).str.len().sum())
+    return chars * ratio
+
+
+async def run_sample(data: pd.DataFrame, prompt: str, input_fields: list[str], output_fields: list[str],
+                     sample: list[int], is_similarity: bool, llm_client: LLMClient,
+                     stats: JobStats, output_types: Optional[dict[str, OutputType]] = None) -> tuple[int, int, float]:
+    """
+    Process the `sample` rows for real (without saving the results)
+    and return the total input tokens, output tokens and the mean latency per row.
+    """
+    async def process(i: int) -> tuple[int, int, float]:
+        start = time.perf_counter()
+        row = data.loc[i]
+        if is_similarity:
+            _, input_tokens = await llm_client.generate_embedding(row[input_fields[0]])
+            output_tokens = 0
+        else:
+            full_prompt = create_prompt(prompt, input_fields, output_fields, row, llm_client.use_structured_outputs,
+                                        output_types)
+            _, input_tokens, output_tokens = await llm_client.get_response(full_prompt, output_fields)
+        return input_tokens, output_tokens, time.perf_counter() - start
+
+    results = await asyncio.gather(*[process(i) for i in sample])
+    input_tokens = sum(r[0] for r in results)
+    output_tokens = sum(r[1] for r in results)
+    stats.log_rows(len(sample), input_tokens, output_tokens)
+    return input_tokens, output_tokens, sum(r[2] for r in results) / len(results)
+
+
+async def estimate_data(
+    data: pd.DataFrame,
+    prompt: str,
+    similarity_queries: list[str],
+    input_fields: list[str],
+    output_fields: list[str],
+    rows: Iterable[int],
+    examples: Iterable[int],
+    overwrite: bool,
+    llm_client: LLMClient,
+    parallel_rows: int,
+    stats: JobStats,
+    row_index_offset: int = 0,
+    sample_size: int = 5,
+    tokens_per_minute: Optional[int] = None,
+    requests_per_minute: Optional[int] = None,
+    output_types: Optional[dict[str, OutputType]] = None
+) -> JobEstimate:
+    """
+    Estimate how many tokens `analyze_data` would use on the same arguments, what it would cost, and how long it would take.
+    Input tokens are counted locally: the parts of the request that are the same for every row
+    (system prompt, examples, prompt template) are tokenized once, and the input field values are
+    measured in bulk (see `input_field_tokens`).
+    Output tokens and latency are extrapolated from processing `sample_size` random rows for real;
+    if `sample_size` is 0, output tokens are reported as unknown.
+    Wall time is the largest of the bounds imposed by the rate limits and by `parallel_rows` at the sample latency.
+    The dataframe is not modified, except for adding missing output columns.
+    """
+    is_similarity = len(similarity_queries) > 0
+    model = validate_input(data, input_fields, output_fields, is_similarity, llm_client.model, llm_client.pricing)
+    llm_client.model = model
+    stats.model = model
+    llm_client.set_stats(stats)
+
+    if is_similarity:
+        output_types = {output_fields[0]: 'float', **(output_types or {})}
+    prepare_output_fields(data, output_fields, output_types)
+    llm_client.set_output_types(output_types or {})
+    rows_to_process = select_rows(data, rows, output_fields, overwrite, row_index_offset, stats)
+    n = len(rows_to_process)
+
+    # Tokens that every request has in common
+    if is_similarity:
+        fixed_tokens = 0
+        query_tokens = sum(count_tokens(q, model) for q in similarity_queries)
+    else:
+        example_messages = build_example_messages(data, prompt, examples, input_fields, output_fields,
+                                                  llm_client.use_structured_outputs, row_index_offset, output_types)
+        llm_client.set_examples(example_messages)
+        template = PromptTemplate(prompt, input_fields, output_fields, llm_client.use_structured_outputs, output_types)
+        empty_prompt = template.render(*[''] * len(input_fields))
+        messages = [{"role": "system", "content": llm_client.system_prompt}] + example_messages + [{"role": "user", "content": empty_prompt}]
+        fixed_tokens = count_message_tokens(messages, model)
+        query_tokens = 0
+
+    # Tokens that depend on the row
+    variable_tokens = sum(input_field_tokens(data, rows_to_process, field, model) for field in input_fields)
+    input_tokens = round(fixed_tokens * n + variable_tokens) + query_tokens
+
+    output_tokens = None
+    latency = None
+    sample = np.random.default_rng(0).choice(rows_to_process, min(sample_size, n), replace=False).tolist()
+    if sample:
+        logger.info(f"Processing {len(sample)} sample rows to estimate output tokens and latency")
+        _, sample_output_tokens, latency = await run_sample(data, prompt, input_fields, output_fields, sample,
+                                                            is_similarity, llm_client, stats, output_types)
+        output_tokens = round(sample_output_tokens / len(sample) * n)
+    elif is_similarity:
+        output_tokens = 0
+
+    # Wall time: the tightest of the throughput limits
+    bounds = []
+    if tokens_per_minute:
+        bounds.append(60 * (input_tokens + (output_tokens or 0)) / tokens_per_minute)
+    if requests_per_minute:
+        bounds.append(60 * n / requests_per_minute)
+    if latency is not None:
+        bounds.append(n * latency / max(parallel_rows, 1))
+    seconds = max(bounds) if bounds else None
+
+    estimate = JobEstimate(model, llm_client.pricing, n, input_tokens, output_tokens, seconds, len(sample))
+    estimate.report()
+    return estimate
@@ -0,0 +1,82 @@
+"""Dynamic few-shot examples: for every row, the examples most similar to it, within a token budget."""
+
+import asyncio
+import logging
+import numpy as np
+from typing import Any, Optional
+from gpt_scientist.llm.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Number of texts embedded in one request when embedding the example pool
+EMBEDDING_BATCH = 256
+
+# Only the beginning of long texts is embedded, to stay within the input limit of embedding models
+MAX_EMBEDDING_CHARS = 20000
+
+
+def example_text(values: list[Any]) -> str:
+    """The text of a row (or example) that is embedded to compare it with others: its input field values."""
+    return '\n'.join(str(value) for value in values)[:MAX_EMBEDDING_CHARS]
+
+
+class ExampleSelector:
+    """
+    A pool of few-shot examples, from which the (at most) `k` examples most similar to a row are chosen for its request,
+    as long as their messages fit in `max_tokens` tokens (if given).
+    `examples` holds the row, the input field values, and the example messages (see `create_example_messages`)
+    of every example in the pool. Similarity is the cosine similarity of embeddings computed with `embedding_model`;
+    the embeddings of the pool are computed once, and kept in `cache` (by model and text) for later jobs.
+    """
+
+    def __init__(self, examples: list[tuple[int, list[Any], list[dict]]], k: int, max_tokens: Optional[int],
+                 embedding_model: str, model: str, cache: Optional[dict] = None):
+        if k < 1:
+            raise ValueError("At least one example per row must be selected.")
+        self.rows = np.array([row for row, _, _ in examples], dtype=np.int64)
+        self.texts = [example_text(values) for _, values, _ in examples]
+        self.messages = [messages for _, _, messages in examples]
+        self.tokens = np.array([count_message_tokens(messages, model) for messages in self.messages])
+        self.k = k
+        self.max_tokens = max_tokens
+        self.embedding_model = embedding_model
+        self.cache = cache if cache is not None else {}
+        self.embeddings: Optional[np.ndarray] = None  # Normalized embeddings of the pool, one per row
+
+    async def prepare(self, llm_client) -> int:
+        """Embed the examples of the pool that are not in the cache yet; return the number of tokens used."""
+        missing = list(dict.fromkeys(text for text in self.texts if (self.embedding_model, text) not in self.cache))
+        batches = [missing[start:start + EMBEDDING_BATCH] for start in range(0, len(missing), EMBEDDING_BATCH)]
+        results = await asyncio.gather(*(llm_client.generate_embeddings(batch, self.embedding_model) for batch in batches))
+        for batch, (embeddings, _) in zip(batches, results):
+            for text, embedding in zip(batch, embeddings):
+                self.cache[(self.embedding_model, text)] = embedding
+        if self.texts:
+            embeddings = np.array([self.cache[(self.embedding_model, text)] for text in self.texts], dtype=np.float32)
+            self.embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        logger.info(f"Selecting up to {self.k} of {len(self.texts)} examples per row")
+        return sum(tokens for _, tokens in results)
+
+    def choose(self, embedding: list[float], row: Optional[int] = None) -> list[dict]:
+        """
+        The messages of the examples most similar to `embedding` that fit in the budget (skipping the example of `row` itself),
+        least similar first, so that the most similar example is right before the prompt.
+        """
+        if self.embeddings is None:
+            return []
+        similarities = self.embeddings @ np.asarray(embedding, dtype=np.float32)
+        chosen = []
+        budget = self.max_tokens if self.max_tokens is not None else np.inf
+        for k in np.argsort(-similarities, kind='stable'):
+            if self.rows[k] == row or self.tokens[k] > budget:
+                continue
+            chosen.append(k)
+            budget -= self.tokens[k]
+            if len(chosen) == self.k:
+                break
+        return [message for k in reversed(chosen) for message in self.messages[k]]
+
+    async def select(self, llm_client, values: list[Any], row: Optional[int] = None) -> tuple[list[dict], int]:
+        """The example messages for a row with input field `values`, and the tokens used to embed the row."""
+        embedding, tokens = await llm_client.generate_embedding(example_text(values), self.embedding_model)
+        return self.choose(embedding, row), tokens
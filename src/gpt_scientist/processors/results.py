@@ -0,0 +1,53 @@
+"""Columnar buffers of results, passed to the sinks that persist them and applied to the dataframe in bulk."""
+
+import pandas as pd
+from typing import Any, Iterator
+
+
+class ResultBatch:
+    """
+    Results of a batch of rows, stored by column: `values[field][k]` is the value of `field` in row `rows[k]`.
+    Every row has a value for every field.
+    """
+
+    def __init__(self, fields: list[str]):
+        self.fields = fields
+        self.rows: list[int] = []
+        self.values: dict[str, list[Any]] = {field: [] for field in fields}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, row: int, result: dict):
+        """Add the result of a row (a dictionary with a value for every field)."""
+        self.rows.append(row)
+        for field in self.fields:
+            self.values[field].append(result[field])
+
+    def extend(self, other: 'ResultBatch'):
+        self.rows.extend(other.rows)
+        for field in self.fields:
+            self.values[field].extend(other.values[field])
+
+    def sort(self):
+        """Sort the rows by index (to avoid unneeded reordering when writing)."""
+        order = sorted(range(len(self.rows)), key=self.rows.__getitem__)
+        self.rows = [self.rows[k] for k in order]
+        self.values = {field: [values[k] for k in order] for field, values in self.values.items()}
+
+    def records(self) -> Iterator[tuple[int, dict]]:
+        """Iterate over the rows and their results as dictionaries."""
+        for k, row in enumerate(self.rows):
+            yield row, {field: self.values[field][k] for field in self.fields}
+
+    def to_frame(self) -> pd.DataFrame:
+        """The results as a dataframe indexed by row."""
+        return pd.DataFrame(self.values, index=self.rows, columns=self.fields)
+
+    def apply(self, data: pd.DataFrame):
+        """Write the results to the dataframe, one column at a time."""
+        if not self.rows:
+            return
+        for field in self.fields:
+            # A series keeps list values (e.g. of list[str] fields) as single cells
+            data.loc[self.rows, field] = pd.Series(self.values[field], index=self.rows, dtype=object)
@@ -0,0 +1,58 @@
+"""Order in which rows are sent to the workers."""
+
+import numpy as np
+import pandas as pd
+
+# Scheduling policies (see `schedule_rows`)
+SCHEDULES = ('index', 'longest_first', 'bucketed', 'interleaved')
+
+
+def row_sizes(data: pd.DataFrame, rows: np.ndarray, input_fields: list[str]) -> np.ndarray:
+    """
+    Estimated size of the requests for `rows`: the number of characters in their input field values
+    (proportional to their tokens, which is all that matters for ordering them).
+    """
+    sizes = np.zeros(len(rows), dtype=np.int64)
+    for field in input_fields:
+        sizes += data[field].iloc[rows].astype(str).str.len().to_numpy(dtype=np.int64)
+    return sizes
+
+
+def schedule_rows(data: pd.DataFrame, rows: np.ndarray, input_fields: list[str], schedule: str) -> np.ndarray:
+    """
+    Return `rows` in the order they should be processed, so that long requests do not all come at the end of the job,
+    where they would keep it running while the other workers are idle:
+    'index' keeps the order of `rows`;
+    'longest_first' sorts them by estimated size, largest first;
+    'bucketed' groups them into buckets of sizes within a factor of 2, largest bucket first, and keeps the order within a bucket
+    (so that results are still written in mostly contiguous runs);
+    'interleaved' alternates between the largest remaining row and the next row in order
+    (so that results are saved in order at half the rate, while long rows are started early).
+    """
+    if schedule not in SCHEDULES:
+        raise ValueError(f"Unknown schedule '{schedule}'; use one of: {', '.join(SCHEDULES)}.")
+    if schedule == 'index' or len(rows) < 2:
+        return rows
+    sizes = row_sizes(data, rows, input_fields)
+    if schedule == 'longest_first':
+        return rows[np.argsort(-sizes, kind='stable')]
+    if schedule == 'bucketed':
+        buckets = np.floor(np.log2(np.maximum(sizes, 1))).astype(np.int64)
+        return rows[np.argsort(-buckets, kind='stable')]
+    # Interleaved: merge the positions in size order and in index order alternately, skipping those already taken
+    by_size = np.argsort(-sizes, kind='stable').tolist()
+    taken = np.zeros(len(rows), dtype=bool)
+    order = []
+    largest = next_in_order = 0
+    while len(order) < len(rows):
+        while taken[by_size[largest]]:
+            largest += 1
+        order.append(by_size[largest])
+        taken[by_size[largest]] = True
+        if len(order) == len(rows):
+            break
+        while taken[next_in_order]:
+            next_in_order += 1
+        order.append(next_in_order)
+        taken[next_in_order] = True
+    return rows[np.array(order, dtype=np.int64)]
@@ -1,27 +1,38 @@
 """Google Sheets processing - only available in Colab."""
 
 import asyncio
+import importlib.util
 import logging
 import pandas as pd
+from functools import cache
+from typing import Callable, Optional
 from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
 from gpt_scientist.llm.client import LLMClient
 from gpt_scientist.processors.core import analyze_data
-from gpt_scientist.config import GSHEET_FIRST_ROW, GOOGLE_DOC_URL_PATTERN
+from gpt_scientist.processors.estimate import estimate_data
+from gpt_scientist.processors.results import ResultBatch
+from gpt_scientist.processors.tasks import Task, analyze_tasks
+from gpt_scientist.config import GSHEET_FIRST_ROW, GOOGLE_DOC_URL_PATTERN, INHERITED_FIELD
 from gpt_scientist.stats import JobStats
 from gpt_scientist.verification.quotes import check_quotes, verified_field_name
 
 logger = logging.getLogger(__name__)
 
-# Check if we are in Google Colab
+# Check if we are in Google Colab (without importing it: the user is only asked to authenticate on first use)
 try:
+    IN_COLAB = importlib.util.find_spec('google.colab') is not None
+except ImportError:
+    IN_COLAB = False
+
+
+@cache
+def colab_credentials():
+    """Authenticate the user in Colab (once) and return their Google credentials."""
     from google.colab import auth
-    IN_COLAB = True
-    import gspread
     from google.auth import default
-    from googleapiclient.discovery import build
     auth.authenticate_user()
-except ImportError:
-    IN_COLAB = False
+    creds, _ = default()
+    return creds
 
 
 async def get_gdoc_content(doc_id: str) -> str:
@@ -32,8 +43,8 @@ async def get_gdoc_content(doc_id: str) -> str:
 
     def _fetch_doc():
         from gpt_scientist.google_doc_parser import convert_to_text
-        creds, _ = default()
-        service = build('docs', 'v1', credentials=creds)
+        from googleapiclient.discovery import build
+        service = build('docs', 'v1', credentials=colab_credentials())
         doc = service.documents().get(documentId=doc_id).execute()
         return convert_to_text(doc['body']['content'])
     return await asyncio.to_thread(_fetch_doc)
@@ -84,11 +95,15 @@ def parse_row_ranges(range_str: str, n_rows: int) -> list[int]:
 
 
 def convert_value_for_gsheet(val):
-    """Convert complex types to strings for Google Sheets."""
+    """Convert complex types to strings, and values from typed columns to plain values, for Google Sheets."""
     if isinstance(val, list):
         return ', '.join(map(str, val))  # Convert list to comma-separated string
     elif isinstance(val, dict):
         return str(val)  # Convert dictionary to string
+    elif pd.isna(val):
+        return ''  # Missing value in a typed column
+    elif hasattr(val, 'item'):
+        return val.item()  # Numpy scalar
     else:
         return val  # Leave supported types as-is
 
@@ -109,8 +124,8 @@ async def read_spreadsheet(
 
     # Wrap all gspread I/O operations in to_thread
     def _open_and_read_sheet():
-        creds, _ = default()
-        gc = gspread.authorize(creds)
+        import gspread
+        gc = gspread.authorize(colab_credentials())
         if "docs.google.com" in key:
             spreadsheet = gc.open_by_url(key)
         else:
@@ -144,6 +159,51 @@ async def read_spreadsheet(
     return (worksheet, data)
 
 
+async def sheet_writer(worksheet, fields: list[str]) -> Callable[[ResultBatch], None]:
+    """
+    Add the columns of `fields` that the worksheet does not have yet,
+    and return a function that writes a batch of results (with any of these fields) to their columns.
+    """
+    # Import here since it's only available in Colab
+    import gspread
+
+    # Prepare the worksheet for output and get output column indices
+    def _prepare_output_columns():
+        output_column_indices = {}
+        header = worksheet.row_values(1)
+        for field in fields:
+            if field in header:
+                # If the column exists, get its index (1-based)
+                output_column_indices[field] = header.index(field) + 1
+            else:
+                if len(header) + 1 > worksheet.col_count:
+                    # Add more columns if necessary
+                    worksheet.add_cols(1)
+                # If the column doesn't exist, append it to the header
+                worksheet.update_cell(1, len(header) + 1, field)  # Add to the next available column
+                output_column_indices[field] = len(header) + 1
+                header.append(field)  # Update the header list
+        return output_column_indices
+
+    output_column_indices = await asyncio.to_thread(_prepare_output_columns)
+
+    # Now we have the column indices, prepare the function that outputs a list of rows
+    @retry(
+        wait=wait_exponential(min=10, max=60),  # Exponential back-off, 10 to 60 seconds
+        stop=stop_after_attempt(10),  # Max 10 retries
+        retry=retry_if_exception_type(Exception)  # Retry on any exception
+    )
+    def write_output_rows(batch):
+        cells = []
+        for field in batch.fields:
+            gsheet_col = output_column_indices[field]
+            for i, value in zip(batch.rows, batch.values[field]):
+                cells.append(gspread.Cell(row=i + GSHEET_FIRST_ROW, col=gsheet_col, value=convert_value_for_gsheet(value)))
+        worksheet.update_cells(cells)
+
+    return write_output_rows
+
+
 async def analyze_google_sheet(
     sheet_key: str,
     prompt: str,
@@ -157,11 +217,16 @@ async def analyze_google_sheet(
     llm_client: LLMClient,
     similarity_mode: str,
     parallel_rows: int,
-    stats: JobStats
+    stats: JobStats,
+    estimate_options: Optional[dict] = None,
+    **options
 ):
     """
     When in Colab: analyze data in the Google Sheet with key `sheet_key`; the user must have write access to the sheet.
     Use `worksheet_index` to specify a sheet other than the first one.
+    If `estimate_options` is not None, this is a dry run: the sheet is not modified,
+    and the result of `estimate_data` (called with these options) is returned.
+    `options` are passed on to `analyze_data`.
     Async version.
     """
     # Open the spreadsheet and the worksheet, and read the data
@@ -175,41 +240,18 @@ async def analyze_google_sheet(
     input_range = parse_row_ranges(rows, len(data))
     example_range = parse_row_ranges(examples, len(data))
 
-    # Prepare the worksheet for output and get output column indices
-    def _prepare_output_columns():
-        output_column_indices = []
-        header = worksheet.row_values(1)
-        for field in output_fields:
-            if field in header:
-                # If the column exists, get its index (1-based)
-                output_column_indices.append(header.index(field) + 1)
-            else:
-                if len(header) + 1 > worksheet.col_count:
-                    # Add more columns if necessary
-                    worksheet.add_cols(1)
-                # If the column doesn't exist, append it to the header
-                worksheet.update_cell(1, len(header) + 1, field)  # Add to the next available column
-                output_column_indices.append(len(header) + 1)
-                header.append(field)  # Update the header list
-        return output_column_indices
+    if estimate_options is not None:
+        return await estimate_data(data, prompt, similarity_queries, input_fields, output_fields,
+                                   input_range, example_range, overwrite, llm_client, parallel_rows, stats,
+                                   row_index_offset=GSHEET_FIRST_ROW, output_types=options.get('output_types'),
+                                   **estimate_options)
 
-    output_column_indices = await asyncio.to_thread(_prepare_output_columns)
+    # Fields written back to the sheet: the outputs, and the column that marks inherited results, if any
+    saved_fields = list(output_fields)
+    if options.get('near_duplicate_threshold') is not None:
+        saved_fields.append(options.get('inherited_field', INHERITED_FIELD))
 
-    # Now we have the column indices, prepare the function that outputs a list of rows
-    @retry(
-        wait=wait_exponential(min=10, max=60),  # Exponential back-off, 10 to 60 seconds
-        stop=stop_after_attempt(10),  # Max 10 retries
-        retry=retry_if_exception_type(Exception)  # Retry on any exception
-    )
-    def write_output_rows(data, indices):
-        cells = []
-        for i in indices:
-            gsheet_row = i + GSHEET_FIRST_ROW
-            for j, field in enumerate(output_fields):
-                gsheet_col = output_column_indices[j]
-                value = convert_value_for_gsheet(data.at[i, field])
-                cells.append(gspread.Cell(row=gsheet_row, col=gsheet_col, value=value))
-        worksheet.update_cells(cells)
+    write_output_rows = await sheet_writer(worksheet, saved_fields)
 
     await analyze_data(
         data,
@@ -225,10 +267,43 @@ async def analyze_google_sheet(
         similarity_mode,
         parallel_rows,
         stats,
-        row_index_offset=GSHEET_FIRST_ROW
+        row_index_offset=GSHEET_FIRST_ROW,
+        **options
     )
 
 
+async def analyze_google_sheet_tasks(
+    sheet_key: str,
+    tasks: list[Task],
+    rows: str,
+    overwrite: bool,
+    worksheet_index: int,
+    llm_client: LLMClient,
+    parallel_rows: int,
+    stats: JobStats,
+    **options
+):
+    """
+    When in Colab: analyze data in the Google Sheet with key `sheet_key` with several tasks in one pass (see `analyze_tasks`),
+    so that the sheet is read and linked Google Docs are fetched only once. The examples of the tasks are row ranges.
+    `options` are passed on to `analyze_tasks`. Async version.
+    """
+    input_fields = list(dict.fromkeys(field for task in tasks for field in task.input_fields))
+    ranges = ','.join([rows] + [task.examples for task in tasks if task.examples])
+    result = await read_spreadsheet(sheet_key, worksheet_index, input_fields, ranges)
+    if result is None:
+        return
+    worksheet, data = result
+    if data is None:
+        return
+
+    for task in tasks:
+        task.examples = parse_row_ranges(task.examples, len(data)) if task.examples else []
+    write_output_rows = await sheet_writer(worksheet, [field for task in tasks for field in task.output_fields])
+    await analyze_tasks(data, tasks, write_output_rows, parse_row_ranges(rows, len(data)), overwrite,
+                        llm_client, parallel_rows, stats, row_index_offset=GSHEET_FIRST_ROW, **options)
+
+
 async def check_quotes_google_sheet(
     sheet_key: str,
     output_field: str,
@@ -0,0 +1,159 @@
+"""Streaming analysis: results are yielded as soon as their rows are done."""
+
+import asyncio
+import logging
+import pandas as pd
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Optional, Union
+from gpt_scientist.llm.client import LLMClient
+from gpt_scientist.llm.prompts import PromptTemplate
+from gpt_scientist.llm.schema import OutputType
+from gpt_scientist.stats import JobStats
+from gpt_scientist.tracing import Tracer
+from gpt_scientist.processors.core import validate_input, build_example_messages, exceeds_budget, BUDGET_POLL_INTERVAL
+from gpt_scientist.processors.workers import analyze_row_worker
+
+logger = logging.getLogger(__name__)
+
+Records = Union[pd.DataFrame, Iterable[dict], AsyncIterable[dict]]
+
+
+async def iterate_records(records: Records, input_fields: list[str]) -> AsyncIterator[tuple[Any, tuple]]:
+    """
+    Iterate over the records as pairs of a row id and the values of `input_fields`.
+    Rows of a dataframe are identified by their index labels, other records by their position.
+    """
+    if isinstance(records, pd.DataFrame):
+        columns = [records[field].to_numpy(dtype=object) for field in input_fields]
+        for row_id, values in zip(records.index, zip(*columns)):
+            yield row_id, values
+        return
+    position = 0
+    if isinstance(records, AsyncIterable):
+        async for record in records:
+            yield position, record_values(record, input_fields, position)
+            position += 1
+    else:
+        for record in records:
+            yield position, record_values(record, input_fields, position)
+            position += 1
+
+
+def record_values(record: dict, input_fields: list[str], position: int) -> tuple:
+    missing_fields = [field for field in input_fields if field not in record]
+    if missing_fields:
+        raise ValueError(f"Record {position} is missing input fields {missing_fields}.")
+    return tuple(record[field] for field in input_fields)
+
+
+async def analyze_stream(
+    records: Records,
+    prompt: str,
+    input_fields: list[str],
+    output_fields: list[str],
+    examples: Optional[Union[pd.DataFrame, Iterable[dict]]],
+    llm_client: LLMClient,
+    parallel_rows: int,
+    stats: JobStats,
+    tracer: Optional[Tracer] = None,
+    max_cost: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    output_types: Optional[dict[str, OutputType]] = None
+) -> AsyncIterator[tuple[Any, Optional[dict], dict]]:
+    """
+    Analyze `records` like `analyze_data`, but yield `(row_id, result, usage)` for every record as soon as it is done
+    (so in the order of completion, not of the input), instead of writing results to a dataframe.
+    `records` is a dataframe (rows are identified by their index labels),
+    or an iterable or async iterable of dictionaries (identified by their position).
+    `result` is a dictionary with the values of `output_fields`, or None if the model failed to produce a valid response;
+    `usage` is a dictionary with the `input_tokens` and `output_tokens` spent on the row.
+    `examples` are few-shot examples: a dataframe or dictionaries with values of both input and output fields.
+    Records are read lazily and at most about `5 * parallel_rows` of them are held at a time,
+    so if the caller consumes results slowly, fewer records are read.
+    Once `max_cost` or `max_tokens` would be exceeded, no more records are read.
+    """
+    # The input fields of a dataframe are checked up front; other records are checked as they are read
+    if isinstance(records, pd.DataFrame):
+        stats.set_total_rows(len(records))
+        columns_data = records
+    else:
+        columns_data = pd.DataFrame(columns=input_fields)
+    adjusted_model = validate_input(columns_data, input_fields, output_fields, False,
+                                    llm_client.model, llm_client.pricing)
+    if adjusted_model != llm_client.model:
+        llm_client.model = adjusted_model
+        stats.model = adjusted_model
+
+    llm_client.set_output_types(output_types or {})
+    llm_client.set_stats(stats)
+    llm_client.set_tracer(tracer)
+    if examples is not None:
+        example_data = examples if isinstance(examples, pd.DataFrame) else pd.DataFrame(list(examples))
+        llm_client.set_examples(build_example_messages(example_data.reset_index(drop=True), prompt,
+                                                       range(len(example_data)), input_fields, output_fields,
+                                                       llm_client.use_structured_outputs, 0, output_types))
+    else:
+        llm_client.set_examples([])
+
+    # Workers look up the input values by sequence number in these columns;
+    # entries are removed once their results have been yielded
+    columns: list[dict[int, Any]] = [{} for _ in input_fields]
+    row_ids: dict[int, Any] = {}
+    row_queue = asyncio.Queue(2 * parallel_rows)
+    output_queue = asyncio.Queue(2 * parallel_rows)  # Bounded, so that a slow consumer stops the workers
+    stats.watch_queue('row_queue', row_queue)
+    stats.watch_queue('output_queue', output_queue)
+
+    template = PromptTemplate(prompt, input_fields, output_fields, llm_client.use_structured_outputs, output_types)
+    workers = [asyncio.create_task(analyze_row_worker(template, columns, output_fields, row_queue, output_queue,
+                                                      llm_client, tracer))
+               for _ in range(parallel_rows)]
+
+    async def feed():
+        """Read the records into the row queue, and signal the end of the stream once all workers are done."""
+        try:
+            has_budget = max_cost is not None or max_tokens is not None
+            cost = stats.current_cost()
+            baseline = {'cost': cost['input'] + cost['output'], 'tokens': stats.input_tokens + stats.output_tokens,
+                        'rows': stats.rows_processed}
+            seq = 0
+            async for row_id, values in iterate_records(records, input_fields):
+                if has_budget:
+                    # The cost of a row is unknown until the first one is done, so wait for it
+                    while seq > 0 and stats.rows_processed == 0:
+                        await asyncio.sleep(BUDGET_POLL_INTERVAL)
+                    if exceeds_budget(stats, seq - stats.rows_processed, baseline, max_cost, max_tokens):
+                        logger.warning(f"Stopping early to stay within the budget: no more records are read after {seq}.")
+                        break
+                row_ids[seq] = row_id
+                for column, value in zip(columns, values):
+                    column[seq] = value
+                await row_queue.put(seq)
+                seq += 1
+        finally:
+            for _ in workers:
+                await row_queue.put(None)
+            await asyncio.gather(*workers)
+            await output_queue.put(None)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            item = await output_queue.get()
+            if item is None:
+                break
+            seq, response, input_tokens, output_tokens = item
+            row_id = row_ids.pop(seq)
+            for column in columns:
+                del column[seq]
+            if response is None:
+                logger.warning(f"The model failed to generate a valid response for row: {row_id}. Try again later?")
+                stats.log_error()
+            stats.log_rows(1, input_tokens, output_tokens)
+            yield row_id, response, {'input_tokens': input_tokens, 'output_tokens': output_tokens}
+        # Re-raise errors from reading the records
+        await feeder
+    finally:
+        # The consumer may stop early: cancel the rows in flight
+        for task in [feeder] + workers:
+            task.cancel()
+        await asyncio.gather(feeder, *workers, return_exceptions=True)
@@ -0,0 +1,156 @@
+"""Multi-task jobs: several prompts over the same rows, in a single pass over the data."""
+
+import asyncio
+import logging
+import numpy as np
+import pandas as pd
+from typing import Callable, Iterable, Optional
+from gpt_scientist.llm.client import LLMClient
+from gpt_scientist.llm.prompts import PromptTemplate
+from gpt_scientist.llm.schema import OutputType
+from gpt_scientist.stats import JobStats
+from gpt_scientist.tracing import Tracer
+from gpt_scientist.processors.core import (BUDGET_POLL_INTERVAL, build_example_messages, exceeds_budget,
+                                           prepare_output_fields, select_rows, validate_input)
+from gpt_scientist.processors.results import ResultBatch
+from gpt_scientist.processors.scheduling import schedule_rows
+from gpt_scientist.processors.workers import task_row_worker, task_writer
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    """
+    One prompt of a multi-task job: the model gets `prompt` with the values of `input_fields` of a row,
+    and returns `output_fields` (with types `output_types`, see gpt_scientist.llm.schema).
+    `examples` are the rows used as few-shot examples for this task
+    (in a Google Sheet, a range of rows, which is resolved once the sheet is read); `name` identifies the task in stats and logs.
+    """
+
+    def __init__(self, name: str, prompt: str, input_fields: list[str], output_fields: list[str],
+                 output_types: Optional[dict[str, OutputType]] = None, examples: Iterable[int] | str = ()):
+        self.name = name
+        self.prompt = prompt
+        self.input_fields = input_fields
+        self.output_fields = output_fields
+        self.output_types = output_types or {}
+        self.examples = examples if isinstance(examples, str) else list(examples)
+        # Set by `prepare`
+        self.template: Optional[PromptTemplate] = None
+        self.columns: list[np.ndarray] = []
+        self.example_messages: list[dict] = []
+
+    def prepare(self, data: pd.DataFrame, use_structured_outputs: bool, row_index_offset: int = 0):
+        """Render the template and examples of the task, and extract its input values from `data`."""
+        self.template = PromptTemplate(self.prompt, self.input_fields, self.output_fields, use_structured_outputs, self.output_types)
+        self.columns = [data[field].to_numpy(dtype=object) for field in self.input_fields]
+        self.example_messages = build_example_messages(data, self.prompt, self.examples, self.input_fields, self.output_fields,
+                                                       use_structured_outputs, row_index_offset, self.output_types)
+
+
+def validate_tasks(tasks: list[Task]):
+    """Check that the tasks have distinct names and write to different output fields."""
+    if not tasks:
+        raise ValueError("No tasks specified.")
+    names = [task.name for task in tasks]
+    if len(set(names)) < len(names):
+        raise ValueError(f"Task names must be distinct: {names}")
+    fields = [field for task in tasks for field in task.output_fields]
+    shared = sorted({field for field in fields if fields.count(field) > 1})
+    if shared:
+        raise ValueError(f"Output fields {shared} are written by several tasks; every task needs its own output fields.")
+
+
+async def analyze_tasks(
+    data: pd.DataFrame,
+    tasks: list[Task],
+    write_output_rows: Optional[Callable[[ResultBatch], None]],
+    rows: Iterable[int],
+    overwrite: bool,
+    llm_client: LLMClient,
+    parallel_rows: int,
+    stats: JobStats,
+    row_index_offset: int = 0,
+    tracer: Optional[Tracer] = None,
+    max_cost: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    schedule: str = 'index',
+    result_buffer: Optional[int] = None
+):
+    """
+    Analyze all the `rows` of a dataframe with every one of `tasks`, as `analyze_data` does for a single prompt,
+    but in one pass: the tasks share the workers, the writer and the LLM client (with its rate limits and connections).
+    The work items are pairs of a task and a row, ordered row by row, so requests of all tasks are interleaved
+    and a row is finished by all tasks at about the same time.
+    A task skips rows where any of its own output fields is filled (unless `overwrite` is set).
+    `write_output_rows` is called with a separate ResultBatch for every task (with the output fields of that task).
+    In `stats`, every (task, row) pair counts as a row, and `stats.tasks` holds the stats of every task.
+    `tracer`, `max_cost`, `max_tokens`, `schedule` and `result_buffer` work as in `analyze_data`
+    (rows are scheduled by the size of all their input fields).
+    """
+    validate_tasks(tasks)
+
+    for task in tasks:
+        adjusted_model = validate_input(data, task.input_fields, task.output_fields, False, llm_client.model, llm_client.pricing)
+        if adjusted_model != llm_client.model:
+            llm_client.model = adjusted_model
+            stats.model = adjusted_model
+        prepare_output_fields(data, task.output_fields, task.output_types)
+        task.prepare(data, llm_client.use_structured_outputs, row_index_offset)
+    # Output fields of different tasks are distinct, so one client can validate all of them
+    llm_client.set_output_types({field: t for task in tasks for field, t in task.output_types.items()})
+    llm_client.set_examples([])
+    task_stats = [stats.add_task(task.name) for task in tasks]
+
+    row_queue = asyncio.Queue(2 * parallel_rows)
+    output_queue = asyncio.Queue(result_buffer or 2 * parallel_rows)
+    stats.watch_queue('row_queue', row_queue)
+    stats.watch_queue('output_queue', output_queue)
+    llm_client.set_stats(stats)
+    llm_client.set_tracer(tracer)
+
+    async with asyncio.TaskGroup() as tg:
+        for _ in range(parallel_rows):
+            tg.create_task(task_row_worker(tasks, row_queue, output_queue, llm_client, tracer))
+
+        # Decide which rows every task processes, and interleave the tasks row by row
+        requested = select_rows(data, rows, [], True, row_index_offset)
+        pending = np.zeros((len(tasks), len(data)), dtype=bool)
+        for t, task in enumerate(tasks):
+            selected = select_rows(data, requested, task.output_fields, overwrite, row_index_offset, task_stats[t])
+            pending[t, selected] = True
+            task_stats[t].set_total_rows(len(selected))
+        rows_to_process = requested[pending[:, requested].any(axis=0)]
+        input_fields = list(dict.fromkeys(field for task in tasks for field in task.input_fields))
+        rows_to_process = schedule_rows(data, rows_to_process, input_fields, schedule)
+        work = [(t, i) for i in rows_to_process.tolist() for t in range(len(tasks)) if pending[t, i]]
+        stats.rows_skipped = len(tasks) * len(requested) - len(work)
+        stats.set_total_rows(len(work))
+        logger.info(f"Queued {len(work)} requests for {len(rows_to_process)} rows and {len(tasks)} tasks")
+
+        tg.create_task(task_writer(output_queue, write_output_rows, data, tasks, stats, row_index_offset, tracer))
+
+        # Add work items as long as they fit in the budget
+        has_budget = max_cost is not None or max_tokens is not None
+        cost = stats.current_cost()
+        baseline = {'cost': cost['input'] + cost['output'], 'tokens': stats.input_tokens + stats.output_tokens,
+                    'rows': stats.rows_processed}
+        for k, (t, i) in enumerate(work):
+            if has_budget:
+                # The cost of a request is unknown until the first one is done, so wait for it
+                while k > 0 and stats.rows_processed == 0:
+                    await asyncio.sleep(BUDGET_POLL_INTERVAL)
+                if exceeds_budget(stats, k - stats.rows_processed, baseline, max_cost, max_tokens):
+                    stats.unprocessed_rows = sorted({i for _, i in work[k:]})
+                    logger.warning(f"Stopping early to stay within the budget: {len(work) - k} requests "
+                                   f"for {len(stats.unprocessed_rows)} rows will not be sent. Run the analysis again to resume.")
+                    break
+            await row_queue.put((t, i))
+            if tracer:
+                tracer.instant('row_enqueued', row=i, task=tasks[t].name)
+
+        await row_queue.join()
+        for _ in range(parallel_rows):
+            await row_queue.put(None)
+        await output_queue.put((None, None, 0, 0))
+    stats.report_cost()
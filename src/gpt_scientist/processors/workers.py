@@ -2,123 +2,385 @@
 
 import asyncio
 import logging
+import time
+import numpy as np
 import pandas as pd
-from typing import Callable
+from typing import TYPE_CHECKING, Callable, Optional, Sequence
+from gpt_scientist.jobs import current_job
 from gpt_scientist.stats import JobStats
-from gpt_scientist.llm.prompts import create_prompt
+from gpt_scientist.tracing import Tracer
+from gpt_scientist.llm.prompts import PromptTemplate
+from gpt_scientist.processors.results import ResultBatch
+from gpt_scientist.processors.chunking import Chunker
+from gpt_scientist.processors.examples import ExampleSelector
+
+if TYPE_CHECKING:
+    from gpt_scientist.processors.tasks import Task
 
 logger = logging.getLogger(__name__)
 
+# Number of results collected before they are applied to the dataframe:
+# assigning whole columns costs about as much as assigning a few dozen individual cells
+APPLY_ROWS = 1000
+
+
+async def put_result(output_queue: asyncio.Queue, item: tuple, stats: Optional[JobStats]):
+    """
+    Put a result in the output queue for the writer. If the queue is full (the writer is saving slower than rows are processed),
+    wait for room, so that the worker does not take more rows until the writer catches up, and record the wait in `stats`.
+    """
+    try:
+        output_queue.put_nowait(item)
+    except asyncio.QueueFull:
+        start = time.perf_counter()
+        await output_queue.put(item)
+        if stats:
+            stats.log_backpressure(time.perf_counter() - start)
+
+
+async def save_batch(batch: ResultBatch, write_output_rows: Optional[Callable[[ResultBatch], None]], job_stats: JobStats,
+                     tracer: Optional[Tracer] = None):
+    """Call `write_output_rows` (if any) with `batch` in a separate thread, and record the batch as saved."""
+    if write_output_rows is not None:
+        if tracer:
+            tracer.begin('write', rows=len(batch))
+        start = time.perf_counter()
+        job_stats.results_saving = len(batch)
+        try:
+            await asyncio.to_thread(write_output_rows, batch)
+        finally:
+            job_stats.results_saving = 0
+        job_stats.observe_latency('write', time.perf_counter() - start)
+        if tracer:
+            tracer.end('write')
+    job = current_job.get()
+    if job is not None:
+        job.add_results(batch)
+
 
 async def writer(
     queue: asyncio.Queue,
-    write_output_rows: Callable[[pd.DataFrame, list[int]], None],
+    write_output_rows: Optional[Callable[[ResultBatch], None]],
     data: pd.DataFrame,
+    output_fields: list[str],
     job_stats: JobStats,
-    row_index_offset: int = 0
+    row_index_offset: int = 0,
+    tracer: Optional[Tracer] = None,
+    duplicates: dict[int, list[int]] = {},
+    inherited_field: Optional[str] = None,
+    row_labels: Optional[Sequence] = None
 ):
     """
-    Worker that writes all outputs currently available in the queue to the dataframe
-    and calls `write_output_rows` to save the progress.
+    Worker that collects all outputs currently available in the queue into a batch
+    and calls `write_output_rows` (if given) with it to save the progress.
+    Results are applied to the dataframe in bulk, every `APPLY_ROWS` rows and when the writer stops.
+    The response for row `i` is also written to all rows in `duplicates[i]`;
+    if `inherited_field` is given, those rows get the label of row `i` in that column
+    (and row `i` itself gets an empty value): `row_labels[i]`, or by default `i + row_index_offset`.
     """
-    while True:
-        batch = []
-        # Wait until there's something in the queue
-        first_row, response, input_tokens, output_tokens = await queue.get()
-        batch.append((first_row, response))
-
-        # Drain the rest of the queue and save all responses in a batch;
-        # this is done because writing to google sheets one row at a time is slow.
-        while not queue.empty():
-            i, response, row_input_tokens, row_output_tokens = queue.get_nowait()
-            batch.append((i, response))
-            input_tokens += row_input_tokens
-            output_tokens += row_output_tokens
-
-        # Update the dataframe with the responses
-        indices_to_write = []
-        for i, response in batch:
-            if i is None:  # sentinel
+    fields = output_fields + [inherited_field] if inherited_field else output_fields
+    pending = ResultBatch(fields)  # Results not yet applied to the dataframe
+    try:
+        while True:
+            items = []
+            # Wait until there's something in the queue
+            first_row, response, input_tokens, output_tokens = await queue.get()
+            items.append((first_row, response))
+
+            # Drain the rest of the queue and save all responses in a batch;
+            # this is done because writing to google sheets one row at a time is slow.
+            while not queue.empty():
+                i, response, row_input_tokens, row_output_tokens = queue.get_nowait()
+                items.append((i, response))
+                input_tokens += row_input_tokens
+                output_tokens += row_output_tokens
+
+            # Collect the responses by column
+            if tracer:
+                tracer.begin('apply', rows=len(items))
+            batch = ResultBatch(fields)
+            for i, response in items:
+                if i is None:  # sentinel
+                    break
+                if response is None:
+                    logger.warning(f"The model failed to generate a valid response for row: {i + row_index_offset}. Try again later?")
+                    job_stats.log_error()
+                elif inherited_field:
+                    batch.add(i, {**response, inherited_field: ''})
+                    label = row_labels[i] if row_labels is not None else i + row_index_offset
+                    inherited = {**response, inherited_field: str(label)}
+                    for j in duplicates.get(i, []):
+                        batch.add(j, inherited)
+                else:
+                    for j in [i] + duplicates.get(i, []):
+                        batch.add(j, response)
+            batch.sort()  # Sort rows to avoid unneeded reordering
+            pending.extend(batch)
+            if len(pending) >= APPLY_ROWS:
+                pending.apply(data)
+                pending = ResultBatch(fields)
+            if tracer:
+                tracer.end('apply')
+
+            # Write valid rows persistent storage
+            if batch:
+                await save_batch(batch, write_output_rows, job_stats, tracer)
+
+            # Log the number of rows processed in this batch
+            # We count unsuccessful rows as well, because they still consume tokens, but we don't count the sentinel row
+            rows_processed = len([i for i, _ in items if i is not None])
+            job_stats.log_rows(rows_processed, input_tokens, output_tokens)
+
+            # Mark all dequeued items as done
+            for _ in items:
+                queue.task_done()
+
+            # If last row was a sentinel, we are done
+            if items[-1][0] is None:
                 break
-            if response is None:
-                logger.warning(f"The model failed to generate a valid response for row: {i + row_index_offset}. Try again later?")
-                job_stats.log_error()
-            else:
-                indices_to_write.append(i)
-                for field in response:
-                    data.at[i, field] = response[field]
-
-        # Write valid rows persistent storage
-        if indices_to_write:
-            indices_to_write.sort()  # Sort indices to avoid unneeded reordering
-            await asyncio.to_thread(write_output_rows, data, indices_to_write)
-
-        # Log the number of rows processed in this batch
-        # We count unsuccessful rows as well, because they still consume tokens, but we don't count the sentinel row
-        rows_processed = len([i for i, _ in batch if i is not None])
-        job_stats.log_rows(rows_processed, input_tokens, output_tokens)
-
-        # Mark all dequeued items as done
-        for _ in batch:
-            queue.task_done()
-
-        # If last row was a sentinel, we are done
-        if batch[-1][0] is None:
-            break
+    finally:
+        # Apply the remaining results even if the job fails or is cancelled, so that they are not lost
+        pending.apply(data)
 
 
-async def analyze_row_worker(
+async def task_writer(
+    queue: asyncio.Queue,
+    write_output_rows: Optional[Callable[[ResultBatch], None]],
     data: pd.DataFrame,
-    prompt: str,
-    input_fields: list[str],
+    tasks: list['Task'],
+    job_stats: JobStats,
+    row_index_offset: int = 0,
+    tracer: Optional[Tracer] = None
+):
+    """
+    Writer of a multi-task job: like `writer`, except that the items in the queue are for pairs of a task index and a row,
+    and the results are collected into a separate batch for every task (with the output fields of that task),
+    each of which is passed to `write_output_rows`. Rows and tokens are also recorded in the stats of their task.
+    """
+    task_stats = [job_stats.tasks[task.name] for task in tasks]
+    pending = [ResultBatch(task.output_fields) for task in tasks]  # Results not yet applied to the dataframe, by task
+    try:
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+
+            if tracer:
+                tracer.begin('apply', rows=len(items))
+            batches = [ResultBatch(task.output_fields) for task in tasks]
+            input_tokens = output_tokens = 0
+            for key, response, item_input_tokens, item_output_tokens in items:
+                if key is None:  # sentinel
+                    break
+                t, i = key
+                if response is None:
+                    logger.warning(f"The model failed to generate a valid response for row {i + row_index_offset} "
+                                   f"of task {tasks[t].name}. Try again later?")
+                    job_stats.log_error()
+                    task_stats[t].log_error()
+                else:
+                    batches[t].add(i, response)
+                task_stats[t].log_rows(1, item_input_tokens, item_output_tokens)
+                input_tokens += item_input_tokens
+                output_tokens += item_output_tokens
+            for t, batch in enumerate(batches):
+                batch.sort()
+                pending[t].extend(batch)
+                if len(pending[t]) >= APPLY_ROWS:
+                    pending[t].apply(data)
+                    pending[t] = ResultBatch(tasks[t].output_fields)
+            if tracer:
+                tracer.end('apply')
+
+            for batch in batches:
+                if batch:
+                    await save_batch(batch, write_output_rows, job_stats, tracer)
+
+            job_stats.log_rows(len([key for key, *_ in items if key is not None]), input_tokens, output_tokens)
+            for _ in items:
+                queue.task_done()
+            if items[-1][0] is None:
+                break
+    finally:
+        for batch in pending:
+            batch.apply(data)
+
+
+async def analyze_row_worker(
+    template: PromptTemplate,
+    columns: list[np.ndarray],
     output_fields: list[str],
     row_queue: asyncio.Queue,
     output_queue: asyncio.Queue,
-    llm_client
+    llm_client,
+    tracer: Optional[Tracer] = None,
+    selector: Optional[ExampleSelector] = None
 ):
     """
     Worker that processes a single row from the dataframe, sends it to the model,
     and puts the response in the output queue.
+    `columns` holds the values of the input fields (in the order of `template.input_fields`), indexed by row.
+    If `selector` is given, the request gets the few-shot examples it selects for the row.
     """
     while True:
         i = await row_queue.get()
         if i is None:
             break
+        if tracer:
+            tracer.begin('row', row=i)
         try:
-            row = data.loc[i]
-            full_prompt = create_prompt(prompt, input_fields, output_fields, row, llm_client.use_structured_outputs)
+            if tracer:
+                tracer.begin('lookup')
+            values = [column[i] for column in columns]
+            if tracer:
+                tracer.end('lookup')
+                tracer.begin('prompt')
+            full_prompt = template.render(*values)
+            if tracer:
+                tracer.end('prompt')
             if i == 0:
                 logger.info(f"Example prompt (first row):\n{full_prompt}")
-            response, input_tokens, output_tokens = await llm_client.get_response(full_prompt, output_fields)
-            await output_queue.put((i, response, input_tokens, output_tokens))
+            examples, example_tokens = await selector.select(llm_client, values, i) if selector else (None, 0)
+            response, input_tokens, output_tokens = await llm_client.get_response(full_prompt, output_fields, examples)
+            await put_result(output_queue, (i, response, input_tokens + example_tokens, output_tokens), llm_client.stats)
+        except Exception as e:
+            logger.error(f"Error processing row {i}: {e}")
+            # Put None response to indicate failure
+            await put_result(output_queue, (i, None, 0, 0), llm_client.stats)
+        finally:
+            if tracer:
+                tracer.end('row')
+            row_queue.task_done()
+
+
+async def analyze_chunked_row_worker(
+    template: PromptTemplate,
+    columns: list[np.ndarray],
+    output_fields: list[str],
+    row_queue: asyncio.Queue,
+    output_queue: asyncio.Queue,
+    llm_client,
+    chunker: Chunker,
+    requests: asyncio.Semaphore,
+    stats: JobStats,
+    tracer: Optional[Tracer] = None,
+    selector: Optional[ExampleSelector] = None
+):
+    """
+    Worker that processes a row like `analyze_row_worker`, except that inputs that are too long are split into chunks
+    (see `Chunker`), which are sent to the model concurrently, and their results are combined into the response of the row.
+    Requests of all workers (for whole rows, chunks and merges) share the `requests` semaphore,
+    so chunks of a long row are spread over the same number of parallel requests as rows.
+    If any chunk fails, so does the row.
+    """
+    async def ask(prompt: str, examples: Optional[list[dict]]) -> tuple[Optional[dict], int, int]:
+        async with requests:
+            return await llm_client.get_response(prompt, output_fields, examples)
+
+    while True:
+        i = await row_queue.get()
+        if i is None:
+            break
+        if tracer:
+            tracer.begin('row', row=i)
+        try:
+            values = [column[i] for column in columns]
+            examples, example_tokens = await selector.select(llm_client, values, i) if selector else (None, 0)
+            parts = await chunker.split(values)
+            if len(parts) == 1:
+                response, input_tokens, output_tokens = await ask(template.render(*parts[0]), examples)
+            else:
+                logger.info(f"Splitting row {i} into {len(parts)} chunks")
+                stats.log_chunks(len(parts))
+                if tracer:
+                    tracer.instant('chunks', row=i, chunks=len(parts))
+                answers = await asyncio.gather(*(ask(template.render(*part), examples) for part in parts))
+                input_tokens = sum(answer[1] for answer in answers)
+                output_tokens = sum(answer[2] for answer in answers)
+                results = [answer[0] for answer in answers]
+                if any(result is None for result in results):
+                    logger.warning(f"{results.count(None)} of {len(parts)} chunks of row {i} failed")
+                    response = None
+                elif chunker.merge:
+                    # Without few-shot examples: they show the task for a row, not how to merge the results of chunks
+                    response, merge_input_tokens, merge_output_tokens = await ask(chunker.merge_request(results), [])
+                    input_tokens += merge_input_tokens
+                    output_tokens += merge_output_tokens
+                else:
+                    response = chunker.combine(results)
+            await put_result(output_queue, (i, response, input_tokens + example_tokens, output_tokens), llm_client.stats)
         except Exception as e:
             logger.error(f"Error processing row {i}: {e}")
             # Put None response to indicate failure
-            await output_queue.put((i, None, 0, 0))
+            await put_result(output_queue, (i, None, 0, 0), llm_client.stats)
         finally:
+            if tracer:
+                tracer.end('row')
+            row_queue.task_done()
+
+
+async def task_row_worker(
+    tasks: list['Task'],
+    row_queue: asyncio.Queue,
+    output_queue: asyncio.Queue,
+    llm_client,
+    tracer: Optional[Tracer] = None
+):
+    """
+    Worker of a multi-task job: every item in `row_queue` is a pair of a task index and a row,
+    which is processed like in `analyze_row_worker`, with the prompt, inputs, outputs and examples of that task
+    (see `Task.prepare`). The result is put in `output_queue` under the same pair.
+    """
+    while True:
+        item = await row_queue.get()
+        if item is None:
+            break
+        t, i = item
+        task = tasks[t]
+        if tracer:
+            tracer.begin('row', row=i, task=task.name)
+        try:
+            assert task.template is not None
+            full_prompt = task.template.render(*[column[i] for column in task.columns])
+            response, input_tokens, output_tokens = await llm_client.get_response(full_prompt, task.output_fields,
+                                                                                  task.example_messages)
+            await put_result(output_queue, (item, response, input_tokens, output_tokens), llm_client.stats)
+        except Exception as e:
+            logger.error(f"Error processing row {i} of task {task.name}: {e}")
+            await put_result(output_queue, (item, None, 0, 0), llm_client.stats)
+        finally:
+            if tracer:
+                tracer.end('row')
             row_queue.task_done()
 
 
 async def similarity_row_worker(
-    data: pd.DataFrame,
+    column: np.ndarray,
     query_embeddings: list[list[float]],
-    input_field: str,
     output_field: str,
     row_queue: asyncio.Queue,
     output_queue: asyncio.Queue,
     llm_client,
-    similarity_mode: str
+    similarity_mode: str,
+    tracer: Optional[Tracer] = None
 ):
     """
     Worker that processes a single row from the dataframe for similarity tasks.
+    `column` holds the values of the input field, indexed by row.
     """
     while True:
         i = await row_queue.get()
         if i is None:
             break
+        if tracer:
+            tracer.begin('row', row=i)
         try:
-            row = data.loc[i]
-            embedding, input_tokens = await llm_client.generate_embedding(row[input_field])
+            if tracer:
+                tracer.begin('lookup')
+            text = column[i]
+            if tracer:
+                tracer.end('lookup')
+            embedding, input_tokens = await llm_client.generate_embedding(text)
             # Compute dot product between the row embedding and each of the query embeddings
             similarities = [sum(e1 * e2 for e1, e2 in zip(embedding, q_emb)) for q_emb in query_embeddings]
             # Compute the final similarity score based on the selected mode
@@ -126,10 +388,12 @@ async def similarity_row_worker(
                 response = {output_field: max(similarities)}
             else:  # similarity_mode == 'mean'
                 response = {output_field: sum(similarities) / len(similarities)}
-            await output_queue.put((i, response, input_tokens, 0))
+            await put_result(output_queue, (i, response, input_tokens, 0), llm_client.stats)
         except Exception as e:
             logger.error(f"Error processing row {i}: {e}")
             # Put None response to indicate failure
-            await output_queue.put((i, None, 0, 0))
+            await put_result(output_queue, (i, None, 0, 0), llm_client.stats)
         finally:
+            if tracer:
+                tracer.end('row')
             row_queue.task_done()
@@ -1,18 +1,26 @@
 """Main Scientist class - orchestrator for gpt_scientist."""
 
+import inspect
 import os
-from openai import AsyncOpenAI
-from typing import Iterable, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Iterable, Optional
 import logging
-from pandas import DataFrame
 
-from gpt_scientist.config import DEFAULT_MODEL, fetch_pricing
-from gpt_scientist.llm.client import LLMClient
-from gpt_scientist.processors.csv import analyze_csv, check_quotes_csv
-from gpt_scientist.processors.sheets import analyze_google_sheet, check_quotes_google_sheet, get_gdoc_content, IN_COLAB
+from gpt_scientist.config import CHUNK_OVERLAP, DEFAULT_EMBEDDING_MODEL, DEFAULT_MODEL, INHERITED_FIELD, fetch_pricing
+from gpt_scientist.llm.schema import normalize_output_fields
 from gpt_scientist.utils import run_async
+from gpt_scientist.jobs import Job, current_job
 from gpt_scientist.stats import JobStats
-from gpt_scientist.verification.quotes import check_quotes
+from gpt_scientist.tracing import Tracer
+from gpt_scientist.llm.http import ConnectionPool, KEEPALIVE_EXPIRY
+
+# Heavy modules (openai, pandas, pydantic, Google APIs) are imported on first use, to keep `import gpt_scientist` fast
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from pandas import DataFrame
+    from gpt_scientist.llm.client import LLMClient
+    from gpt_scientist.processors.results import ResultBatch
+    from gpt_scientist.processors.stream import Records
+    from gpt_scientist.processors.tasks import Task
 
 logger = logging.getLogger(__name__)
 
@@ -20,15 +28,26 @@ logger = logging.getLogger(__name__)
 class Scientist:
     """Configuration class for the GPT Scientist."""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, offline: bool = False):
         """
         Initialize configuration parameters.
         If no API key is provided, it will be read from the OPENAI_API_KEY environment variable.
+        In `offline` mode, the pricing table is never fetched from the network (only from the cache or the package).
         """
-        if api_key:
-            self._async_client = AsyncOpenAI(api_key=api_key)
-        else:
-            self._async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self._api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self._client: Optional['AsyncOpenAI'] = None  # Created on first use
+        self._http_client = None  # The pooled HTTP client that `_client` uses
+        self.connection_pool = ConnectionPool()  # Sized to parallel_rows on first use
+        self.streaming = False  # See `set_streaming`
+        self.chunking: dict = {}  # Options for splitting long inputs (see `set_chunking`; empty: off)
+        self.schedule = 'index'  # Order in which rows are processed (see `set_schedule`)
+        self.result_buffer: Optional[int] = None  # Results that may wait to be saved (None: twice parallel_rows)
+        self.example_selection: dict = {}  # Options for choosing examples per row (see `set_example_selection`; empty: off)
+        self._embedding_cache: dict = {}  # (Model, text) -> embedding of few-shot examples, kept between jobs
+        self.cascade: dict = {'models': [], 'min_logprob': None, 'min_agreement': None}  # See `set_cascade`
+        self.endpoints: list[dict] = []  # Endpoints to route requests over (empty: only the default client)
+        self._pricing: Optional[dict] = None  # Loaded on first use
+        self.offline = offline
 
         self.model = DEFAULT_MODEL
         self.use_structured_outputs = False  # Do not use structured outputs by default
@@ -40,14 +59,54 @@ class Scientist:
         self.parallel_rows = 100  # How many rows to process in parallel?
         self.output_sheet = 'gpt_output'  # Name (prefix) of the worksheet in Google Sheets
         self.fuzzy_threshold = 0.25  # Maximum edit distance as fraction of quote length (0-1)
-        self.pricing = fetch_pricing()
         self.report_interval = self.parallel_rows  # How often to report cost (in number of rows processed)
-        self._init_job_stats()  # We don't really need to init this here, but we do this to avoid mypy errors
-
-    def _create_llm_client(self) -> LLMClient:
-        """Create an LLM client with current configuration."""
-        return LLMClient(
-            self._async_client,
+        self.tracer: Optional[Tracer] = None  # Receives lifecycle events of analysis jobs (None: no tracing)
+        self.tokens_per_minute: Optional[int] = None  # Rate limits of the API key (None: unknown)
+        self.requests_per_minute: Optional[int] = None
+        self.dry_run_sample_size = 5  # How many rows a dry run processes to estimate output tokens and latency?
+        self.max_cost: Optional[float] = None  # Budget per job in dollars (None: unlimited)
+        self.max_tokens: Optional[int] = None  # Budget per job in tokens (None: unlimited)
+        self.deduplicate = False  # Send rows with identical inputs to the model only once?
+        self.near_duplicate_threshold: Optional[float] = None  # Similarity above which rows inherit responses (None: off)
+        self.near_duplicate_sample = 1  # How many rows per near-duplicate cluster are sent to the model?
+        self.inherited_field = INHERITED_FIELD  # Column that marks rows with inherited responses
+        # We don't really need to init this here, but we do this to avoid mypy errors;
+        # the pricing is not needed until the first job (which resets the stats), so don't load it yet
+        self.stats = JobStats(self.model, {}, self.report_interval)
+
+    @property
+    def _async_client(self) -> 'AsyncOpenAI':
+        """The OpenAI client, with the pooled connections of the running event loop."""
+        return self._openai_client(self.connection_pool.http_client(self.parallel_rows))
+
+    def _openai_client(self, http_client) -> 'AsyncOpenAI':
+        """
+        The OpenAI client that sends requests through `http_client`, created on first use.
+        It is recreated when the HTTP client changes (e.g. in a new event loop, since every sync call runs one).
+        """
+        if self._client is None or self._http_client is not http_client:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self._api_key, http_client=http_client, max_retries=0)
+            self._http_client = http_client
+        return self._client
+
+    @property
+    def pricing(self) -> dict:
+        """The pricing table, loaded on first use (see `fetch_pricing`)."""
+        if self._pricing is None:
+            self._pricing = fetch_pricing(offline=self.offline)
+        return self._pricing
+
+    def _create_llm_client(self, http_client) -> 'LLMClient':
+        """Create an LLM client with current configuration, sending requests through `http_client` (see `ConnectionPool.connect`)."""
+        from gpt_scientist.llm.client import LLMClient
+        if self.endpoints:
+            from gpt_scientist.llm.router import create_router
+            client = create_router(self.endpoints, http_client)
+        else:
+            client = self._openai_client(http_client)
+        llm_client = LLMClient(
+            client,
             self.model,
             self.system_prompt,
             self.use_structured_outputs,
@@ -56,10 +115,127 @@ class Scientist:
             self.model_params,
             self.pricing
         )
+        llm_client.set_cascade(**self.cascade)
+        llm_client.set_streaming(self.streaming)
+        job = current_job.get()
+        if job is not None:
+            llm_client.limiter = job.limiter
+        return llm_client
+
+    def _job_options(self) -> dict:
+        """Optional settings passed on to `analyze_data`."""
+        return {
+            'tracer': self.tracer,
+            'max_cost': self.max_cost,
+            'max_tokens': self.max_tokens,
+            'deduplicate': self.deduplicate,
+            'near_duplicate_threshold': self.near_duplicate_threshold,
+            'near_duplicate_sample': self.near_duplicate_sample,
+            'inherited_field': self.inherited_field,
+            'schedule': self.schedule,
+            'result_buffer': self.result_buffer,
+            **self.chunking,
+            **self.example_selection,
+            **({'embedding_cache': self._embedding_cache} if self.example_selection else {}),
+        }
+
+    def _estimate_options(self) -> dict:
+        """Settings passed on to `estimate_data` in dry runs."""
+        return {
+            'sample_size': self.dry_run_sample_size,
+            'tokens_per_minute': self.tokens_per_minute,
+            'requests_per_minute': self.requests_per_minute,
+        }
+
+    def _worker_settings(self) -> dict:
+        """Settings needed to recreate the LLM client and processing configuration in a worker process."""
+        from gpt_scientist.processors.distributed import DEFAULT_LEASE_SECONDS
+        return {
+            'api_key': self._async_client.api_key,
+            'base_url': str(self._async_client.base_url),
+            'llm': {
+                'model': self.model,
+                'system_prompt': self.system_prompt,
+                'use_structured_outputs': self.use_structured_outputs,
+                'num_results': self.num_results,
+                'num_retries': self.num_retries,
+                'model_params': self.model_params,
+                'pricing': self.pricing,
+            },
+            'similarity_mode': self.similarity_mode,
+            'parallel_rows': self.parallel_rows,
+            'report_interval': self.report_interval,
+            'lease_seconds': DEFAULT_LEASE_SECONDS,
+            'connection_pool': self.connection_pool.settings(),
+            'endpoints': self.endpoints,
+            'cascade': self.cascade,
+            'streaming': self.streaming,
+            'log_level': logging.getLogger('gpt_scientist').getEffectiveLevel(),
+        }
+
+    def _task_options(self) -> dict:
+        """Settings passed on to `analyze_tasks`; the other settings of `_job_options` do not apply to multi-task jobs."""
+        ignored = [name for name, enabled in (('deduplication', self.deduplicate),
+                                              ('near-duplicates', self.near_duplicate_threshold is not None),
+                                              ('chunking', bool(self.chunking)),
+                                              ('example selection', bool(self.example_selection))) if enabled]
+        if ignored:
+            logger.warning(f"Multi-task jobs do not support {', '.join(ignored)}; these settings are ignored.")
+        return {
+            'tracer': self.tracer,
+            'max_cost': self.max_cost,
+            'max_tokens': self.max_tokens,
+            'schedule': self.schedule,
+            'result_buffer': self.result_buffer,
+        }
+
+    def _distributed_job(self, prompt: str, similarity_queries: list[str], input_fields: list[str], output_fields: list[str],
+                         output_types: dict[str, Any], examples: Optional[Iterable[int]]) -> dict:
+        """
+        A distributed job (see `analyze_csv_distributed_async`): its arguments and the settings of `_job_options`
+        that apply to it, which are passed on to the worker processes.
+        """
+        if self.tracer:
+            logger.warning("Distributed jobs do not support tracing (the workers run in other processes); the tracer is ignored.")
+        return {
+            'prompt': prompt,
+            'similarity_queries': similarity_queries,
+            'input_fields': input_fields,
+            'output_fields': output_fields,
+            'output_types': output_types,
+            'examples': list(examples or []),
+            'max_cost': self.max_cost,
+            'max_tokens': self.max_tokens,
+            'deduplicate': self.deduplicate,
+            'near_duplicate_threshold': self.near_duplicate_threshold,
+            'near_duplicate_sample': self.near_duplicate_sample,
+            'inherited_field': self.inherited_field,
+            'chunking': self.chunking,
+            'example_selection': self.example_selection,
+            'schedule': self.schedule,
+            'result_buffer': self.result_buffer,
+        }
+
+    def _create_tasks(self, tasks: list[dict]) -> list['Task']:
+        """Turn the task specifications of a multi-task job (see `analyze_csv_tasks_async`) into Tasks."""
+        from gpt_scientist.processors.tasks import Task
+        created = []
+        for spec in tasks:
+            unknown = set(spec) - {'name', 'prompt', 'input_fields', 'output_fields', 'examples'}
+            if unknown:
+                raise ValueError(f"Unknown task settings: {', '.join(sorted(unknown))}")
+            output_fields, output_types = normalize_output_fields(spec.get('output_fields', ['gpt_output']))
+            created.append(Task(spec.get('name', output_fields[0]), spec.get('prompt', ''), spec.get('input_fields', []),
+                                output_fields, output_types, spec.get('examples', ())))
+        return created
 
     def _init_job_stats(self):
         """Initialize JobStats with current model and pricing."""
         self.stats = JobStats(self.model, self.pricing, self.report_interval)
+        self.stats.watch_connections(self.connection_pool.stats)
+        job = current_job.get()
+        if job is not None:
+            job.stats = self.stats
 
     # Configuration setters
     def set_model(self, model: str):
@@ -89,6 +265,7 @@ class Scientist:
 
     async def load_system_prompt_from_google_doc_async(self, doc_id: str):
         """Load the system prompt from a Google Doc. Async version."""
+        from gpt_scientist.processors.sheets import IN_COLAB, get_gdoc_content
         if not IN_COLAB:
             logger.error("This method is only available in Google Colab.")
             return
@@ -116,6 +293,97 @@ class Scientist:
         """Set the number of rows to process in parallel."""
         self.parallel_rows = parallel_rows
 
+    def set_result_buffer(self, result_buffer: Optional[int]):
+        """
+        Set how many processed rows may wait to be saved (default: twice the number of parallel rows).
+        When saving falls behind (e.g. Google Sheets asks to slow down), processing pauses until it catches up,
+        so that memory use does not grow; `stats.snapshot()['backpressure']` shows how long it paused.
+        """
+        if result_buffer is not None and result_buffer < 1:
+            raise ValueError("The result buffer must hold at least one row.")
+        self.result_buffer = result_buffer
+
+    def set_connection_pool(self, max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None,
+                            keepalive_expiry: float = KEEPALIVE_EXPIRY, http2: bool = False):
+        """
+        Configure the pool of HTTP connections to the API.
+        `max_connections` is the maximum number of open connections (default: `parallel_rows`),
+        `max_keepalive_connections` the number of idle connections kept open (default: all of them),
+        and `keepalive_expiry` how long (in seconds) idle connections are kept open.
+        `http2` multiplexes requests over fewer connections (needs the h2 package).
+        """
+        self.connection_pool = ConnectionPool(max_connections, max_keepalive_connections, keepalive_expiry, http2)
+
+    def share_connection_pool(self, other: 'Scientist'):
+        """
+        Send requests through the connection pool of `other`, so that several Scientists reuse the same connections.
+        The pool is sized for the Scientist that uses it first, unless its `max_connections` is set.
+        """
+        self.connection_pool = other.connection_pool
+
+    def set_streaming(self, streaming: bool):
+        """
+        Stream responses from the model and check them as they arrive:
+        a response that cannot be valid (e.g. prose instead of JSON, or a value of the wrong type)
+        is abandoned right away and retried, instead of waiting for (and paying for) the rest of it.
+        The time until the first output field arrives is reported as the 'first_field' latency in `stats.snapshot()`.
+        Has no effect with structured outputs, whose responses always have the right fields.
+        """
+        if streaming and self.use_structured_outputs:
+            logger.warning("Responses are not streamed with structured outputs; see set_use_structured_outputs.")
+        self.streaming = streaming
+
+    def set_cascade(self, models: list[str], min_logprob: Optional[float] = None, min_agreement: Optional[float] = None):
+        """
+        Try cheaper `models` (in order) before the main model, and only escalate a row to the next model
+        when the response is invalid, or not confident enough:
+        the average log-probability of its tokens is below `min_logprob` (e.g. -0.3),
+        or less than a `min_agreement` fraction (e.g. 0.6) of the `num_results` completions agree with it.
+        Tokens are priced per model; `stats.escalations` counts the rows escalated from each model.
+        Call with an empty list to turn the cascade off.
+        """
+        if min_agreement is not None and not 0 < min_agreement <= 1:
+            raise ValueError("The minimum agreement must be between 0 and 1.")
+        if min_agreement is not None and self.num_results < 2:
+            logger.warning("Agreement can only be checked with several completions per request; see set_num_results.")
+        for model in models:
+            if model not in self.pricing:
+                logger.warning(f"No pricing available for {model}; its cost will be reported as 0.")
+        self.cascade = {'models': list(models), 'min_logprob': min_logprob, 'min_agreement': min_agreement}
+
+    def add_endpoint(self, base_url: Optional[str] = None, api_key: Optional[str] = None, weight: float = 1.0,
+                     model: Optional[str] = None, requests_per_minute: Optional[int] = None,
+                     tokens_per_minute: Optional[int] = None, max_concurrency: Optional[int] = None,
+                     name: Optional[str] = None):
+        """
+        Add an OpenAI-compatible endpoint (e.g. another API key, or a local vLLM server) to route requests over.
+        Once endpoints are added, requests are spread over them in proportion to their `weight`,
+        staying within each endpoint's `requests_per_minute`, `tokens_per_minute` and `max_concurrency`;
+        an endpoint that fails or is rate limited is skipped for a while, and the request is retried elsewhere.
+        `base_url` and `api_key` default to those of the default client (so add it too, if it should get requests),
+        and `model` replaces the main model of the job at this endpoint (embeddings and cascade models are requested as they are).
+        Requests, errors, tokens and latency per endpoint (by `name`) are reported in `stats.endpoints`.
+        """
+        name = name or f'endpoint_{len(self.endpoints)}'
+        if any(endpoint['name'] == name for endpoint in self.endpoints):
+            raise ValueError(f"There is already an endpoint named {name}.")
+        if weight <= 0:
+            raise ValueError("The weight of an endpoint must be positive.")
+        self.endpoints.append({
+            'name': name,
+            'base_url': base_url,
+            'api_key': api_key or self._api_key,
+            'weight': weight,
+            'model': model,
+            'requests_per_minute': requests_per_minute,
+            'tokens_per_minute': tokens_per_minute,
+            'max_concurrency': max_concurrency,
+        })
+
+    def clear_endpoints(self):
+        """Remove all endpoints added with `add_endpoint`, and send requests through the default client again."""
+        self.endpoints = []
+
     def set_output_sheet(self, output_sheet: str):
         """Set the name (prefix) of the worksheet to save the output in Google Sheets."""
         self.output_sheet = output_sheet
@@ -126,16 +394,225 @@ class Scientist:
         Pricing table must be in the format {'model_name': {'input': input_cost, 'output': output_cost}},
         where input_cost and output_cost are the costs per 1M tokens.
         """
-        self.pricing = self.pricing | pricing
+        self._pricing = self.pricing | pricing
 
     def set_report_interval(self, report_interval: int):
         """Set the interval (in number of rows processed) to report cost. 0 means no reporting."""
         self.report_interval = report_interval
 
+    def set_budget(self, max_cost: Optional[float] = None, max_tokens: Optional[int] = None):
+        """
+        Set the maximum cost (in dollars) and/or number of tokens per job; None means unlimited.
+        When the budget is about to run out, the job stops taking new rows, finishes and saves the rows in progress,
+        and records the rows it did not get to in `stats.unprocessed_rows`.
+        Running the same job again (without `overwrite`) picks up from where it stopped.
+        """
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+
+    def set_deduplicate(self, deduplicate: bool):
+        """
+        Set whether rows with identical values in all input fields should be sent to the model only once;
+        the response is then copied to all such rows.
+        """
+        self.deduplicate = deduplicate
+
+    def set_near_duplicates(self, threshold: Optional[float] = 0.8, sample: int = 1, inherited_field: str = INHERITED_FIELD):
+        """
+        Send only one row (or `sample` rows) per cluster of near-duplicate rows to the model;
+        the other rows inherit the response of the first row in their cluster.
+        Rows are near-duplicates if, after ignoring case, punctuation and URLs, their input fields
+        share roughly at least `threshold` (0-1) of their three-word sequences.
+        Rows with inherited responses get the row they inherited from in the `inherited_field` column:
+        its index label in a dataframe, or its row number (counting the header as row 1) in a CSV file or a Google Sheet.
+        Set `threshold` to None to turn this off.
+        """
+        if threshold is not None and not 0 < threshold <= 1:
+            raise ValueError("The near-duplicate threshold must be between 0 and 1.")
+        if sample < 1:
+            raise ValueError("At least one row per cluster must be sampled.")
+        self.near_duplicate_threshold = threshold
+        self.near_duplicate_sample = sample
+        self.inherited_field = inherited_field
+
+    def set_chunking(self, chunk_tokens: Optional[int] = 4000, chunk_overlap: int = CHUNK_OVERLAP,
+                     reduce: str | dict[str, str] = 'merge', merge_prompt: Optional[str] = None):
+        """
+        Split input values longer than `chunk_tokens` tokens (e.g. long transcripts or Google Docs) into chunks
+        that overlap by `chunk_overlap` tokens, send the chunks to the model in parallel, and combine their results.
+        `reduce` is how the results are combined:
+        'merge' asks the model to merge them (with `merge_prompt`, if given, in place of the default instructions);
+        'fields' combines every output field on its own: texts are joined, lists concatenated, true/false fields are true
+        if any chunk says so, and other values are voted on;
+        a dict maps output fields to one of 'join', 'concat', 'vote', 'any', 'all', 'min', 'max', 'sum', 'mean' or 'first'
+        (other fields are combined as with 'fields').
+        Set `chunk_tokens` to None to turn this off.
+        """
+        if chunk_tokens is None:
+            self.chunking = {}
+            return
+        if not 0 <= chunk_overlap < chunk_tokens:
+            raise ValueError("The overlap of chunks must be smaller than their size.")
+        self.chunking = {'chunk_tokens': chunk_tokens, 'chunk_overlap': chunk_overlap,
+                         'reduce': reduce, 'merge_prompt': merge_prompt}
+
+    def set_example_selection(self, examples_per_row: Optional[int] = 3, max_tokens: Optional[int] = None,
+                              embedding_model: str = DEFAULT_EMBEDDING_MODEL):
+        """
+        Instead of sending all `examples` with every request, send only the `examples_per_row` examples
+        most similar to the row, as long as they fit in `max_tokens` tokens (if given).
+        Similarity is measured with `embedding_model`; the examples are embedded once (and remembered for later jobs),
+        and every row is embedded before its request.
+        Set `examples_per_row` to None to send all examples again.
+        """
+        if examples_per_row is None:
+            self.example_selection = {}
+            return
+        if examples_per_row < 1:
+            raise ValueError("At least one example per row must be selected.")
+        self.example_selection = {'examples_per_row': examples_per_row, 'example_token_budget': max_tokens,
+                                  'example_embedding_model': embedding_model}
+
+    def set_schedule(self, schedule: str):
+        """
+        Set the order in which rows are processed:
+        'index' (default) processes them in order;
+        'longest_first' starts with the rows with the longest inputs, so that the job does not end waiting on a few long requests;
+        'bucketed' processes rows of similar length together, longest first, and in order within each group;
+        'interleaved' alternates between the longest remaining row and the next row in order,
+        so that results are still saved mostly in order.
+        """
+        from gpt_scientist.processors.scheduling import SCHEDULES
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unknown schedule '{schedule}'; use one of: {', '.join(SCHEDULES)}.")
+        self.schedule = schedule
+
+    def set_rate_limits(self, tokens_per_minute: Optional[int] = None, requests_per_minute: Optional[int] = None):
+        """Set the rate limits of your API key for the current model (used to estimate the duration of dry runs)."""
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+
+    def set_dry_run_sample_size(self, sample_size: int):
+        """Set how many rows a dry run actually processes to estimate output tokens and latency (0: none)."""
+        self.dry_run_sample_size = sample_size
+
+    def set_tracer(self, tracer: Optional[Tracer]):
+        """
+        Set a tracer to receive lifecycle events of analysis jobs, or None to disable tracing.
+        Example:
+            tracer = ChromeTraceExporter()
+            sc.set_tracer(tracer)
+            sc.analyze_csv(...)
+            tracer.save('trace.json')  # Open in https://ui.perfetto.dev
+        """
+        self.tracer = tracer
+
     def set_fuzzy_threshold(self, fuzzy_threshold: float):
         """Set the maximum edit distance as a fraction of quote length (0-1)."""
         self.fuzzy_threshold = fuzzy_threshold
 
+    # Background jobs
+    def submit(self, job: Callable[..., Any], *args, **kwargs) -> Job:
+        """
+        Start `job` (a method of this Scientist, e.g. `sc.analyze_csv`, or its async version) with the given arguments
+        in the background, and return a Job handle right away instead of waiting for the job to finish.
+        Background jobs run concurrently on an event loop in a separate thread, so that a notebook stays responsive:
+        `progress()` reports the current metrics of a job, `results()` the results saved so far,
+        `cancel()` stops it, and `wait()` returns its result.
+        The jobs of all Scientists share the limit on requests in flight set with `gpt_scientist.set_request_limit`.
+        """
+        name = getattr(job, '__name__', repr(job))
+        if not inspect.iscoroutinefunction(job):
+            job = getattr(getattr(job, '__self__', None), f"{name}_async", None)
+            if job is None:
+                raise ValueError(f"`{name}` cannot run in the background: it has no async version.")
+        return Job(name.removesuffix('_async')).start(job(*args, **kwargs))
+
+    # Streaming methods
+    async def analyze_iter(
+        self,
+        records: 'Records',
+        prompt: str,
+        input_fields: list[str],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
+        examples: Optional['DataFrame | Iterable[dict]'] = None
+    ) -> AsyncIterator[tuple[Any, Optional[dict], dict]]:
+        """
+        Analyze `records` (a dataframe, or an iterable or async iterable of dictionaries)
+        and yield `(row_id, result, usage)` for every record as soon as it is done, in the order of completion.
+        Rows of a dataframe are identified by their index labels, other records by their position.
+        `result` is a dictionary with the values of `output_fields` (None if the model failed to produce a valid response),
+        and `usage` holds the `input_tokens` and `output_tokens` spent on the row.
+        `examples` are few-shot examples: a dataframe or dictionaries with values of input and output fields.
+        Records are read as they are needed, so that only a few times `parallel_rows` of them are in memory at once.
+        The budget set with `set_budget` applies; deduplication does not. Async only.
+        """
+        from gpt_scientist.processors.stream import analyze_stream
+        output_fields, output_types = normalize_output_fields(output_fields)
+        async with self.connection_pool.connect(self.parallel_rows) as http_client:
+            llm_client = self._create_llm_client(http_client)
+            self._init_job_stats()
+            assert self.stats is not None
+            async for item in analyze_stream(records, prompt, input_fields, output_fields, examples, llm_client,
+                                             self.parallel_rows, self.stats, self.tracer, self.max_cost, self.max_tokens,
+                                             output_types):
+                yield item
+
+    # DataFrame processing methods
+    async def analyze_dataframe_async(
+        self,
+        data: 'DataFrame',
+        prompt: str = '',
+        similarity_queries: list[str] = [],
+        input_fields: list[str] = [],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
+        rows: Optional[Iterable[int]] = None,
+        examples: Optional[Iterable[int]] = None,
+        overwrite: bool = False,
+        in_place: bool = False,
+        write_output_rows: Optional[Callable[['ResultBatch'], None]] = None,
+        dry_run: bool = False
+    ):
+        """
+        Analyze a dataframe held in memory - async version.
+        `rows` and `examples` are positions of rows (not index labels).
+        Return a copy of `data` with the output fields filled in; with `in_place=True`, `data` itself is modified and returned.
+        `write_output_rows`, if given, is called with every batch of results (a ResultBatch, by index label) to save progress.
+        With `dry_run=True`, `data` is not modified; instead, return a JobEstimate of the tokens, cost and time the job would take.
+        """
+        from gpt_scientist.processors.dataframe import analyze_dataframe
+        output_fields, output_types = normalize_output_fields(output_fields)
+        async with self.connection_pool.connect(self.parallel_rows) as http_client:
+            llm_client = self._create_llm_client(http_client)
+            self._init_job_stats()
+            assert self.stats is not None
+            return await analyze_dataframe(
+                data, prompt, similarity_queries, input_fields, output_fields,
+                rows, examples, overwrite, llm_client, self.similarity_mode, self.parallel_rows,
+                self.stats, self._estimate_options() if dry_run else None, in_place, write_output_rows,
+                output_types=output_types, **self._job_options()
+            )
+
+    def analyze_dataframe(
+        self,
+        data: 'DataFrame',
+        prompt: str = '',
+        similarity_queries: list[str] = [],
+        input_fields: list[str] = [],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
+        rows: Optional[Iterable[int]] = None,
+        examples: Optional[Iterable[int]] = None,
+        overwrite: bool = False,
+        in_place: bool = False,
+        write_output_rows: Optional[Callable[['ResultBatch'], None]] = None,
+        dry_run: bool = False
+    ):
+        """Analyze a dataframe held in memory - sync wrapper."""
+        return run_async(self.analyze_dataframe_async(
+            data, prompt, similarity_queries, input_fields, output_fields, rows, examples, overwrite,
+            in_place, write_output_rows, dry_run
+        ))
+
     # CSV processing methods
     async def analyze_csv_async(
         self,
@@ -143,21 +620,32 @@ class Scientist:
         prompt: str = '',
         similarity_queries: list[str] = [],
         input_fields: list[str] = [],
-        output_fields: list[str] = ['gpt_output'],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
         rows: Optional[Iterable[int]] = None,
         examples: Optional[Iterable[int]] = None,
-        overwrite: bool = False
+        overwrite: bool = False,
+        dry_run: bool = False
     ):
-        """Analyze a CSV file (in place) - async version."""
-        llm_client = self._create_llm_client()
-        # Reset stats for this analysis run
-        self._init_job_stats()
-        assert self.stats is not None
-        return await analyze_csv(
-            path, prompt, similarity_queries, input_fields, output_fields,
-            rows, examples, overwrite, llm_client, self.similarity_mode, self.parallel_rows,
-            self.stats
-        )
+        """
+        Analyze a CSV file (in place) - async version.
+        `output_fields` is a list of field names, or a dictionary from field names to their types
+        (str, int, float, bool, list[str], or an enum given as a list of allowed values, an Enum class or a Literal).
+        While the job runs, its results are backed up (by row index, without the input columns) in `<name>_output_<timestamp>.csv`,
+        which is removed once the file is updated.
+        With `dry_run=True`, the file is not modified; instead, return a JobEstimate of the tokens, cost and time the job would take.
+        """
+        from gpt_scientist.processors.csv import analyze_csv
+        output_fields, output_types = normalize_output_fields(output_fields)
+        async with self.connection_pool.connect(self.parallel_rows) as http_client:
+            llm_client = self._create_llm_client(http_client)
+            # Reset stats for this analysis run
+            self._init_job_stats()
+            assert self.stats is not None
+            return await analyze_csv(
+                path, prompt, similarity_queries, input_fields, output_fields,
+                rows, examples, overwrite, llm_client, self.similarity_mode, self.parallel_rows,
+                self.stats, self._estimate_options() if dry_run else None, output_types=output_types, **self._job_options()
+            )
 
     def analyze_csv(
         self,
@@ -165,14 +653,101 @@ class Scientist:
         prompt: str = '',
         similarity_queries: list[str] = [],
         input_fields: list[str] = [],
-        output_fields: list[str] = ['gpt_output'],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
         rows: Optional[Iterable[int]] = None,
         examples: Optional[Iterable[int]] = None,
-        overwrite: bool = False
+        overwrite: bool = False,
+        dry_run: bool = False
     ):
         """Analyze a CSV file (in place) - sync wrapper."""
         return run_async(self.analyze_csv_async(
-            path, prompt, similarity_queries, input_fields, output_fields, rows, examples, overwrite
+            path, prompt, similarity_queries, input_fields, output_fields, rows, examples, overwrite, dry_run
+        ))
+
+    # Distributed CSV processing methods
+    async def analyze_csv_distributed_async(
+        self,
+        path: str,
+        prompt: str = '',
+        similarity_queries: list[str] = [],
+        input_fields: list[str] = [],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
+        rows: Optional[Iterable[int]] = None,
+        examples: Optional[Iterable[int]] = None,
+        overwrite: bool = False,
+        num_processes: Optional[int] = None,
+        queue_path: Optional[str] = None
+    ):
+        """
+        Analyze a CSV file (in place) using `num_processes` worker processes (default: one per CPU core).
+        The processes share a work queue stored in `queue_path` (default: next to the CSV file);
+        machines that share the filesystem can help with the job by calling `join_csv_job` with the same arguments.
+        Results are merged into the file once all rows are done.
+        The settings of the scientist (budget, deduplication, chunking, etc.) apply as in `analyze_csv`, except for tracing. Async version.
+        """
+        from gpt_scientist.processors.distributed import analyze_csv_distributed
+        output_fields, output_types = normalize_output_fields(output_fields)
+        self._init_job_stats()
+        job = self._distributed_job(prompt, similarity_queries, input_fields, output_fields, output_types, examples)
+        await analyze_csv_distributed(
+            path, job, overwrite, rows, self._worker_settings(), self.stats,
+            num_processes or os.cpu_count() or 1, 10 * self.parallel_rows, queue_path
+        )
+
+    def analyze_csv_distributed(
+        self,
+        path: str,
+        prompt: str = '',
+        similarity_queries: list[str] = [],
+        input_fields: list[str] = [],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
+        rows: Optional[Iterable[int]] = None,
+        examples: Optional[Iterable[int]] = None,
+        overwrite: bool = False,
+        num_processes: Optional[int] = None,
+        queue_path: Optional[str] = None
+    ):
+        """Analyze a CSV file (in place) using several worker processes. Sync wrapper."""
+        return run_async(self.analyze_csv_distributed_async(
+            path, prompt, similarity_queries, input_fields, output_fields, rows, examples, overwrite,
+            num_processes, queue_path
+        ))
+
+    async def join_csv_job_async(
+        self,
+        path: str,
+        prompt: str = '',
+        similarity_queries: list[str] = [],
+        input_fields: list[str] = [],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
+        examples: Optional[Iterable[int]] = None,
+        num_processes: Optional[int] = None,
+        queue_path: Optional[str] = None
+    ):
+        """
+        Help with a job started by `analyze_csv_distributed` on another machine that shares the filesystem.
+        The arguments must be the same as those of the original job. Async version.
+        """
+        from gpt_scientist.processors.distributed import join_csv_job
+        output_fields, output_types = normalize_output_fields(output_fields)
+        job = self._distributed_job(prompt, similarity_queries, input_fields, output_fields, output_types, examples)
+        await join_csv_job(path, job, self._worker_settings(), num_processes or os.cpu_count() or 1,
+                           10 * self.parallel_rows, queue_path)
+
+    def join_csv_job(
+        self,
+        path: str,
+        prompt: str = '',
+        similarity_queries: list[str] = [],
+        input_fields: list[str] = [],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
+        examples: Optional[Iterable[int]] = None,
+        num_processes: Optional[int] = None,
+        queue_path: Optional[str] = None
+    ):
+        """Help with a job started by `analyze_csv_distributed` on another machine. Sync wrapper."""
+        return run_async(self.join_csv_job_async(
+            path, prompt, similarity_queries, input_fields, output_fields, examples, num_processes, queue_path
         ))
 
     # Google Sheets processing methods
@@ -182,25 +757,32 @@ class Scientist:
         prompt: str,
         similarity_queries: list[str] = [],
         input_fields: list[str] = [],
-        output_fields: list[str] = ['gpt_output'],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
         rows: str = ':',
         examples: str = '',
         overwrite: bool = False,
-        worksheet_index: int = 0
+        worksheet_index: int = 0,
+        dry_run: bool = False
     ):
         """
         When in Colab: analyze data in the Google Sheet with key `sheet_key`.
+        `output_fields` is a list of field names, or a dictionary from field names to their types (see `analyze_csv_async`).
+        With `dry_run=True`, the sheet is not modified; instead, return a JobEstimate of the tokens, cost and time the job would take.
         Async version.
         """
-        llm_client = self._create_llm_client()
-        # Reset stats for this analysis run
-        self._init_job_stats()
-        assert self.stats is not None
-        return await analyze_google_sheet(
-            sheet_key, prompt, similarity_queries, input_fields, output_fields,
-            rows, examples, overwrite, worksheet_index, llm_client,
-            self.similarity_mode, self.parallel_rows, self.stats
-        )
+        from gpt_scientist.processors.sheets import analyze_google_sheet
+        output_fields, output_types = normalize_output_fields(output_fields)
+        async with self.connection_pool.connect(self.parallel_rows) as http_client:
+            llm_client = self._create_llm_client(http_client)
+            # Reset stats for this analysis run
+            self._init_job_stats()
+            assert self.stats is not None
+            return await analyze_google_sheet(
+                sheet_key, prompt, similarity_queries, input_fields, output_fields,
+                rows, examples, overwrite, worksheet_index, llm_client,
+                self.similarity_mode, self.parallel_rows, self.stats,
+                self._estimate_options() if dry_run else None, output_types=output_types, **self._job_options()
+            )
 
     def analyze_google_sheet(
         self,
@@ -208,11 +790,12 @@ class Scientist:
         prompt: str,
         similarity_queries: list[str] = [],
         input_fields: list[str] = [],
-        output_fields: list[str] = ['gpt_output'],
+        output_fields: list[str] | dict[str, Any] = ['gpt_output'],
         rows: str = ':',
         examples: str = '',
         overwrite: bool = False,
-        worksheet_index: int = 0
+        worksheet_index: int = 0,
+        dry_run: bool = False
     ):
         """
         When in Colab: analyze data in the Google Sheet with key `sheet_key`.
@@ -220,17 +803,123 @@ class Scientist:
         """
         return run_async(self.analyze_google_sheet_async(
             sheet_key, prompt, similarity_queries, input_fields, output_fields,
-            rows, examples, overwrite, worksheet_index
+            rows, examples, overwrite, worksheet_index, dry_run
         ))
 
+    # Multi-task methods
+    async def analyze_dataframe_tasks_async(
+        self,
+        data: 'DataFrame',
+        tasks: list[dict],
+        rows: Optional[Iterable[int]] = None,
+        overwrite: bool = False,
+        in_place: bool = False,
+        write_output_rows: Optional[Callable[['ResultBatch'], None]] = None
+    ):
+        """
+        Analyze a dataframe held in memory with several prompts in one pass (see `analyze_csv_tasks_async`) - async version.
+        Return a copy of `data` with the output fields of all tasks filled in (or `data` itself, with `in_place=True`).
+        `write_output_rows`, if given, is called with a separate batch of results for every task.
+        """
+        from gpt_scientist.processors.dataframe import analyze_dataframe_tasks
+        created = self._create_tasks(tasks)
+        async with self.connection_pool.connect(self.parallel_rows) as http_client:
+            llm_client = self._create_llm_client(http_client)
+            self._init_job_stats()
+            assert self.stats is not None
+            return await analyze_dataframe_tasks(
+                data, created, rows, overwrite, llm_client, self.parallel_rows, self.stats, in_place, write_output_rows,
+                **self._task_options()
+            )
+
+    def analyze_dataframe_tasks(
+        self,
+        data: 'DataFrame',
+        tasks: list[dict],
+        rows: Optional[Iterable[int]] = None,
+        overwrite: bool = False,
+        in_place: bool = False,
+        write_output_rows: Optional[Callable[['ResultBatch'], None]] = None
+    ):
+        """Analyze a dataframe held in memory with several prompts in one pass - sync wrapper."""
+        return run_async(self.analyze_dataframe_tasks_async(data, tasks, rows, overwrite, in_place, write_output_rows))
+
+    async def analyze_csv_tasks_async(
+        self,
+        path: str,
+        tasks: list[dict],
+        rows: Optional[Iterable[int]] = None,
+        overwrite: bool = False
+    ):
+        """
+        Analyze a CSV file (in place) with several prompts in one pass - async version.
+        Every task is a dictionary with a `prompt`, `input_fields` and `output_fields` (as in `analyze_csv_async`;
+        every task needs its own output fields), and optionally `examples` (rows) and a `name` (default: its first output field).
+        The file is read and written once, and requests of all tasks share the workers (`parallel_rows` in total),
+        so they are interleaved row by row; `self.stats.tasks` holds the progress and usage of every task.
+        The budget, schedule and result buffer apply to the whole job; deduplication, chunking and example selection do not.
+        """
+        from gpt_scientist.processors.csv import analyze_csv_tasks
+        created = self._create_tasks(tasks)
+        async with self.connection_pool.connect(self.parallel_rows) as http_client:
+            llm_client = self._create_llm_client(http_client)
+            self._init_job_stats()
+            assert self.stats is not None
+            await analyze_csv_tasks(path, created, rows, overwrite, llm_client, self.parallel_rows, self.stats,
+                                    **self._task_options())
+
+    def analyze_csv_tasks(
+        self,
+        path: str,
+        tasks: list[dict],
+        rows: Optional[Iterable[int]] = None,
+        overwrite: bool = False
+    ):
+        """Analyze a CSV file (in place) with several prompts in one pass - sync wrapper."""
+        return run_async(self.analyze_csv_tasks_async(path, tasks, rows, overwrite))
+
+    async def analyze_google_sheet_tasks_async(
+        self,
+        sheet_key: str,
+        tasks: list[dict],
+        rows: str = ':',
+        overwrite: bool = False,
+        worksheet_index: int = 0
+    ):
+        """
+        When in Colab: analyze data in the Google Sheet with key `sheet_key` with several prompts in one pass
+        (see `analyze_csv_tasks_async`); the `examples` of a task are a range of rows, as in `analyze_google_sheet_async`.
+        The sheet is read, and linked Google Docs are fetched, only once. Async version.
+        """
+        from gpt_scientist.processors.sheets import analyze_google_sheet_tasks
+        created = self._create_tasks(tasks)
+        async with self.connection_pool.connect(self.parallel_rows) as http_client:
+            llm_client = self._create_llm_client(http_client)
+            self._init_job_stats()
+            assert self.stats is not None
+            await analyze_google_sheet_tasks(sheet_key, created, rows, overwrite, worksheet_index, llm_client,
+                                             self.parallel_rows, self.stats, **self._task_options())
+
+    def analyze_google_sheet_tasks(
+        self,
+        sheet_key: str,
+        tasks: list[dict],
+        rows: str = ':',
+        overwrite: bool = False,
+        worksheet_index: int = 0
+    ):
+        """When in Colab: analyze data in the Google Sheet with several prompts in one pass. Sync wrapper."""
+        return run_async(self.analyze_google_sheet_tasks_async(sheet_key, tasks, rows, overwrite, worksheet_index))
+
     def check_quotes(
         self,
-        data: DataFrame,
+        data: 'DataFrame',
         output_field: str,
         input_fields: list[str] = [],
         rows: Iterable[int] | None = None
     ):
         """Check quotes in a DataFrame."""
+        from gpt_scientist.verification.quotes import check_quotes
         if rows is None:
             rows = range(len(data))
         check_quotes(data, output_field, input_fields, rows, self.fuzzy_threshold)
@@ -244,6 +933,7 @@ class Scientist:
         rows: Iterable[int] | None = None
     ):
         """Check quotes in a CSV file. Async version."""
+        from gpt_scientist.processors.csv import check_quotes_csv
         await check_quotes_csv(path, output_field, input_fields, rows, self.fuzzy_threshold)
 
     def check_quotes_csv(
@@ -265,6 +955,7 @@ class Scientist:
         worksheet_index: int = 0
     ):
         """Check quotes in a Google Sheet. Async version."""
+        from gpt_scientist.processors.sheets import check_quotes_google_sheet
         await check_quotes_google_sheet(
             sheet_key, output_field, input_fields, rows, worksheet_index, self.fuzzy_threshold
         )
@@ -1,14 +1,118 @@
 """Data models for gpt_scientist."""
 
 import logging
+import os
+import sys
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Optional
 logger = logging.getLogger(__name__)
 
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Stages of row processing whose latency is tracked ('first_field': until the first output field is streamed)
+LATENCY_STAGES = ('api', 'first_field', 'parse', 'write')
+
+
+def resident_memory() -> Optional[int]:
+    '''Return the memory (RSS) currently used by this process in bytes, or None if it is not known on this platform.'''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_resident_memory() -> Optional[int]:
+    '''Return the largest memory (RSS) used by this process so far in bytes, or None if it is not known on this platform.'''
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Bytes on macOS, kilobytes elsewhere
+
+
+class Histogram:
+    '''Latency histogram with fixed buckets (in the style of Prometheus histograms).'''
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        '''Record a single observation.'''
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        '''
+        Estimate the q-quantile as the upper bound of the bucket that contains it.
+        Observations beyond the last bucket are reported as the last finite bound.
+        '''
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        '''Return a summary of the histogram as a dictionary.'''
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+class RateWindow:
+    '''Rate of events per second over a sliding time window.'''
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.events: deque[tuple[float, float]] = deque()  # (timestamp, amount)
+        self.start = time.monotonic()
+
+    def _prune(self, now: float):
+        while self.events and self.events[0][0] < now - self.window:
+            self.events.popleft()
+
+    def add(self, amount: float):
+        '''Record `amount` events happening now.'''
+        now = time.monotonic()
+        self.events.append((now, amount))
+        self._prune(now)
+
+    def rate(self) -> float:
+        '''Return the number of events per second in the window (or since start, if the job is younger than the window).'''
+        now = time.monotonic()
+        self._prune(now)
+        elapsed = min(self.window, now - self.start)
+        if elapsed <= 0:
+            return 0.0
+        return sum(amount for _, amount in self.events) / elapsed
+
 
 class JobStats:
     '''Statistics for a table processing job.'''
 
-    def __init__(self, model: str, pricing: dict, report_interval: int = 10):
-        '''Initialize JobStats with optional pricing information.'''
+    def __init__(self, model: str, pricing: dict, report_interval: int = 10, window: float = 60.0):
+        '''
+        Initialize JobStats with optional pricing information.
+        `window` is the length (in seconds) of the sliding window used to compute throughput.
+        '''
         self.model = model
         self.pricing = pricing
         self.report_interval = report_interval
@@ -16,26 +120,364 @@ class JobStats:
         self.errors = 0
         self.input_tokens = 0
         self.output_tokens = 0
+        # Instrumentation
+        self.start_time = time.monotonic()
+        self.rows_total: Optional[int] = None  # Number of rows scheduled for processing, if known
+        self.rows_skipped = 0  # Requested rows that were not scheduled (already filled or nonexistent)
+        self.latency = {stage: Histogram() for stage in LATENCY_STAGES}
+        self.row_rate = RateWindow(window)
+        self.token_rate = RateWindow(window)
+        self.retries: dict[str, int] = {}  # Cause -> number of retries
+        self.in_flight = 0  # Number of requests currently awaiting a response from the API
+        self.queues: dict = {}  # Name -> asyncio.Queue whose depth is reported
+        self.unprocessed_rows: list[int] = []  # Rows that were not processed because the budget ran out
+        self.duplicates_skipped = 0  # Rows that got the response of an identical row instead of their own request
+        self.rows_inherited = 0  # Rows that inherited the response of a near-duplicate row
+        self.usage_by_model: dict[str, dict] = {}  # Model -> input and output tokens of the requests it served
+        self.rows_chunked = 0  # Rows whose inputs were too long for one request and were split into chunks
+        self.chunks = 0  # Chunks those rows were split into
+        self.backpressure_waits = 0  # Results that had to wait for room in the output queue (the writer was behind)
+        self.backpressure_seconds = 0.0  # Total time workers waited for the writer
+        self.results_saving = 0  # Results taken off the output queue that the writer is saving
+        self.streams_aborted = 0  # Streamed requests abandoned because their responses could not be valid
+        self.escalations: dict[str, int] = {}  # Model -> number of rows escalated from it to the next model of a cascade
+        self.endpoints: dict[str, dict] = {}  # Endpoint name -> requests, errors, tokens and latency (with a router)
+        self.tasks: dict[str, 'JobStats'] = {}  # Task name -> stats of that task (in a multi-task job)
+        self.connection_stats = None  # ConnectionStats of the connection pool used by the job, if any
+        self.connections_baseline = (0, 0)  # Requests and connections opened by the pool before the job
+
+    def model_cost(self, model: str, input_tokens: int, output_tokens: int) -> dict:
+        '''Return the cost of the given number of tokens of `model`.'''
+        model_pricing = self.pricing.get(model, {})
+        return {'input': model_pricing.get('input', 0) * input_tokens / 1e6,
+                'output': model_pricing.get('output', 0) * output_tokens / 1e6}
 
     def current_cost(self) -> dict:
-        '''Return the cost corresponding to the current number of input and output tokens.'''
-        current_pricing = self.pricing.get(self.model, {})
-        input_cost = current_pricing.get('input', 0) * self.input_tokens / 1e6
-        output_cost = current_pricing.get('output', 0) * self.output_tokens / 1e6
-        return {'input': input_cost, 'output': output_cost}
+        '''
+        Return the cost corresponding to the current number of input and output tokens.
+        If tokens were recorded per model (e.g. with a cascade), the totals are priced at the mix of models that served them;
+        otherwise they are priced as `model`.
+        '''
+        cost = {}
+        for kind, total in (('input', self.input_tokens), ('output', self.output_tokens)):
+            # Requests are recorded per model as soon as they return, but only added to the totals once their rows are written,
+            # so use the per-model usage for the price per token, not for the number of tokens
+            tokens = sum(usage[f'{kind}_tokens'] for usage in self.usage_by_model.values())
+            if tokens:
+                price = sum(self.pricing.get(model, {}).get(kind, 0) * usage[f'{kind}_tokens']
+                            for model, usage in self.usage_by_model.items()) / tokens
+            else:
+                price = self.pricing.get(self.model, {}).get(kind, 0)
+            cost[kind] = price * total / 1e6
+        return cost
 
     def report_cost(self):
         cost = self.current_cost()
-        logger.info(f"PROCESSED {self.rows_processed} ROWS. TOTAL_COST: ${cost['input']:.4f} + ${cost['output']:.4f} = ${cost['input'] + cost['output']:.4f}")
+        progress = ''
+        eta = self.eta()
+        if eta is not None:
+            progress = f" ({self.row_rate.rate():.1f} ROWS/S, ETA {eta:.0f}S)"
+        logger.info(f"PROCESSED {self.rows_processed} ROWS{progress}. TOTAL_COST: ${cost['input']:.4f} + ${cost['output']:.4f} = ${cost['input'] + cost['output']:.4f}")
 
     def log_rows(self, rows: int, input_tokens: int, output_tokens: int):
         '''Add the tokens used in the current row to the total and log the cost.'''
         self.rows_processed += rows
         self.input_tokens += input_tokens
         self.output_tokens += output_tokens
+        self.row_rate.add(rows)
+        self.token_rate.add(input_tokens + output_tokens)
         if self.report_interval > 0 and self.rows_processed % self.report_interval == 0:
             self.report_cost()
 
     def log_error(self):
         '''Increment the error counter.'''
         self.errors += 1
+
+    def log_retry(self, cause: str):
+        '''Record a retried request; `cause` is a short label, such as an exception name.'''
+        self.retries[cause] = self.retries.get(cause, 0) + 1
+
+    def observe_latency(self, stage: str, seconds: float):
+        '''Record the duration of one processing stage (one of LATENCY_STAGES).'''
+        self.latency[stage].observe(seconds)
+
+    def set_total_rows(self, rows_total: int):
+        '''Set the number of rows scheduled for processing (used to compute the ETA).'''
+        self.rows_total = rows_total
+
+    def watch_queue(self, name: str, queue):
+        '''Report the depth of `queue` under `name` in snapshots.'''
+        self.queues[name] = queue
+
+    def add_task(self, name: str) -> 'JobStats':
+        '''Create the stats of a task of a multi-task job; its rows, errors and tokens are also counted in this job.'''
+        stats = JobStats(self.model, self.pricing, report_interval=0)
+        # Requests are not recorded per task, so the tokens of a task are priced at the mix of models of the whole job
+        stats.usage_by_model = self.usage_by_model
+        self.tasks[name] = stats
+        return stats
+
+    def task_summary(self) -> dict:
+        '''Return the progress, tokens and cost of every task of a multi-task job.'''
+        summary = {}
+        for name, stats in self.tasks.items():
+            cost = stats.current_cost()
+            summary[name] = {
+                'rows_total': stats.rows_total,
+                'rows_processed': stats.rows_processed,
+                'rows_skipped': stats.rows_skipped,
+                'errors': stats.errors,
+                'input_tokens': stats.input_tokens,
+                'output_tokens': stats.output_tokens,
+                'cost': cost['input'] + cost['output'],
+            }
+        return summary
+
+    def log_model_usage(self, model: str, input_tokens: int, output_tokens: int):
+        '''Record the tokens of a request served by `model` (they are priced as that model).'''
+        usage = self.usage_by_model.setdefault(model, {'input_tokens': 0, 'output_tokens': 0})
+        usage['input_tokens'] += input_tokens
+        usage['output_tokens'] += output_tokens
+
+    def log_backpressure(self, seconds: float):
+        '''Record a worker that waited `seconds` for room in the output queue.'''
+        self.backpressure_waits += 1
+        self.backpressure_seconds += seconds
+
+    def memory(self) -> dict:
+        '''Return the memory used by the process and the number of results waiting to be saved.'''
+        output_queue = self.queues.get('output_queue')
+        return {
+            'rss_bytes': resident_memory(),
+            'peak_rss_bytes': peak_resident_memory(),
+            'buffered_results': (output_queue.qsize() if output_queue is not None else 0) + self.results_saving,
+        }
+
+    def log_chunks(self, chunks: int):
+        '''Record a row that was split into `chunks` chunks.'''
+        self.rows_chunked += 1
+        self.chunks += chunks
+
+    def log_stream_abort(self):
+        '''Record a streamed request that was abandoned before it finished.'''
+        self.streams_aborted += 1
+
+    def log_escalation(self, model: str):
+        '''Record a row escalated from `model` to the next model of a cascade.'''
+        self.escalations[model] = self.escalations.get(model, 0) + 1
+
+    def log_endpoint(self, name: str, seconds: float, input_tokens: int = 0, output_tokens: int = 0, failed: bool = False):
+        '''Record a request sent to the endpoint `name` (when requests are routed over several endpoints).'''
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            endpoint = self.endpoints[name] = {'requests': 0, 'errors': 0, 'input_tokens': 0, 'output_tokens': 0,
+                                               'latency': Histogram()}
+        endpoint['requests'] += 1
+        endpoint['errors'] += failed
+        endpoint['input_tokens'] += input_tokens
+        endpoint['output_tokens'] += output_tokens
+        endpoint['latency'].observe(seconds)
+
+    def watch_connections(self, connection_stats):
+        '''Report the requests and connections of a connection pool (see gpt_scientist.llm.http) during this job.'''
+        self.connection_stats = connection_stats
+        self.connections_baseline = (connection_stats.requests, connection_stats.connections_opened)
+
+    def connections(self) -> dict:
+        '''Number of HTTP requests sent during this job, and of connections opened and reused for them.'''
+        if self.connection_stats is None:
+            return {'requests': 0, 'connections_opened': 0, 'connections_reused': 0, 'reuse_ratio': 0.0}
+        requests = self.connection_stats.requests - self.connections_baseline[0]
+        opened = self.connection_stats.connections_opened - self.connections_baseline[1]
+        reused = max(requests - opened, 0)
+        return {'requests': requests, 'connections_opened': opened, 'connections_reused': reused,
+                'reuse_ratio': reused / requests if requests else 0.0}
+
+    def eta(self) -> Optional[float]:
+        '''Estimated number of seconds until all scheduled rows are processed, or None if unknown.'''
+        if self.rows_total is None:
+            return None
+        remaining = max(self.rows_total - self.rows_processed, 0)
+        if remaining == 0:
+            return 0.0
+        rate = self.row_rate.rate()
+        if rate <= 0:
+            return None
+        return remaining / rate
+
+    def snapshot(self) -> dict:
+        '''Return all current metrics as a (JSON-serializable) dictionary.'''
+        cost = self.current_cost()
+        return {
+            'model': self.model,
+            'elapsed': time.monotonic() - self.start_time,
+            'rows_total': self.rows_total,
+            'rows_processed': self.rows_processed,
+            'rows_skipped': self.rows_skipped,
+            'errors': self.errors,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cost': cost['input'] + cost['output'],
+            'rows_per_second': self.row_rate.rate(),
+            'tokens_per_second': self.token_rate.rate(),
+            'eta': self.eta(),
+            'unprocessed_rows': len(self.unprocessed_rows),
+            'duplicates_skipped': self.duplicates_skipped,
+            'rows_inherited': self.rows_inherited,
+            'in_flight': self.in_flight,
+            'queue_depth': {name: queue.qsize() for name, queue in self.queues.items()},
+            'connections': self.connections(),
+            'usage_by_model': {model: {**usage, 'cost': sum(self.model_cost(model, usage['input_tokens'], usage['output_tokens']).values())}
+                               for model, usage in self.usage_by_model.items()},
+            'escalations': dict(self.escalations),
+            'streams_aborted': self.streams_aborted,
+            'memory': self.memory(),
+            'backpressure': {'waits': self.backpressure_waits, 'seconds': self.backpressure_seconds},
+            'rows_chunked': self.rows_chunked,
+            'chunks': self.chunks,
+            'endpoints': {name: {**endpoint, 'latency': endpoint['latency'].snapshot()} for name, endpoint in self.endpoints.items()},
+            'tasks': self.task_summary(),
+            'retries': dict(self.retries),
+            'latency': {stage: hist.snapshot() for stage, hist in self.latency.items()},
+        }
+
+    def to_prometheus(self, prefix: str = 'gpt_scientist') -> str:
+        '''Return all current metrics in the Prometheus text exposition format.'''
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list[tuple[str, float]]):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{prefix}_{name}{labels} {value}')
+
+        cost = self.current_cost()
+        metric('rows_processed_total', 'counter', 'Rows processed, including failed rows.', [('', self.rows_processed)])
+        metric('rows_failed_total', 'counter', 'Rows for which no valid response was generated.', [('', self.errors)])
+        metric('rows_skipped_total', 'counter', 'Requested rows that were not scheduled (already filled or nonexistent).', [('', self.rows_skipped)])
+        metric('duplicates_skipped_total', 'counter', 'Rows that reused the response of an identical row.', [('', self.duplicates_skipped)])
+        metric('rows_inherited_total', 'counter', 'Rows that inherited the response of a near-duplicate row.', [('', self.rows_inherited)])
+        metric('tokens_total', 'counter', 'Tokens used.',
+               [('{kind="input"}', self.input_tokens), ('{kind="output"}', self.output_tokens)])
+        metric('cost_dollars_total', 'counter', 'Cost of the tokens used.',
+               [('{kind="input"}', cost['input']), ('{kind="output"}', cost['output'])])
+        metric('retries_total', 'counter', 'Retried requests by cause.',
+               [(f'{{cause="{cause}"}}', count) for cause, count in self.retries.items()])
+        metric('rows_per_second', 'gauge', 'Rows processed per second over the sliding window.', [('', self.row_rate.rate())])
+        metric('tokens_per_second', 'gauge', 'Tokens used per second over the sliding window.', [('', self.token_rate.rate())])
+        metric('in_flight_requests', 'gauge', 'Requests awaiting a response from the API.', [('', self.in_flight)])
+        metric('queue_depth', 'gauge', 'Number of items waiting in a queue.',
+               [(f'{{queue="{name}"}}', queue.qsize()) for name, queue in self.queues.items()])
+        memory = self.memory()
+        if memory['rss_bytes'] is not None:
+            metric('resident_memory_bytes', 'gauge', 'Memory used by the process.', [('', memory['rss_bytes'])])
+        metric('buffered_results', 'gauge', 'Results waiting to be saved.', [('', memory['buffered_results'])])
+        metric('backpressure_seconds_total', 'counter', 'Time workers waited for the writer to catch up.',
+               [('', self.backpressure_seconds)])
+        metric('rows_chunked_total', 'counter', 'Rows whose inputs were split into chunks.', [('', self.rows_chunked)])
+        metric('chunks_total', 'counter', 'Chunks that long rows were split into.', [('', self.chunks)])
+        metric('streams_aborted_total', 'counter', 'Streamed requests abandoned because their responses could not be valid.',
+               [('', self.streams_aborted)])
+        if self.usage_by_model:
+            metric('model_tokens_total', 'counter', 'Tokens used by each model.',
+                   [(f'{{model="{model}",kind="{kind}"}}', usage[f'{kind}_tokens'])
+                    for model, usage in self.usage_by_model.items() for kind in ('input', 'output')])
+        if self.escalations:
+            metric('escalations_total', 'counter', 'Rows escalated from each model to the next model of a cascade.',
+                   [(f'{{model="{model}"}}', count) for model, count in self.escalations.items()])
+        if self.endpoints:
+            metric('endpoint_requests_total', 'counter', 'Requests sent to each endpoint.',
+                   [(f'{{endpoint="{name}"}}', endpoint['requests']) for name, endpoint in self.endpoints.items()])
+            metric('endpoint_errors_total', 'counter', 'Failed requests to each endpoint.',
+                   [(f'{{endpoint="{name}"}}', endpoint['errors']) for name, endpoint in self.endpoints.items()])
+            metric('endpoint_tokens_total', 'counter', 'Tokens used at each endpoint.',
+                   [(f'{{endpoint="{name}",kind="{kind}"}}', endpoint[f'{kind}_tokens'])
+                    for name, endpoint in self.endpoints.items() for kind in ('input', 'output')])
+            metric('endpoint_latency_seconds_sum', 'counter', 'Total duration of requests to each endpoint.',
+                   [(f'{{endpoint="{name}"}}', endpoint['latency'].sum) for name, endpoint in self.endpoints.items()])
+        if self.tasks:
+            tasks = self.task_summary()
+            metric('task_rows_processed_total', 'counter', 'Rows processed by each task of a multi-task job.',
+                   [(f'{{task="{name}"}}', task['rows_processed']) for name, task in tasks.items()])
+            metric('task_rows_failed_total', 'counter', 'Rows for which a task got no valid response.',
+                   [(f'{{task="{name}"}}', task['errors']) for name, task in tasks.items()])
+            metric('task_tokens_total', 'counter', 'Tokens used by each task.',
+                   [(f'{{task="{name}",kind="{kind}"}}', task[f'{kind}_tokens'])
+                    for name, task in tasks.items() for kind in ('input', 'output')])
+        connections = self.connections()
+        metric('http_requests_total', 'counter', 'HTTP requests sent to the API.', [('', connections['requests'])])
+        metric('connections_opened_total', 'counter', 'HTTP connections opened to the API.', [('', connections['connections_opened'])])
+        metric('connections_reused_total', 'counter', 'HTTP requests sent over an already open connection.',
+               [('', connections['connections_reused'])])
+        eta = self.eta()
+        if eta is not None:
+            metric('eta_seconds', 'gauge', 'Estimated time until all scheduled rows are processed.', [('', eta)])
+
+        samples = []
+        for stage, hist in self.latency.items():
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                samples.append((f'_bucket{{stage="{stage}",le="{bound}"}}', cumulative))
+            samples.append((f'_bucket{{stage="{stage}",le="+Inf"}}', hist.count))
+            samples.append((f'_sum{{stage="{stage}"}}', hist.sum))
+            samples.append((f'_count{{stage="{stage}"}}', hist.count))
+        lines.append(f'# HELP {prefix}_latency_seconds Duration of row processing stages.')
+        lines.append(f'# TYPE {prefix}_latency_seconds histogram')
+        for suffix_and_labels, value in samples:
+            lines.append(f'{prefix}_latency_seconds{suffix_and_labels} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class JobEstimate:
+    '''Projected size, cost and duration of a table processing job, as computed by a dry run.'''
+
+    def __init__(self, model: str, pricing: dict, rows: int, input_tokens: int,
+                 output_tokens: Optional[int], seconds: Optional[float], sample_rows: int = 0):
+        '''
+        `output_tokens` is None if it could not be estimated (no sample was run);
+        `seconds` is the projected wall time, or None if neither rate limits nor sample latency are known.
+        '''
+        self.model = model
+        self.pricing = pricing
+        self.rows = rows
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.seconds = seconds
+        self.sample_rows = sample_rows
+
+    def cost(self) -> dict:
+        '''Return the projected cost of the input and output tokens (output cost is None if unknown).'''
+        current_pricing = self.pricing.get(self.model, {})
+        input_cost = current_pricing.get('input', 0) * self.input_tokens / 1e6
+        output_cost = None
+        if self.output_tokens is not None:
+            output_cost = current_pricing.get('output', 0) * self.output_tokens / 1e6
+        return {'input': input_cost, 'output': output_cost}
+
+    def to_dict(self) -> dict:
+        cost = self.cost()
+        return {
+            'model': self.model,
+            'rows': self.rows,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cost': cost,
+            'seconds': self.seconds,
+            'sample_rows': self.sample_rows,
+        }
+
+    def report(self):
+        cost = self.cost()
+        output = f"{self.output_tokens} output tokens" if self.output_tokens is not None else "unknown output tokens"
+        if cost['output'] is None:
+            total = f"${cost['input']:.4f} + output"
+        else:
+            total = f"${cost['input']:.4f} + ${cost['output']:.4f} = ${cost['input'] + cost['output']:.4f}"
+        duration = f"{self.seconds / 60:.1f} MINUTES" if self.seconds is not None else "UNKNOWN TIME"
+        logger.info(f"DRY RUN: {self.rows} ROWS, {self.input_tokens} input tokens, {output}. "
+                    f"PROJECTED COST: {total}, {duration}")
+
+    def __repr__(self):
+        return f"JobEstimate({self.to_dict()})"
@@ -0,0 +1,203 @@
+"""Tracing hooks for job lifecycle events, with Chrome trace and OpenTelemetry exporters."""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Event phases (same letters as in the Chrome trace event format)
+BEGIN = 'B'
+END = 'E'
+INSTANT = 'i'
+
+
+def _current_track() -> int:
+    """Identify the current asyncio task (or thread, outside of a task); events on one track nest properly."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+class Tracer:
+    """
+    Receives lifecycle events from the workers, the writer and the LLM client.
+    Events are spans (`begin`/`end` pairs) or instants, and are emitted with a timestamp
+    and the track (asyncio task) they happened on.
+    The following events are emitted:
+    - row_enqueued (instant): a row was put in the work queue;
+    - row (span): a worker processes a row, including:
+      - lookup (span): the row is looked up in the dataframe,
+      - prompt (span): the prompt is built,
+      - request (span): one API request,
+      - retry (instant): the previous attempt failed and the request is retried,
+      - parse (span): the completion is parsed;
+    - apply (span): the writer stores a batch of responses in the dataframe;
+    - write (span): the writer persists a batch of rows (e.g. to a file or a Google Sheet).
+    Subclass and override `emit` to plug in a custom exporter.
+    """
+
+    def __init__(self):
+        # Reference points to convert perf_counter timestamps to wall-clock time
+        self.perf_origin = time.perf_counter_ns()
+        self.epoch_origin = time.time_ns()
+
+    def emit(self, name: str, phase: str, timestamp: int, track: int, attrs: dict):
+        """Handle an event; `timestamp` is in perf_counter nanoseconds."""
+        pass
+
+    def begin(self, name: str, **attrs):
+        self.emit(name, BEGIN, time.perf_counter_ns(), _current_track(), attrs)
+
+    def end(self, name: str, **attrs):
+        self.emit(name, END, time.perf_counter_ns(), _current_track(), attrs)
+
+    def instant(self, name: str, **attrs):
+        self.emit(name, INSTANT, time.perf_counter_ns(), _current_track(), attrs)
+
+    def to_epoch_ns(self, timestamp: int) -> int:
+        """Convert a perf_counter timestamp to nanoseconds since the epoch."""
+        return self.epoch_origin + (timestamp - self.perf_origin)
+
+
+class ChromeTraceExporter(Tracer):
+    """
+    Collect events in memory and export them in the Chrome trace event format,
+    which can be opened in chrome://tracing or https://ui.perfetto.dev.
+    Every asyncio task (worker, writer, scheduler) is shown as a separate thread.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.events: list[tuple[str, str, int, int, dict]] = []
+        self.tracks: dict[int, int] = {}  # Track -> small thread id
+
+    def emit(self, name: str, phase: str, timestamp: int, track: int, attrs: dict):
+        self.events.append((name, phase, timestamp, track, attrs))
+
+    def to_dict(self) -> dict:
+        trace_events = []
+        for name, phase, timestamp, track, attrs in self.events:
+            tid = self.tracks.setdefault(track, len(self.tracks))
+            event = {
+                'name': name,
+                'ph': phase,
+                'ts': (timestamp - self.perf_origin) / 1000,  # Microseconds
+                'pid': 1,
+                'tid': tid,
+                'args': attrs,
+            }
+            if phase == INSTANT:
+                event['s'] = 't'  # Thread-scoped instant
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path: str):
+        """Write the trace to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, default=str)
+        logger.info(f"Saved trace with {len(self.events)} events to {path}")
+
+
+class SpanTracer(Tracer):
+    """
+    Pair begin and end events into spans and pass each finished span to `on_span`
+    as a dictionary with OpenTelemetry field names
+    (name, span_id, parent_span_id, start_time_unix_nano, end_time_unix_nano, attributes).
+    Instant events become zero-length spans.
+    Override `on_span` to stream spans to a custom backend.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stacks: dict[int, list[dict]] = {}  # Track -> open spans
+        self.next_id = 1
+
+    def on_span(self, span: dict):
+        pass
+
+    def _new_span(self, name: str, timestamp: int, track: int, attrs: dict) -> dict:
+        stack = self.stacks.setdefault(track, [])
+        span = {
+            'name': name,
+            'span_id': self.next_id,
+            'parent_span_id': stack[-1]['span_id'] if stack else None,
+            'start_time_unix_nano': self.to_epoch_ns(timestamp),
+            'end_time_unix_nano': None,
+            'attributes': dict(attrs),
+        }
+        self.next_id += 1
+        return span
+
+    def emit(self, name: str, phase: str, timestamp: int, track: int, attrs: dict):
+        if phase == BEGIN:
+            self.stacks.setdefault(track, []).append(self._new_span(name, timestamp, track, attrs))
+        elif phase == END:
+            stack = self.stacks.get(track)
+            if not stack or all(span['name'] != name for span in stack):
+                logger.debug(f"Unmatched end of span {name}")
+                return
+            # Spans left open inside this one (e.g. because of an exception) end together with it
+            while True:
+                span = stack.pop()
+                span['end_time_unix_nano'] = self.to_epoch_ns(timestamp)
+                if span['name'] == name:
+                    span['attributes'].update(attrs)
+                self.on_span(span)
+                if span['name'] == name:
+                    break
+            if not stack:
+                del self.stacks[track]
+        else:
+            span = self._new_span(name, timestamp, track, attrs)
+            span['end_time_unix_nano'] = span['start_time_unix_nano']
+            if not self.stacks[track]:
+                del self.stacks[track]
+            self.on_span(span)
+
+
+class OpenTelemetryExporter(SpanTracer):
+    """
+    Forward spans to OpenTelemetry (requires the `opentelemetry-api` package),
+    preserving their original start and end times and their nesting.
+    """
+
+    def __init__(self, otel_tracer=None):
+        super().__init__()
+        if otel_tracer is None:
+            from opentelemetry import trace
+            otel_tracer = trace.get_tracer('gpt_scientist')
+        self.otel_tracer = otel_tracer
+        self.otel_spans: dict[int, object] = {}  # Our span id -> OpenTelemetry span (only for open parents)
+
+    def emit(self, name: str, phase: str, timestamp: int, track: int, attrs: dict):
+        # Start the OpenTelemetry span when ours begins, so that children can refer to it as their parent
+        super().emit(name, phase, timestamp, track, attrs)
+        if phase == BEGIN:
+            span = self.stacks[track][-1]
+            self.otel_spans[span['span_id']] = self._start(span)
+
+    def _start(self, span: dict):
+        from opentelemetry import trace
+        parent = self.otel_spans.get(span['parent_span_id'])
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        return self.otel_tracer.start_span(
+            span['name'],
+            context=context,
+            start_time=span['start_time_unix_nano'],
+            attributes={k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in span['attributes'].items()},
+        )
+
+    def on_span(self, span: dict):
+        otel_span = self.otel_spans.pop(span['span_id'], None)
+        if otel_span is None:  # Instant event
+            otel_span = self._start(span)
+        else:
+            for key, value in span['attributes'].items():
+                otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        otel_span.end(end_time=span['end_time_unix_nano'])
+
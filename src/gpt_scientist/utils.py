@@ -21,7 +21,7 @@ def run_async(coro: Awaitable[T]) -> T:
     Run an async coroutine, handling different contexts (script, notebook, async context).
     """
     try:
-        loop = asyncio.get_running_loop()
+        asyncio.get_running_loop()
     except RuntimeError:
         # No loop: scripts/CLI
         return asyncio.run(coro)
@@ -34,13 +34,17 @@ def run_async(coro: Awaitable[T]) -> T:
             "use the async API directly (e.g., `await analyze_csv_async(...)`)."
         )
 
-    # Notebook path: best-effort patch
-    try:
-        import nest_asyncio
-        nest_asyncio.apply(loop)
-        return loop.run_until_complete(coro)
-    except Exception as e:
+    # Notebook path: the kernel's loop cannot be re-entered, so run the job on the background loop and wait for it
+    from gpt_scientist.jobs import background
+    if background.in_loop():
         raise RuntimeError(
-            "Failed to run in a notebook event loop (nest_asyncio apply/run). "
-            "Use the async API with `await` instead."
-        ) from e
+            "gpt_scientist sync wrapper was called from a background job; "
+            "use the async API directly (e.g., `await analyze_csv_async(...)`)."
+        )
+    future = background.submit(coro)
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        # Interrupting the cell stops the job, as it does in a script
+        future.cancel()
+        raise
@@ -5,7 +5,6 @@ import logging
 import re
 import pandas as pd
 from typing import Iterable
-from fuzzysearch import find_near_matches
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +77,7 @@ def fuzzy_find_in_text(quote: str, text: str, fuzzy_threshold: float) -> tuple[s
 
     # Otherwise, use fuzzy search to find the closest
     max_distance = int(len(quote) * fuzzy_threshold)
+    from fuzzysearch import find_near_matches  # Imported on first use, since it is slow to import
     matches = find_near_matches(quote, text, max_l_dist=max_distance)
     if not matches:
         return None
@@ -0,0 +1,28 @@
+"""Shared fixtures: a local stub of the OpenAI API (see benchmarks/fake_openai.py), and scientists that use it."""
+
+import pytest
+from fake_openai import StubConfig, StubServer
+from gpt_scientist import Scientist
+
+
+@pytest.fixture
+def stub_config() -> StubConfig:
+    """How the stub server behaves; override this fixture for latency, errors, invalid responses, etc."""
+    return StubConfig()
+
+
+@pytest.fixture
+def server(stub_config):
+    with StubServer(stub_config) as server:
+        yield server
+
+
+@pytest.fixture
+def make_scientist(server, monkeypatch):
+    """A factory of scientists that send all their requests to the stub server (worker processes included)."""
+    monkeypatch.setenv('OPENAI_BASE_URL', server.base_url)
+
+    def make() -> Scientist:
+        return Scientist(api_key='stub', offline=True)
+
+    return make
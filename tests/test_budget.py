@@ -0,0 +1,43 @@
+"""Stopping a job when its budget runs out, and resuming it."""
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def reviews(tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': [f'review number {k}' for k in range(60)]}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_budget_stops_job_and_rerun_resumes(make_scientist, reviews):
+    sc = make_scientist()
+    sc.set_budget(max_tokens=1500)
+    sc.analyze_csv(reviews, 'Summarize the review.', input_fields=['review'], output_fields=['summary'])
+
+    unprocessed = sc.stats.unprocessed_rows
+    result = pd.read_csv(reviews, dtype=str, na_filter=False)
+    assert 0 < len(unprocessed) < 60
+    assert sc.stats.rows_processed + len(unprocessed) == 60
+    assert result.index[result['summary'] == ''].tolist() == list(unprocessed)
+    assert sc.stats.input_tokens + sc.stats.output_tokens <= 1500
+
+    sc.set_budget()
+    sc.analyze_csv(reviews, 'Summarize the review.', input_fields=['review'], output_fields=['summary'])
+    result = pd.read_csv(reviews, dtype=str, na_filter=False)
+    assert sc.stats.rows_processed == len(unprocessed)
+    assert sc.stats.unprocessed_rows == []
+    assert (result['summary'] != '').all()
+
+
+def test_cost_budget(make_scientist, reviews):
+    sc = make_scientist()
+    sc.set_budget(max_cost=0.0002)
+    sc.analyze_csv(reviews, 'Summarize the review.', input_fields=['review'], output_fields=['summary'])
+
+    cost = sc.stats.current_cost()
+    result = pd.read_csv(reviews, dtype=str, na_filter=False)
+    assert cost['input'] + cost['output'] <= 0.0002
+    assert len(sc.stats.unprocessed_rows) > 0
+    assert (result.loc[sc.stats.unprocessed_rows, 'summary'] == '').all()
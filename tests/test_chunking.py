@@ -0,0 +1,70 @@
+"""Splitting long inputs into chunks, and combining the results of the chunks."""
+
+import pandas as pd
+import pytest
+from fake_openai import StubConfig
+from gpt_scientist.processors.chunking import MERGE_PROMPT, Chunker
+
+LONG = ' '.join(f'word{k}' for k in range(6000))
+OUTPUT_FIELDS = {'summary': str, 'n': int, 'spam': bool, 'tags': list[str]}
+
+
+@pytest.fixture
+def stub_config():
+    return StubConfig(keep_messages=True)
+
+
+def reviews() -> pd.DataFrame:
+    return pd.DataFrame({'title': ['long', 'short'], 'text': [LONG, 'a short review']})
+
+
+def test_results_of_chunks_are_combined_by_field():
+    chunker = Chunker('Summarize.', list(OUTPUT_FIELDS), 'gpt-4o-mini', False, 1000, reduce={'n': 'sum'},
+                      output_types={'n': 'int', 'spam': 'bool', 'tags': 'list[str]'})
+    combined = chunker.combine([
+        {'summary': 'first part', 'n': 2, 'spam': False, 'tags': ['a', 'b']},
+        {'summary': '', 'n': 3, 'spam': True, 'tags': ['b', 'c']},
+        {'summary': 'last part', 'n': 1, 'spam': False, 'tags': []},
+    ])
+    assert combined == {'summary': 'first part\n\nlast part', 'n': 6, 'spam': True, 'tags': ['a', 'b', 'c']}
+
+
+def test_long_rows_are_mapped_and_merged(make_scientist, server):
+    sc = make_scientist()
+    sc.set_chunking(1000, 100)
+    result = sc.analyze_dataframe(reviews(), 'Summarize the review.', input_fields=['title', 'text'],
+                                  output_fields=OUTPUT_FIELDS)
+
+    chunks = sc.stats.snapshot()['chunks']
+    assert sc.stats.snapshot()['rows_chunked'] == 1 and chunks > 1
+    # A request per chunk and one to merge their results, and one for the short row
+    assert server.config.requests == chunks + 2
+    assert result[list(OUTPUT_FIELDS)].notna().all().all()
+
+
+def test_long_rows_are_reduced_by_field(make_scientist, server):
+    sc = make_scientist()
+    sc.set_chunking(1000, 100, reduce={'n': 'sum'})
+    result = sc.analyze_dataframe(reviews(), 'Summarize the review.', input_fields=['title', 'text'],
+                                  output_fields=OUTPUT_FIELDS)
+
+    chunks = sc.stats.snapshot()['chunks']
+    assert server.config.requests == chunks + 1
+    # Every chunk counts at least 1, and the summaries of the chunks are joined
+    assert result.loc[0, 'n'] >= chunks
+    assert result.loc[0, 'summary'].count('\n\n') == chunks - 1
+
+
+def test_merge_requests_have_no_examples(make_scientist, server):
+    sc = make_scientist()
+    sc.set_chunking(1000, 100)
+    data = reviews()
+    data['summary'] = ['', 'short and sweet']
+    sc.analyze_dataframe(data, 'Summarize the review.', input_fields=['title', 'text'], output_fields=['summary'],
+                         rows=[0], examples=[1])
+
+    merges = [messages for messages in server.config.messages if MERGE_PROMPT in messages[-1]['content']]
+    chunks = [messages for messages in server.config.messages if MERGE_PROMPT not in messages[-1]['content']]
+    assert len(merges) == 1 and len(chunks) > 1
+    assert all(any(message['role'] == 'assistant' for message in messages) for messages in chunks)
+    assert not any(message['role'] == 'assistant' for message in merges[0])
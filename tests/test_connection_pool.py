@@ -0,0 +1,36 @@
+"""Sharing a connection pool between jobs of different sizes."""
+
+import asyncio
+import pandas as pd
+import pytest
+from fake_openai import StubConfig
+
+
+@pytest.fixture
+def stub_config():
+    return StubConfig(latency='fixed:0.01')
+
+
+def test_concurrent_jobs_of_different_sizes_share_a_pool(make_scientist):
+    data = pd.DataFrame({'review': [f'review number {k}' for k in range(200)]})
+    small, large = make_scientist(), make_scientist()
+    for sc, parallel_rows in ((small, 5), (large, 50)):
+        sc.set_parallel_rows(parallel_rows)
+        sc.set_num_retries(1)  # Any failed request fails its row
+    large.share_connection_pool(small)
+
+    async def run():
+        async def start_large():
+            await asyncio.sleep(0.1)  # Once the small job is running
+            return await large.analyze_dataframe_async(data, 'Summarize the review.', input_fields=['review'],
+                                                       output_fields=['summary'])
+
+        return await asyncio.wait_for(asyncio.gather(
+            small.analyze_dataframe_async(data, 'Summarize the review.', input_fields=['review'], output_fields=['summary']),
+            start_large()), timeout=60)
+
+    results = asyncio.run(run())
+
+    assert small.stats.errors == 0 and large.stats.errors == 0
+    for result in results:
+        assert result['summary'].ne('').all()
@@ -0,0 +1,29 @@
+"""Sending rows with identical inputs to the model once, and writing the response to all of them."""
+
+import pandas as pd
+
+
+def test_duplicates_get_the_response_of_their_first_row(make_scientist, server, tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': [f'review number {k % 7}' for k in range(60)], 'id': range(60)}).to_csv(path, index=False)
+    sc = make_scientist()
+    sc.set_deduplicate(True)
+    sc.analyze_csv(str(path), 'Summarize the review.', input_fields=['review'], output_fields=['summary', 'mood'])
+
+    result = pd.read_csv(path, dtype=str, na_filter=False)
+    assert server.config.requests == 7
+    assert sc.stats.duplicates_skipped == 53
+    assert (result['summary'] != '').all()
+    for field in ('summary', 'mood'):
+        assert (result[field] == result.groupby('review')[field].transform('first')).all()
+
+
+def test_rows_that_differ_in_other_fields_are_not_duplicates(make_scientist, server, tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': ['same text'] * 4, 'product': ['a', 'b', 'a', 'b']}).to_csv(path, index=False)
+    sc = make_scientist()
+    sc.set_deduplicate(True)
+    sc.analyze_csv(str(path), 'Summarize the review.', input_fields=['review', 'product'], output_fields=['summary'])
+
+    assert server.config.requests == 2
+    assert sc.stats.duplicates_skipped == 2
@@ -0,0 +1,68 @@
+"""Distributed processing of CSV files with worker processes."""
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def reviews(tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': [f'review number {k}' for k in range(60)]}).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def scientist(make_scientist):
+    sc = make_scientist()
+    sc.set_parallel_rows(2)  # Batches of 20 rows
+    return sc
+
+
+def test_invalid_job_fails_before_starting_workers(scientist, server, reviews):
+    with pytest.raises(ValueError, match='typo'):
+        scientist.analyze_csv_distributed(reviews, 'Summarize the review.', input_fields=['typo'], num_processes=1)
+    assert server.config.requests == 0
+
+
+def test_similarity_queries_are_embedded_once_per_worker(scientist, server, reviews):
+    scientist.analyze_csv_distributed(reviews, similarity_queries=['great product', 'late delivery'],
+                                      input_fields=['review'], output_fields=['similarity'], num_processes=1)
+
+    result = pd.read_csv(reviews)
+    assert result['similarity'].notna().all()
+    # One request per row, and one per query for all three batches
+    assert server.config.models[('/embeddings', 'text-embedding-3-small')] == 60 + 2
+
+
+def test_budget_stops_workers_and_rerun_resumes(scientist, reviews):
+    scientist.set_budget(max_tokens=1000)
+    scientist.analyze_csv_distributed(reviews, 'Summarize the review.', input_fields=['review'],
+                                      output_fields=['summary'], num_processes=2)
+
+    unprocessed = scientist.stats.unprocessed_rows
+    result = pd.read_csv(reviews, dtype=str, na_filter=False)
+    assert 0 < len(unprocessed) < 60
+    assert result.index[result['summary'] == ''].tolist() == unprocessed
+    assert scientist.stats.input_tokens + scientist.stats.output_tokens <= 1000 * 1.1
+
+    scientist.set_budget()
+    scientist.analyze_csv_distributed(reviews, 'Summarize the review.', input_fields=['review'],
+                                      output_fields=['summary'], num_processes=2)
+    result = pd.read_csv(reviews, dtype=str, na_filter=False)
+    assert scientist.stats.rows_processed == len(unprocessed)
+    assert scientist.stats.rows_skipped == 60 - len(unprocessed)
+    assert (result['summary'] != '').all()
+
+
+def test_duplicates_are_queued_once(scientist, server, tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': [f'review number {k % 7}' for k in range(60)]}).to_csv(path, index=False)
+    scientist.set_deduplicate(True)
+    scientist.analyze_csv_distributed(str(path), 'Summarize the review.', input_fields=['review'],
+                                      output_fields=['summary'], num_processes=2)
+
+    result = pd.read_csv(path, dtype=str, na_filter=False)
+    assert server.config.requests == 7
+    assert scientist.stats.duplicates_skipped == 53
+    assert (result['summary'] == result.groupby('review')['summary'].transform('first')).all()
+    assert (result['summary'] != '').all()
@@ -0,0 +1,44 @@
+"""Choosing the few-shot examples most similar to every row."""
+
+import pandas as pd
+import pytest
+from fake_openai import StubConfig
+
+TOPICS = ['late delivery', 'broken screen', 'great battery', 'wrong color', 'rude support']
+
+
+@pytest.fixture
+def stub_config():
+    return StubConfig(keep_messages=True)
+
+
+def reviews() -> pd.DataFrame:
+    """Five example rows, and five rows to analyze with the same texts in reverse order."""
+    return pd.DataFrame({'review': TOPICS + TOPICS[::-1], 'topic': TOPICS + [''] * 5})
+
+
+def examples_sent(server) -> list[list[str]]:
+    """The inputs of the examples sent with every request, followed by the input of the request."""
+    return [[message['content'] for message in messages if message['role'] == 'user'] for messages in server.config.messages]
+
+
+def test_rows_get_their_most_similar_examples(make_scientist, server):
+    sc = make_scientist()
+    sc.set_example_selection(1)
+    result = sc.analyze_dataframe(reviews(), 'What is the review about?', input_fields=['review'],
+                                  output_fields=['topic'], examples=range(5))
+
+    assert (result['topic'] != '').all()
+    requests = examples_sent(server)
+    assert len(requests) == 5
+    for *examples, request in requests:
+        assert examples == [request]
+
+
+def test_examples_fit_in_the_token_budget(make_scientist, server):
+    sc = make_scientist()
+    sc.set_example_selection(3, max_tokens=1)
+    sc.analyze_dataframe(reviews(), 'What is the review about?', input_fields=['review'], output_fields=['topic'],
+                         examples=range(5))
+
+    assert all(len(inputs) == 1 for inputs in examples_sent(server))
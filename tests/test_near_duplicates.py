@@ -0,0 +1,43 @@
+"""Labels of the rows that near-duplicates inherit their responses from."""
+
+import pandas as pd
+import pytest
+
+TEXTS = ['the parcel arrived late and the box was damaged', 'great product, works exactly as described']
+
+
+@pytest.fixture
+def scientist(make_scientist):
+    sc = make_scientist()
+    sc.set_near_duplicates(0.8)
+    return sc
+
+
+def test_dataframe_rows_inherit_index_labels(scientist):
+    data = pd.DataFrame({'review': [TEXTS[0], TEXTS[1], TEXTS[0] + '!', TEXTS[1].upper()]}, index=['a', 'b', 'c', 'd'])
+    result = scientist.analyze_dataframe(data, 'Summarize the review.', input_fields=['review'],
+                                         output_fields=['summary'], rows=[1, 2, 3])
+
+    # Row 'a' is not processed, so 'c' is the first of its cluster
+    assert result.loc[['b', 'c', 'd'], 'gpt_inherited_from'].tolist() == ['', '', 'b']
+
+
+def test_csv_rows_inherit_line_numbers(scientist, tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': [TEXTS[0], TEXTS[1], TEXTS[0] + '!']}).to_csv(path, index=False)
+    scientist.analyze_csv(str(path), 'Summarize the review.', input_fields=['review'], output_fields=['summary'])
+
+    result = pd.read_csv(path, dtype=str, na_filter=False)
+    assert result['gpt_inherited_from'].tolist() == ['', '', '2']
+
+
+def test_distributed_rows_inherit_line_numbers(scientist, tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': [TEXTS[0], TEXTS[1], TEXTS[0] + '!', TEXTS[1].upper()]}).to_csv(path, index=False)
+    scientist.analyze_csv_distributed(str(path), 'Summarize the review.', input_fields=['review'],
+                                      output_fields=['summary'], num_processes=1)
+
+    result = pd.read_csv(path, dtype=str, na_filter=False)
+    assert result['gpt_inherited_from'].tolist() == ['', '', '2', '3']
+    assert result['summary'].tolist()[2:] == result['summary'].tolist()[:2]
+    assert scientist.stats.rows_inherited == 2
@@ -0,0 +1,41 @@
+"""Typed output fields: declaration, and storage in typed columns of the file."""
+
+from typing import Literal
+import pandas as pd
+import pytest
+from gpt_scientist.llm.schema import normalize_output_fields
+
+OUTPUT_FIELDS = {'summary': str, 'score': int, 'confidence': float, 'spam': bool, 'tags': list[str],
+                 'mood': Literal['happy', 'angry']}
+
+
+def test_output_types_are_normalized():
+    fields, types = normalize_output_fields(OUTPUT_FIELDS)
+    assert fields == list(OUTPUT_FIELDS)
+    assert types == {'score': 'int', 'confidence': 'float', 'spam': 'bool', 'tags': 'list[str]', 'mood': ('happy', 'angry')}
+    with pytest.raises(ValueError, match='Unsupported'):
+        normalize_output_fields({'when': object})
+
+
+def test_typed_results_round_trip_through_a_file(make_scientist, tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'review': [f'review number {k}' for k in range(20)]}).to_csv(path, index=False)
+    sc = make_scientist()
+    sc.analyze_csv(str(path), 'Describe the review.', input_fields=['review'], output_fields=OUTPUT_FIELDS, rows=range(10))
+
+    result = pd.read_csv(path, dtype=str, na_filter=False)
+    done, empty = result.iloc[:10], result.iloc[10:]
+    assert done['score'].astype(int).between(1, 5).all()
+    assert done['confidence'].astype(float).between(0, 1).all()
+    assert done['spam'].isin(['True', 'False']).all()
+    assert done['mood'].isin(['happy', 'angry']).all()
+    assert (empty[list(OUTPUT_FIELDS)] == '').all().all()
+
+    # The typed columns of the file are read back, so that filled rows are skipped and the rest are filled in
+    sc.analyze_csv(str(path), 'Describe the review.', input_fields=['review'], output_fields=OUTPUT_FIELDS)
+    again = pd.read_csv(path, dtype=str, na_filter=False)
+    assert sc.stats.rows_processed == 10
+    exact = [column for column in done.columns if column != 'confidence']
+    assert again.iloc[:10][exact].equals(done[exact])
+    assert again.iloc[:10]['confidence'].astype(float).tolist() == pytest.approx(done['confidence'].astype(float).tolist())
+    assert again['score'].astype(int).between(1, 5).all()
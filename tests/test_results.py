@@ -0,0 +1,40 @@
+"""Applying buffered results to typed columns."""
+
+import pandas as pd
+from gpt_scientist.processors.core import prepare_output_fields
+from gpt_scientist.processors.results import ResultBatch
+
+TYPES = {'score': 'int', 'confidence': 'float', 'spam': 'bool', 'tags': 'list[str]', 'mood': ('happy', 'angry')}
+
+
+def test_apply_keeps_column_types():
+    data = pd.DataFrame({'review': ['a', 'b', 'c', 'd']})
+    fields = ['summary'] + list(TYPES)
+    prepare_output_fields(data, fields, TYPES)
+    dtypes = data.dtypes.copy()
+
+    batch = ResultBatch(fields)
+    batch.add(3, {'summary': 'late', 'score': 2, 'confidence': 0.5, 'spam': False, 'tags': ['delivery', 'box'], 'mood': 'angry'})
+    batch.add(1, {'summary': 'great', 'score': 5, 'confidence': 0.25, 'spam': True, 'tags': [], 'mood': 'happy'})
+    batch.sort()
+    batch.apply(data)
+
+    assert data.dtypes.equals(dtypes)
+    assert data['summary'].tolist() == ['', 'great', '', 'late']
+    assert data['score'].tolist() == [pd.NA, 5, pd.NA, 2]
+    assert data['confidence'].tolist() == [pd.NA, 0.25, pd.NA, 0.5]
+    assert data['spam'].tolist() == [pd.NA, True, pd.NA, False]
+    assert data['tags'].tolist()[1::2] == [[], ['delivery', 'box']]
+    assert data['mood'].tolist()[1::2] == ['happy', 'angry']
+    for field in ('tags', 'mood'):
+        assert data[field].isna().tolist() == [True, False, True, False]
+
+
+def test_records_and_frame_follow_the_rows():
+    batch = ResultBatch(['summary', 'score'])
+    batch.add(5, {'summary': 'x', 'score': 1, 'extra': 'ignored'})
+    batch.add(2, {'summary': 'y', 'score': 3})
+    batch.sort()
+
+    assert list(batch.records()) == [(2, {'summary': 'y', 'score': 3}), (5, {'summary': 'x', 'score': 1})]
+    assert batch.to_frame().to_dict('index') == {2: {'summary': 'y', 'score': 3}, 5: {'summary': 'x', 'score': 1}}
@@ -0,0 +1,40 @@
+"""Routing requests over endpoints that replace the model of the job."""
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def scientist(make_scientist, server):
+    sc = make_scientist()
+    sc.set_num_retries(3)
+    sc.add_endpoint(base_url=server.base_url, api_key='stub', model='local-llama', name='local')
+    return sc
+
+
+def reviews(n: int) -> pd.DataFrame:
+    return pd.DataFrame({'review': [f'review number {k}' for k in range(n)]})
+
+
+def test_endpoint_model_replaces_main_model_only(scientist, server, caplog):
+    # The stub returns no log-probabilities, so every response of the cascade model is escalated
+    scientist.set_cascade(['gpt-4.1-nano'], min_logprob=-0.3)
+    result = scientist.analyze_dataframe(reviews(20), 'Rate the review.', input_fields=['review'],
+                                         output_fields=['score'])
+
+    models = server.config.models
+    assert models[('/chat/completions', 'gpt-4.1-nano')] == 20
+    assert models[('/chat/completions', 'local-llama')] == 20
+    assert models[('/chat/completions', 'gpt-4o-mini')] == 0
+    assert result['score'].notna().all()
+    assert sum('no log-probabilities' in record.message for record in caplog.records) == 1
+
+
+def test_embeddings_keep_their_model(scientist, server):
+    result = scientist.analyze_dataframe(reviews(10), similarity_queries=['great product'], input_fields=['review'],
+                                         output_fields=['similarity'])
+
+    models = server.config.models
+    assert models[('/embeddings', 'text-embedding-3-small')] > 0
+    assert not any(model == 'local-llama' for _, model in models)
+    assert result['similarity'].notna().all()
@@ -0,0 +1,51 @@
+"""Order in which rows are processed."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from fake_openai import StubConfig
+from gpt_scientist.processors.scheduling import schedule_rows
+
+# Sizes of the rows: 5, 40, 10, 300, 20, 35
+DATA = pd.DataFrame({'text': ['x' * 5, 'x' * 40, 'x' * 10, 'x' * 300, 'x' * 20, 'x' * 35], 'title': [''] * 6})
+ROWS = np.arange(6)
+
+
+@pytest.mark.parametrize('schedule, order', [
+    ('index', [0, 1, 2, 3, 4, 5]),
+    ('longest_first', [3, 1, 5, 4, 2, 0]),
+    # Buckets of sizes within a factor of 2: [256, 512), [32, 64), [16, 32), [8, 16), [4, 8)
+    ('bucketed', [3, 1, 5, 4, 2, 0]),
+    ('interleaved', [3, 0, 1, 2, 5, 4]),
+])
+def test_schedules(schedule, order):
+    assert schedule_rows(DATA, ROWS, ['text', 'title'], schedule).tolist() == order
+
+
+def test_bucketed_keeps_index_order_within_a_bucket():
+    data = pd.DataFrame({'text': ['x' * 33, 'x' * 2, 'x' * 60, 'x' * 40]})
+    assert schedule_rows(data, np.arange(4), ['text'], 'bucketed').tolist() == [0, 2, 3, 1]
+
+
+def test_only_selected_rows_are_scheduled():
+    assert schedule_rows(DATA, np.array([0, 3, 4]), ['text'], 'longest_first').tolist() == [3, 4, 0]
+
+
+def test_unknown_schedule():
+    with pytest.raises(ValueError, match='Unknown schedule'):
+        schedule_rows(DATA, ROWS, ['text'], 'shortest_first')
+
+
+@pytest.fixture
+def stub_config():
+    return StubConfig(keep_messages=True)
+
+
+def test_job_sends_rows_in_schedule_order(make_scientist, server):
+    sc = make_scientist()
+    sc.set_parallel_rows(1)
+    sc.set_schedule('longest_first')
+    sc.analyze_dataframe(DATA, 'Summarize the text.', input_fields=['text'], output_fields=['summary'])
+
+    sizes = [messages[-1]['content'].count('x') for messages in server.config.messages]
+    assert sizes == sorted(sizes, reverse=True)
@@ -0,0 +1,51 @@
+"""Checking streamed completions as they arrive, and abandoning those that cannot be valid."""
+
+import pandas as pd
+import pytest
+from fake_openai import StubConfig
+from pydantic import TypeAdapter
+from gpt_scientist.llm.streaming import ResponseCheck
+
+
+def check() -> ResponseCheck:
+    return ResponseCheck(['score', 'summary'], {'score': TypeAdapter(int)})
+
+
+def test_fields_are_parsed_as_soon_as_they_are_complete():
+    response = check()
+    assert response.feed('{"score": "4", "sum')
+    assert response.fields == {'score': 4}
+    assert response.feed('mary": "fine, \\"really\\"", "extra": [1, {"a": 2}]}')
+    assert response.done and response.error is None
+    assert response.fields == {'score': 4, 'summary': 'fine, "really"'}
+
+
+@pytest.mark.parametrize('text, error', [
+    ('Sure! Let me think', 'not a JSON object'),
+    ('{"score": "many", ', 'wrong type'),
+    ('{"score": 4] ', 'not valid JSON'),
+    ('{"score": 4}', 'missing fields'),
+    ('{"score": 4, "summary": "ok"} and more', 'more text'),
+])
+def test_invalid_responses_fail_early(text, error):
+    response = check()
+    assert not response.feed(text)
+    assert error in response.error
+
+
+@pytest.fixture
+def stub_config():
+    return StubConfig(invalid_rate=1.0, completion_tokens=200)
+
+
+def test_invalid_streams_are_abandoned(make_scientist):
+    sc = make_scientist()
+    sc.set_streaming(True)
+    sc.set_num_retries(2)
+    data = pd.DataFrame({'review': [f'review number {k}' for k in range(5)]})
+    result = sc.analyze_dataframe(data, 'Rate the review.', input_fields=['review'], output_fields={'score': int})
+
+    assert result['score'].isna().all()
+    assert sc.stats.streams_aborted == 5 * 2
+    # Without streaming, every completion would be read to the end (200 tokens)
+    assert sc.stats.output_tokens < 5 * 2 * 200 / 10
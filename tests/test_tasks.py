@@ -0,0 +1,55 @@
+"""Analyzing a dataset with several prompts in one pass."""
+
+import pandas as pd
+import pytest
+from fake_openai import StubConfig
+
+TASKS = [
+    {'prompt': 'What is the sentiment of the review?', 'input_fields': ['review'], 'output_fields': ['sentiment']},
+    {'name': 'topic', 'prompt': 'What is the review about?', 'input_fields': ['review', 'product'],
+     'output_fields': {'topic': str, 'score': int}},
+    {'prompt': 'What language is the product name in?', 'input_fields': ['product'], 'output_fields': ['lang']},
+]
+
+
+@pytest.fixture
+def stub_config():
+    return StubConfig(keep_messages=True)
+
+
+def reviews(n: int) -> pd.DataFrame:
+    return pd.DataFrame({'review': [f'review number {k}' for k in range(n)], 'product': [f'product {k % 3}' for k in range(n)]})
+
+
+def test_every_task_fills_its_output_fields(make_scientist, server):
+    sc = make_scientist()
+    result = sc.analyze_dataframe_tasks(reviews(10), TASKS)
+
+    assert list(result.columns) == ['review', 'product', 'sentiment', 'topic', 'score', 'lang']
+    assert str(result['score'].dtype) == 'Int64'
+    assert (result[['sentiment', 'topic', 'lang']] != '').all().all() and result['score'].notna().all()
+    assert server.config.requests == 10 * 3
+    assert {name: stats.rows_processed for name, stats in sc.stats.tasks.items()} == {'sentiment': 10, 'topic': 10, 'lang': 10}
+    # Every task is sent its own prompt and input fields only
+    lang_requests = [messages[-1]['content'] for messages in server.config.messages if 'language' in messages[-1]['content']]
+    assert len(lang_requests) == 10
+    assert not any('review number' in content for content in lang_requests)
+
+
+def test_tasks_skip_rows_they_already_filled(make_scientist, server):
+    data = reviews(10)
+    data['sentiment'] = ['positive'] * 4 + [''] * 6
+    sc = make_scientist()
+    result = sc.analyze_dataframe_tasks(data, TASKS)
+
+    assert result['sentiment'].tolist()[:4] == ['positive'] * 4
+    assert sc.stats.tasks['sentiment'].rows_processed == 6
+    assert server.config.requests == 6 + 10 + 10
+
+
+def test_tasks_need_their_own_output_fields(make_scientist):
+    sc = make_scientist()
+    with pytest.raises(ValueError, match='several tasks'):
+        sc.analyze_dataframe_tasks(reviews(3), [TASKS[0], {**TASKS[2], 'name': 'lang', 'output_fields': ['sentiment']}])
+    with pytest.raises(ValueError, match='Unknown task settings'):
+        sc.analyze_dataframe_tasks(reviews(3), [{**TASKS[0], 'chunking': True}])